@@ -3,6 +3,7 @@
 from flask import Flask
 from config import UPLOAD_FOLDER, UPLOAD_SUBDIRS
 import os
+import time
 from app.extensions import db, socketio, login_manager
 import secrets
 
@@ -137,6 +138,14 @@ def create_app(config=None, init_db=True):
     socketio.init_app(flask_app)
     login_manager.init_app(flask_app)
 
+    # Optional per-request SQL metrics (BOXCHAT_SQL_METRICS=1)
+    from app.utils.sql_metrics import install_sql_metrics
+    install_sql_metrics(flask_app)
+
+    # Optional single-writer queue for SQLite (BOXCHAT_WRITE_QUEUE=1)
+    from app.utils.write_queue import install_write_queue
+    install_write_queue(flask_app)
+
     # Return JSON 401 for XHR/API requests when not authenticated
     from flask import request, jsonify, redirect, url_for
 
@@ -232,10 +241,12 @@ def _init_database(flask_app):
         Role, MemberRole, RoleMentionPermission, Friendship, FriendRequest
     )
     from app.functions import seed_roles_for_existing_rooms
-    from app.migrations import migrate
+    from app.migrations import migrate, roles_seeded, mark_roles_seeded
     
     db_file = 'thecomboxmsgr.db'
     db_exists = os.path.exists(db_file)
+    timings = []
+    started = time.perf_counter()
     
     try:
         if not db_exists:
@@ -243,6 +254,7 @@ def _init_database(flask_app):
         db.create_all()
         if not db_exists:
             print("База данных успешно создана!")
+        timings.append(('create_all', time.perf_counter() - started))
     except Exception as e:
         print(f"Ошибка при создании таблиц БД: {e}")
         import traceback
@@ -250,14 +262,32 @@ def _init_database(flask_app):
         return
 
     # Update schema (migrations)
+    schema_version = None
     try:
-        migrate(db.engine)
+        step_started = time.perf_counter()
+        _previous_version, schema_version = migrate(db.engine)
+        timings.append(('migrate', time.perf_counter() - step_started))
 
-        # Ensure default role system data exists for all rooms
-        try:
-            seed_roles_for_existing_rooms()
-        except Exception:
-            pass
+        # Default role data for all rooms: set-based backfill, once per schema
+        # version (rooms created later get their roles when they are created).
+        # schema_migrations.roles_seeded is only set after it committed, so a
+        # failed backfill runs again on the next start.
+        with db.engine.connect() as conn:
+            seeded = roles_seeded(conn, schema_version)
+        if not seeded or _seed_roles_on_boot():
+            step_started = time.perf_counter()
+            try:
+                seed_roles_for_existing_rooms()
+                with db.engine.begin() as conn:
+                    mark_roles_seeded(conn, schema_version)
+            except Exception as e:
+                db.session.rollback()
+                print(f"[STARTUP] role seeding failed: {e}")
+            timings.append(('seed roles', time.perf_counter() - step_started))
+        else:
+            timings.append(('seed roles', None))
+
+        step_started = time.perf_counter()
 
         # Update message table
         if 'message' in inspect(db.engine).get_table_names():
@@ -311,12 +341,25 @@ def _init_database(flask_app):
                         conn.commit()
                 except:
                     pass
+        timings.append(('schema checks', time.perf_counter() - step_started))
     
     except Exception as e:
         print(f"Ошибка при обновлении схемы БД: {e}")
         import traceback
         traceback.print_exc()
 
+    report = ', '.join(
+        f'{name} {seconds * 1000:.0f} ms' if seconds is not None else f'{name} skipped'
+        for name, seconds in timings
+    )
+    print(f"[STARTUP] database ready in {(time.perf_counter() - started) * 1000:.0f} ms"
+          f" (schema v{schema_version}): {report}")
+
+
+def _seed_roles_on_boot() -> bool:
+    # Force the role backfill on every boot (it normally runs once per schema version).
+    return str(os.environ.get('BOXCHAT_SEED_ROLES_ON_BOOT', '') or '').strip().lower() in {'1', 'true', 'yes', 'on'}
+
 
 def _setup_admin_user():
     # Create admin user if it doesn't exist.
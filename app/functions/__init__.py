@@ -1,19 +1,95 @@
 # Functions package
 
 from app.functions.files import (
-    allowed_file, is_image_file, is_music_file, is_video_file,
+    allowed_file, is_image_file, is_music_file, is_video_file, upload_target,
     save_uploaded_file, resize_image
 )
+from app.functions.blobs import (
+    parse_blob_url, blob_path_for_url, store_upload_stream, acquire_upload_url, release_upload_url,
+    release_upload_urls, count_url_references
+)
+from app.functions.attachments import (
+    add_message_attachments, add_music_attachment, prune_attachments, rebuild_attachment_index,
+    can_access_upload, forget_upload_access, get_upload_acl_cache_stats
+)
+from app.functions.media_urls import (
+    sign_media_url, verify_media_signature, add_signed_media_urls
+)
+from app.functions.media_delivery import (
+    send_upload, blob_etag, media_delivery_mode
+)
+from app.functions.image_variants import (
+    run_image_job, schedule_image_variants, pick_image_variant, generate_image_variants
+)
 from app.functions.roles import (
     normalize_role_tag, ensure_default_roles, ensure_user_default_roles,
     seed_roles_for_existing_rooms, get_user_role_ids, can_user_mention_role,
-    ROLE_PERMISSION_KEYS, parse_role_permissions, get_user_permissions, user_has_room_permission
+    ROLE_PERMISSION_KEYS, parse_role_permissions, get_user_permissions, user_has_room_permission,
+    PermissionContext, get_permission_context, invalidate_permission_context,
+    invalidate_room_permission_contexts, clear_permission_cache
+)
+from app.functions.mentions import get_room_mention_index, get_role_member_ids, clear_mention_indexes
+from app.functions.reactions import (
+    get_reaction_summaries, get_reaction_summary, count_emoji_reactions, list_message_reactors
+)
+from app.functions.message_cache import (
+    serialize_history_message, get_channel_tail_page, tail_message_added, tail_message_edited,
+    tail_reactions_changed, tail_user_profile_changed, drop_channel_tail, drop_channel_tails,
+    clear_tail_cache, get_tail_cache_stats
+)
+from app.functions.changes import (
+    record_channel_change, record_channel_changes, record_bulk_message_deletes, record_bulk_reaction_removals,
+    get_channel_change_seq, purge_channel_changes, collect_channel_changes, get_emoji_counts
+)
+from app.functions.search import fts_available, build_fts_query, parse_search_cursor, search_messages
+from app.functions.unread import (
+    bump_unread_counters, bump_unread_counters_batch, reset_unread_counter, unread_message_deleted,
+    recount_unread_counters, clear_unread_counters, forget_room_unread_counters, get_unread_counts,
+    get_channel_unread_counts
+)
+from app.functions.room_list import serialize_user_rooms
+from app.functions.member_list import (
+    get_room_member_list, member_list_snapshot, with_member_list, search_room_members, clear_member_lists
+)
+from app.functions.uploads import (
+    create_upload_session, get_upload_session, upload_progress, append_upload_chunk, finalize_upload,
+    abort_upload, expire_upload_sessions
+)
+from app.functions.membership import (
+    member_joined, member_left, member_role_changed, role_changed, user_renamed, user_avatar_changed,
+    room_deleted
 )
 
 __all__ = [
-    'allowed_file', 'is_image_file', 'is_music_file', 'is_video_file',
+    'allowed_file', 'is_image_file', 'is_music_file', 'is_video_file', 'upload_target',
     'save_uploaded_file', 'resize_image',
+    'parse_blob_url', 'blob_path_for_url', 'store_upload_stream', 'acquire_upload_url', 'release_upload_url',
+    'release_upload_urls', 'count_url_references',
+    'add_message_attachments', 'add_music_attachment', 'prune_attachments', 'rebuild_attachment_index',
+    'can_access_upload', 'forget_upload_access', 'get_upload_acl_cache_stats',
+    'sign_media_url', 'verify_media_signature', 'add_signed_media_urls',
+    'send_upload', 'blob_etag', 'media_delivery_mode',
+    'run_image_job', 'schedule_image_variants', 'pick_image_variant', 'generate_image_variants',
     'normalize_role_tag', 'ensure_default_roles', 'ensure_user_default_roles',
     'seed_roles_for_existing_rooms', 'get_user_role_ids', 'can_user_mention_role',
-    'ROLE_PERMISSION_KEYS', 'parse_role_permissions', 'get_user_permissions', 'user_has_room_permission'
+    'ROLE_PERMISSION_KEYS', 'parse_role_permissions', 'get_user_permissions', 'user_has_room_permission',
+    'PermissionContext', 'get_permission_context', 'invalidate_permission_context',
+    'invalidate_room_permission_contexts', 'clear_permission_cache',
+    'get_room_mention_index', 'get_role_member_ids', 'clear_mention_indexes',
+    'get_reaction_summaries', 'get_reaction_summary', 'count_emoji_reactions', 'list_message_reactors',
+    'serialize_history_message', 'get_channel_tail_page', 'tail_message_added', 'tail_message_edited',
+    'tail_reactions_changed', 'tail_user_profile_changed', 'drop_channel_tail', 'drop_channel_tails',
+    'clear_tail_cache', 'get_tail_cache_stats',
+    'record_channel_change', 'record_channel_changes', 'record_bulk_message_deletes', 'record_bulk_reaction_removals',
+    'get_channel_change_seq', 'purge_channel_changes', 'collect_channel_changes', 'get_emoji_counts',
+    'fts_available', 'build_fts_query', 'parse_search_cursor', 'search_messages',
+    'bump_unread_counters', 'bump_unread_counters_batch', 'reset_unread_counter', 'unread_message_deleted',
+    'recount_unread_counters', 'clear_unread_counters', 'forget_room_unread_counters', 'get_unread_counts',
+    'get_channel_unread_counts',
+    'serialize_user_rooms',
+    'get_room_member_list', 'member_list_snapshot', 'with_member_list', 'search_room_members', 'clear_member_lists',
+    'create_upload_session', 'get_upload_session', 'upload_progress', 'append_upload_chunk', 'finalize_upload',
+    'abort_upload', 'expire_upload_sessions',
+    'member_joined', 'member_left', 'member_role_changed', 'role_changed', 'user_renamed', 'user_avatar_changed',
+    'room_deleted'
 ]
@@ -0,0 +1,173 @@
+# Access index for /uploads/files|videos|music
+#
+# An Attachment row says who may fetch an upload URL: the members of a room
+# where a message links it (room_id) or the owner of a music library track
+# (user_id). Rows are added in the transaction that creates the reference
+# (message writer, forward_message, add_music) and pruned after deletes once
+# nothing in that room / library links the URL any more. Authorization is one
+# lookup on the (file_url, room_id, user_id) key plus the member index instead
+# of a four-way join over Message/Channel/Room/Member.
+#
+# Allowed (user, URL) pairs are cached per user for
+# BOXCHAT_UPLOAD_ACL_CACHE_SECONDS, so a page full of media costs one query
+# per file and none on the next scroll. A user's entries are dropped when they
+# leave a room; a deleted message stops granting access after at most the TTL.
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import text
+from app.extensions import db
+
+_ALLOW_CACHE = OrderedDict()  # user_id -> {file_url: expires_at (monotonic)}, LRU order
+_ALLOW_CACHE_LOCK = threading.Lock()
+_MAX_URLS_PER_USER = 512
+
+
+def upload_acl_cache_seconds() -> float:
+    try:
+        return max(0.0, float(os.environ.get('BOXCHAT_UPLOAD_ACL_CACHE_SECONDS') or 60))
+    except Exception:
+        return 60.0
+
+
+def upload_acl_cache_users() -> int:
+    try:
+        return max(0, int(os.environ.get('BOXCHAT_UPLOAD_ACL_CACHE_USERS') or 10000))
+    except Exception:
+        return 10000
+
+
+def _is_local_upload(url) -> bool:
+    return bool(url) and str(url).startswith('/uploads/')
+
+
+def add_message_attachments(messages):
+    # messages: (file_url, channel_id) pairs; caller commits
+    for file_url, channel_id in {(url, int(cid)) for url, cid in messages if _is_local_upload(url)}:
+        db.session.execute(text("""
+            INSERT INTO attachment (file_url, room_id, user_id, created_at)
+            SELECT :file_url, c.room_id, 0, CURRENT_TIMESTAMP FROM channel c WHERE c.id = :channel_id
+            ON CONFLICT (file_url, room_id, user_id) DO NOTHING
+        """), {'file_url': str(file_url), 'channel_id': channel_id})
+
+
+def add_music_attachment(file_url, user_id):
+    # Caller commits
+    if not _is_local_upload(file_url):
+        return
+    db.session.execute(text("""
+        INSERT INTO attachment (file_url, room_id, user_id, created_at)
+        VALUES (:file_url, 0, :user_id, CURRENT_TIMESTAMP)
+        ON CONFLICT (file_url, room_id, user_id) DO NOTHING
+    """), {'file_url': str(file_url), 'user_id': int(user_id)})
+
+
+def prune_attachments(file_urls):
+    # Drop rows of these URLs whose room has no message linking them and
+    # whose owner has no music track with them any more (caller commits).
+    removed = 0
+    for file_url in {str(url) for url in file_urls if _is_local_upload(url)}:
+        removed += db.session.execute(text("""
+            DELETE FROM attachment
+            WHERE file_url = :file_url AND (
+                (room_id != 0 AND NOT EXISTS (
+                    SELECT 1 FROM message m JOIN channel c ON c.id = m.channel_id
+                    WHERE m.file_url = attachment.file_url AND c.room_id = attachment.room_id
+                ))
+                OR (user_id != 0 AND NOT EXISTS (
+                    SELECT 1 FROM user_music um
+                    WHERE um.file_url = attachment.file_url AND um.user_id = attachment.user_id
+                ))
+            )
+        """), {'file_url': file_url}).rowcount or 0
+    return removed
+
+
+def rebuild_attachment_index():
+    # Recreate every row from messages and music libraries (caller commits)
+    db.session.execute(text('DELETE FROM attachment'))
+    db.session.execute(text("""
+        INSERT OR IGNORE INTO attachment (file_url, room_id, user_id, created_at)
+        SELECT DISTINCT m.file_url, c.room_id, 0, CURRENT_TIMESTAMP
+        FROM message m JOIN channel c ON c.id = m.channel_id
+        WHERE m.file_url LIKE '/uploads/%'
+    """))
+    db.session.execute(text("""
+        INSERT OR IGNORE INTO attachment (file_url, room_id, user_id, created_at)
+        SELECT DISTINCT file_url, 0, user_id, CURRENT_TIMESTAMP
+        FROM user_music
+        WHERE file_url LIKE '/uploads/%'
+    """))
+
+
+def _cached_allow(user_id, file_url) -> bool:
+    with _ALLOW_CACHE_LOCK:
+        urls = _ALLOW_CACHE.get(user_id)
+        if not urls:
+            return False
+        expires_at = urls.get(file_url)
+        if expires_at is None:
+            return False
+        if expires_at <= time.monotonic():
+            urls.pop(file_url, None)
+            return False
+        _ALLOW_CACHE.move_to_end(user_id)
+        return True
+
+
+def _remember_allow(user_id, file_url):
+    ttl = upload_acl_cache_seconds()
+    max_users = upload_acl_cache_users()
+    if ttl <= 0 or max_users <= 0:
+        return
+    with _ALLOW_CACHE_LOCK:
+        urls = _ALLOW_CACHE.setdefault(user_id, {})
+        _ALLOW_CACHE.move_to_end(user_id)
+        if len(urls) >= _MAX_URLS_PER_USER:
+            now = time.monotonic()
+            for url in [url for url, expires_at in urls.items() if expires_at <= now] or list(urls)[:len(urls) // 2]:
+                urls.pop(url, None)
+        urls[file_url] = time.monotonic() + ttl
+        while len(_ALLOW_CACHE) > max_users:
+            _ALLOW_CACHE.popitem(last=False)
+
+
+def can_access_upload(user_id, file_url) -> bool:
+    # Member of a room that links the URL, or owner of the music track
+    user_id = int(user_id)
+    file_url = str(file_url)
+    if _cached_allow(user_id, file_url):
+        return True
+    allowed = db.session.execute(text("""
+        SELECT 1 FROM attachment a
+        WHERE a.file_url = :file_url AND (
+            a.user_id = :user_id
+            OR (a.room_id != 0 AND EXISTS (
+                SELECT 1 FROM member mb WHERE mb.room_id = a.room_id AND mb.user_id = :user_id
+            ))
+        )
+        LIMIT 1
+    """), {'file_url': file_url, 'user_id': user_id}).first() is not None
+    if allowed:
+        _remember_allow(user_id, file_url)
+    return allowed
+
+
+def forget_upload_access(user_id=None):
+    # Drop cached allows of one user (left / was removed from a room) or of everyone
+    with _ALLOW_CACHE_LOCK:
+        if user_id is None:
+            _ALLOW_CACHE.clear()
+        else:
+            _ALLOW_CACHE.pop(int(user_id), None)
+
+
+def get_upload_acl_cache_stats() -> dict:
+    with _ALLOW_CACHE_LOCK:
+        return {
+            'users': len(_ALLOW_CACHE),
+            'urls': sum(len(urls) for urls in _ALLOW_CACHE.values()),
+            'ttl_seconds': upload_acl_cache_seconds(),
+        }
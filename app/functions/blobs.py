@@ -0,0 +1,244 @@
+# Content-addressed upload storage
+#
+# Every upload is streamed to <upload folder>/.partial while its SHA-256 is
+# computed, then stored once per (subfolder, hash, extension) at
+# <subfolder>/<sha[:2]>/<sha256><ext>. It is handed out as
+# /uploads/<subfolder>/<sha256>/<name>: the name keeps the client's filename
+# (shown in chat, picks the MIME type) and /uploads/<path> maps the URL back to
+# the blob, so the same meme uploaded 500 times takes disk and page cache once.
+# Blobs never cross subfolders, so the per-subfolder /uploads access rules
+# stay as they are. Files stored before this (<subfolder>/<uuid>_<name>) are
+# still served as-is; tools/dedupe_uploads.py converts them.
+#
+# UploadBlob.ref_count counts handed-out URLs: +1 per stored upload and per
+# forwarded message, -1 when a message, music track or avatar lets go of one.
+# At 0 the references are recounted from the URL columns (a client may store
+# the same URL twice) and the file is only deleted when none are left.
+
+import hashlib
+import os
+import re
+import tempfile
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import and_, func
+from app.extensions import db
+from app.functions.image_variants import run_image_job, schedule_image_variants, remove_image_variants
+from app.models import UploadBlob, Message, UserMusic, User, Room, Channel, Sticker
+from app.utils.paths import safe_resolve_under
+from app.utils.write_queue import run_write
+
+PARTIAL_DIR = '.partial'
+_COPY_BLOCK = 64 * 1024
+BLOB_URL_RE = re.compile(r'^/uploads/(?P<subdir>[a-z_]+)/(?P<sha>[0-9a-f]{64})/(?P<name>[^/]+)$')
+
+# Columns that may hold /uploads URLs; a blob is in use while any of them point at it.
+REFERENCE_COLUMNS = (
+    Message.file_url,
+    UserMusic.file_url,
+    UserMusic.cover_url,
+    User.avatar_url,
+    Room.avatar_url,
+    Room.banner_url,
+    Channel.icon_image_url,
+    Sticker.file_url,
+)
+
+
+def parse_blob_url(url):
+    # (subdir, sha256, name) for a content-addressed URL, else None
+    match = BLOB_URL_RE.match(str(url or ''))
+    if not match:
+        return None
+    return match.group('subdir'), match.group('sha'), match.group('name')
+
+
+def blob_path(subdir, sha, name):
+    # Path of the blob relative to the upload folder
+    ext = os.path.splitext(str(name or ''))[1].lower()
+    return f"{subdir}/{sha[:2]}/{sha}{ext}"
+
+
+def blob_url(subdir, sha, name):
+    return f"/uploads/{subdir}/{sha}/{name}"
+
+
+def blob_path_for_url(url):
+    parsed = parse_blob_url(url)
+    return blob_path(*parsed) if parsed else None
+
+
+def hash_stream_to_partial(stream, upload_folder):
+    # Copy a stream to a temp file in small blocks; returns (temp path, sha256, size)
+    partial_dir = os.path.join(upload_folder, PARTIAL_DIR)
+    os.makedirs(partial_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=partial_dir, suffix='.part')
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as fh:
+            while True:
+                block = stream.read(_COPY_BLOCK)
+                if not block:
+                    break
+                hasher.update(block)
+                fh.write(block)
+                size += len(block)
+    except Exception:
+        _remove_quietly(tmp_path)
+        raise
+    return tmp_path, hasher.hexdigest(), size
+
+
+def hash_file(path):
+    # (sha256, size) of a file already on disk, read in small blocks
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, 'rb') as fh:
+        while True:
+            block = fh.read(_COPY_BLOCK)
+            if not block:
+                break
+            hasher.update(block)
+            size += len(block)
+    return hasher.hexdigest(), size
+
+
+def _add_blob_ref(path, sha, size):
+    blob = UploadBlob.query.filter_by(path=path).first()
+    if blob is None:
+        db.session.add(UploadBlob(path=path, sha256=sha, size=size, ref_count=1, created_at=datetime.utcnow()))
+        return True
+    blob.ref_count = int(blob.ref_count or 0) + 1
+    return False
+
+
+def store_blob(tmp_path, sha, size, subdir, name, upload_folder, keep_source_on_error=False):
+    # Register one reference to the content of tmp_path and move it into
+    # place unless an identical blob is already stored; returns its URL.
+    # keep_source_on_error leaves tmp_path alone when storing fails (a
+    # finished chunked upload that can be completed again).
+    path = blob_path(subdir, sha, name)
+    target = os.path.join(upload_folder, path)
+    try:
+        run_write(_add_blob_ref, path, sha, size)
+    except Exception:
+        # Lost a race inserting the same new blob: it exists now.
+        db.session.rollback()
+        try:
+            run_write(_add_blob_ref, path, sha, size)
+        except Exception:
+            if not keep_source_on_error:
+                _remove_quietly(tmp_path)
+            raise
+    if os.path.exists(target):
+        _remove_quietly(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+        schedule_image_variants(upload_folder, path)
+    return blob_url(subdir, sha, name)
+
+
+def store_upload_stream(stream, name, subdir, upload_folder, process=None):
+    # Hash-while-streaming store of an upload; `process(path)` may rewrite the
+    # temp file first (resize, crop; run on the image pool), the blob is keyed
+    # by the result.
+    tmp_path, sha, size = hash_stream_to_partial(stream, upload_folder)
+    if process is not None:
+        try:
+            run_image_job(process, tmp_path)
+            sha, size = hash_file(tmp_path)
+        except Exception:
+            _remove_quietly(tmp_path)
+            raise
+    return store_blob(tmp_path, sha, size, subdir, name, upload_folder)
+
+
+def _increment_blob_ref(path):
+    return UploadBlob.query.filter_by(path=path).update(
+        {'ref_count': UploadBlob.ref_count + 1}, synchronize_session=False
+    )
+
+
+def acquire_upload_url(url):
+    # One more reference to an existing URL (forwarded message); no-op for legacy URLs
+    path = blob_path_for_url(url)
+    if not path:
+        return False
+    return bool(run_write(_increment_blob_ref, path))
+
+
+def count_url_references(url):
+    # Rows whose URL column points at this file. For a blob any name of it
+    # counts; a range instead of LIKE keeps the message.file_url index usable.
+    parsed = parse_blob_url(url)
+    total = 0
+    for column in REFERENCE_COLUMNS:
+        if parsed:
+            prefix = f"/uploads/{parsed[0]}/{parsed[1]}/"
+            condition = and_(column >= prefix, column < prefix[:-1] + chr(ord('/') + 1))
+        else:
+            condition = column == url
+        total += int(db.session.query(func.count()).filter(condition).scalar() or 0)
+    return total
+
+
+def _release_blob_ref(path, url, count=1):
+    blob = UploadBlob.query.filter_by(path=path).first()
+    if blob is None:
+        return False
+    remaining = int(blob.ref_count or 0) - count
+    if remaining <= 0:
+        remaining = count_url_references(url)
+    if remaining > 0:
+        blob.ref_count = remaining
+        return False
+    db.session.delete(blob)
+    return True
+
+
+def release_upload_url(url, upload_folder, count=1):
+    # Drop `count` references to an /uploads URL after the rows holding it were
+    # changed or deleted. The file goes with its last reference; legacy
+    # (uuid-named) files when nothing points at the exact URL any more.
+    # Returns True when a file was removed.
+    url = str(url or '')
+    if not url.startswith('/uploads/'):
+        return False
+    path = blob_path_for_url(url)
+    if path is None:
+        target = safe_resolve_under(upload_folder, url[len('/uploads/'):])
+        if target is None or not target.is_file() or count_url_references(url):
+            return False
+        _remove_quietly(str(target))
+        return True
+
+    if not run_write(_release_blob_ref, path, url, count):
+        return False
+    # Uploaded again since the row was deleted: the new row owns the file.
+    if UploadBlob.query.filter_by(path=path).first() is not None:
+        return False
+    _remove_quietly(os.path.join(upload_folder, path))
+    remove_image_variants(upload_folder, path)
+    return True
+
+
+def release_upload_urls(urls, upload_folder):
+    # Best effort: a failed release only leaves a file for the sweep in
+    # tools/dedupe_uploads.py. A URL listed n times (n deleted rows) drops n refs.
+    removed = 0
+    for url, count in Counter(urls).items():
+        try:
+            removed += int(release_upload_url(url, upload_folder, count))
+        except Exception as e:
+            db.session.rollback()
+            print(f"[UPLOADS] releasing {url} failed: {e}")
+    return removed
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,183 @@
+# Per-channel change log
+#
+# Every message write appends a ChannelChange row in the SAME transaction as
+# the change itself, numbered with a gap-free sequence per channel. A client
+# that remembers the last `seq` it saw can ask `GET /api/v1/channel/<id>/changes`
+# for everything after it instead of refetching whole pages.
+#
+# Sequence numbers are MAX(seq)+1 read through the (channel_id, seq) unique
+# index. The change rows are flushed in a SAVEPOINT: when a concurrent writer
+# took the same seq, the constraint rejects only the savepoint and the rows are
+# renumbered from a fresh MAX, so the message write itself never fails on it.
+# (On SQLite the pending write flushed before the MAX read already holds the
+# write lock, so there the race cannot happen.)
+
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models import ChannelChange, Message, MessageReaction
+
+
+_SEQ_ATTEMPTS = 5
+
+
+def _next_seqs(channel_ids):
+    # channel_id -> next free seq (pending rows in the session are autoflushed first)
+    channel_ids = sorted({int(cid) for cid in channel_ids})
+    if not channel_ids:
+        return {}
+    rows = (
+        db.session.query(ChannelChange.channel_id, db.func.max(ChannelChange.seq))
+        .filter(ChannelChange.channel_id.in_(channel_ids))
+        .group_by(ChannelChange.channel_id)
+        .all()
+    )
+    current = {int(cid): int(seq or 0) for cid, seq in rows}
+    return {cid: current.get(cid, 0) + 1 for cid in channel_ids}
+
+
+def record_channel_changes(entries):
+    # entries: dicts with channel_id, kind, message_id[, user_id, emoji, delta].
+    # Adds rows to the current session (caller commits); returns their seqs in order.
+    entries = list(entries or [])
+    if not entries:
+        return []
+    for attempt in range(_SEQ_ATTEMPTS):
+        rows, seqs = _change_rows(entries, _next_seqs(e['channel_id'] for e in entries))
+        try:
+            with db.session.begin_nested():
+                db.session.add_all(rows)
+        except IntegrityError:
+            if attempt == _SEQ_ATTEMPTS - 1:
+                raise
+            continue
+        return seqs
+
+
+def _change_rows(entries, next_seq):
+    rows = []
+    seqs = []
+    for entry in entries:
+        channel_id = int(entry['channel_id'])
+        seq = next_seq[channel_id]
+        next_seq[channel_id] = seq + 1
+        rows.append(ChannelChange(
+            channel_id=channel_id,
+            seq=seq,
+            kind=entry['kind'],
+            message_id=int(entry['message_id']),
+            user_id=entry.get('user_id'),
+            emoji=entry.get('emoji'),
+            delta=entry.get('delta'),
+        ))
+        seqs.append(seq)
+    return rows, seqs
+
+
+def record_channel_change(channel_id, kind, message_id, user_id=None, emoji=None, delta=None):
+    return record_channel_changes([{
+        'channel_id': channel_id,
+        'kind': kind,
+        'message_id': message_id,
+        'user_id': user_id,
+        'emoji': emoji,
+        'delta': delta,
+    }])[0]
+
+
+def record_bulk_message_deletes(message_query):
+    # Log a 'delete' for every message matched by `message_query` (call before deleting them).
+    pairs = [(int(cid), int(mid)) for mid, cid in message_query.with_entities(Message.id, Message.channel_id).all()]
+    return record_channel_changes({'channel_id': cid, 'kind': 'delete', 'message_id': mid} for cid, mid in pairs)
+
+
+def record_bulk_reaction_removals(reaction_query):
+    # Log a -1 for every reaction matched by `reaction_query` (call before deleting them).
+    rows = (
+        reaction_query.join(Message, Message.id == MessageReaction.message_id)
+        .with_entities(Message.channel_id, MessageReaction.message_id, MessageReaction.user_id, MessageReaction.emoji)
+        .all()
+    )
+    return record_channel_changes(
+        {'channel_id': cid, 'kind': 'reaction', 'message_id': mid, 'user_id': uid, 'emoji': emoji, 'delta': -1}
+        for cid, mid, uid, emoji in rows
+    )
+
+
+def get_channel_change_seq(channel_id) -> int:
+    return int(
+        db.session.query(db.func.max(ChannelChange.seq))
+        .filter(ChannelChange.channel_id == int(channel_id))
+        .scalar() or 0
+    )
+
+
+def purge_channel_changes(channel_ids):
+    # Drop the log of deleted channels (caller commits).
+    channel_ids = [int(cid) for cid in channel_ids or []]
+    if channel_ids:
+        ChannelChange.query.filter(ChannelChange.channel_id.in_(channel_ids)).delete(synchronize_session=False)
+
+
+def collect_channel_changes(channel_id, since, limit=1000):
+    # Fold log entries after `since` into one compact delta:
+    #   new      -> message ids created (callers ship full payloads)
+    #   edited   -> ids whose content changed (and were not created in this range)
+    #   deleted  -> ids removed (wins over new/edited)
+    #   reactions-> ordered reaction deltas for messages that existed before `since`
+    # Returns (delta, last_seq, has_more).
+    rows = (
+        ChannelChange.query
+        .filter(ChannelChange.channel_id == int(channel_id), ChannelChange.seq > int(since))
+        .order_by(ChannelChange.seq.asc())
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    new_ids, edited_ids, deleted_ids = [], set(), set()
+    reactions = []
+    for row in rows:
+        mid = int(row.message_id)
+        if row.kind == 'new':
+            new_ids.append(mid)
+        elif row.kind == 'edit':
+            edited_ids.add(mid)
+        elif row.kind == 'delete':
+            deleted_ids.add(mid)
+        elif row.kind == 'reaction':
+            reactions.append({
+                'seq': int(row.seq),
+                'message_id': mid,
+                'emoji': row.emoji,
+                'user_id': row.user_id,
+                'delta': int(row.delta or 0),
+            })
+
+    created = set(new_ids)
+    delta = {
+        'new': [mid for mid in new_ids if mid not in deleted_ids],
+        'edited': sorted(mid for mid in edited_ids if mid not in deleted_ids and mid not in created),
+        'deleted': sorted(deleted_ids),
+        'reactions': [r for r in reactions if r['message_id'] not in deleted_ids and r['message_id'] not in created],
+    }
+    last_seq = int(rows[-1].seq) if rows else int(since)
+    return delta, last_seq, has_more
+
+
+def get_emoji_counts(pairs):
+    # {(message_id, emoji): count} for the given pairs, in one GROUP BY.
+    pairs = {(int(mid), emoji) for mid, emoji in pairs or []}
+    if not pairs:
+        return {}
+    message_ids = sorted({mid for mid, _ in pairs})
+    counts = {pair: 0 for pair in pairs}
+    for mid, emoji, count in (
+        db.session.query(MessageReaction.message_id, MessageReaction.emoji, db.func.count(MessageReaction.id))
+        .filter(MessageReaction.message_id.in_(message_ids))
+        .group_by(MessageReaction.message_id, MessageReaction.emoji)
+        .all()
+    ):
+        if (int(mid), emoji) in counts:
+            counts[(int(mid), emoji)] = int(count)
+    return counts
@@ -1,10 +1,9 @@
 
 # File handling functions
 
-import os
-import uuid
 from werkzeug.utils import secure_filename
 from PIL import Image
+from app.functions.blobs import store_upload_stream
 from config import ALLOWED_EXTENSIONS, IMAGE_EXTENSIONS, MUSIC_EXTENSIONS, VIDEO_EXTENSIONS
 
 
@@ -28,38 +27,48 @@ def is_video_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in VIDEO_EXTENSIONS
 
 
-def save_uploaded_file(file, subfolder='files', upload_folder='uploads'):
+def upload_target(filename):
+    # (subfolder, type) an attachment is stored under, as used by /upload_file
+    if is_image_file(filename):
+        return 'files', 'image'
+    if is_music_file(filename):
+        return 'music', 'music'
+    if is_video_file(filename):
+        return 'videos', 'video'
+    return 'files', 'file'
+
+
+def _square_sticker(path):
+    # Stickers: square 256px thumbnail
+    try:
+        img = Image.open(path)
+        fmt = img.format
+        size = min(img.size)
+        img = img.crop((0, 0, size, size))
+        img.thumbnail((256, 256), Image.Resampling.LANCZOS)
+        img.save(path, format=fmt)
+    except Exception as e:
+        print(f"Error processing sticker: {e}")
+
+
+def save_uploaded_file(file, subfolder='files', upload_folder='uploads', process=None):
     
-    # Save uploaded file to subfolder with UUID prefix
+    # Save uploaded file into the content-addressed store (app/functions/blobs.py)
     # Args:
     #   file: Flask FileStorage object
     #   subfolder: subdirectory name (avatars, files, music, etc.)
     #   upload_folder: base upload folder path (default 'uploads')
+    #   process: optional callable(path) that rewrites the file before it is hashed (e.g. resize)
     # Returns:
-    #   str: URL path to saved file, or None if failed
+    #   str: URL path to saved file (/uploads/<subfolder>/<sha256>/<name>), or None if failed
     
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        unique_filename = f"{uuid.uuid4()}_{filename}"
-        filepath = os.path.join(upload_folder, subfolder, unique_filename)
-        
-        # Ensure directory exists
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        
-        file.save(filepath)
-        
-        # Process stickers: make square thumbnail
-        if subfolder == 'stickers' and is_image_file(file.filename):
-            try:
-                img = Image.open(filepath)
-                size = min(img.size)
-                img = img.crop((0, 0, size, size))
-                img.thumbnail((256, 256), Image.Resampling.LANCZOS)
-                img.save(filepath)
-            except Exception as e:
-                print(f"Error processing sticker: {e}")
-        
-        return f"/uploads/{subfolder}/{unique_filename}"
+        if not filename or not allowed_file(filename):
+            return None
+        if process is None and subfolder == 'stickers' and is_image_file(filename):
+            process = _square_sticker
+        return store_upload_stream(file.stream, filename, subfolder, upload_folder, process=process)
     
     return None
 
@@ -73,6 +82,6 @@ def resize_image(filepath, max_size=(32, 32)):
     try:
         img = Image.open(filepath)
         img.thumbnail(max_size, Image.Resampling.LANCZOS)
-        img.save(filepath)
+        img.save(filepath, format=img.format)
     except Exception as e:
         print(f"Error resizing image: {e}")
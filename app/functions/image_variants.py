@@ -0,0 +1,224 @@
+# Image variants (thumbnails + WebP) on a worker pool
+#
+# Pillow work never runs on the eventlet hub: it goes to a pool of
+# BOXCHAT_IMAGE_WORKERS real threads (Pillow releases the GIL while decoding,
+# resizing and encoding). Avatar / icon resizing during an upload waits for
+# its job through eventlet's thread pool; variant generation is fire and
+# forget.
+#
+# When a new image blob is stored (app/functions/blobs.py) the pool writes,
+# next to it, one WebP per configured size the image is larger than
+# (<sha>.w<size>.webp, longest edge <= size) and <sha>.full.webp when WebP is
+# smaller than the original. Width, height and the variants made are recorded
+# on the UploadBlob row. GET /uploads/...?size=N serves the smallest variant
+# of at least N px to clients that accept WebP and falls back to the original
+# (queueing the job) while variants are missing, e.g. for blobs converted by
+# tools/dedupe_uploads.py. Animated images and images of more than
+# BOXCHAT_IMAGE_MAX_PIXELS pixels are left alone.
+#
+# The image is decoded once: the full variant is written first, then the
+# sizes are made largest first, each one resized from the previous variant,
+# so only the decoded original and one smaller copy are in memory at a time.
+
+import glob
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from PIL import Image, ImageOps
+from app.models import UploadBlob
+from app.utils.write_queue import run_write, in_eventlet_hub
+
+FULL_VARIANT = 'full'
+_VARIANT_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp'}
+_executor = [None]
+_executor_lock = threading.Lock()
+_pending = set()
+# Blob paths whose variants were already generated or found missing-by-design
+_done = OrderedDict()
+_MAX_DONE = 4096
+
+
+def image_workers() -> int:
+    try:
+        return max(0, int(os.environ.get('BOXCHAT_IMAGE_WORKERS') or 2))
+    except Exception:
+        return 2
+
+
+def image_variant_sizes() -> list:
+    raw = os.environ.get('BOXCHAT_IMAGE_VARIANT_SIZES') or '64,320,640,1280'
+    try:
+        sizes = sorted({int(part) for part in str(raw).split(',') if str(part).strip()})
+        return [size for size in sizes if size > 0] or [64, 320, 640, 1280]
+    except Exception:
+        return [64, 320, 640, 1280]
+
+
+def webp_quality() -> int:
+    try:
+        return min(100, max(1, int(os.environ.get('BOXCHAT_IMAGE_WEBP_QUALITY') or 80)))
+    except Exception:
+        return 80
+
+
+def image_max_pixels() -> int:
+    # Decoded RGBA costs 4 bytes per pixel: 40 MP is about 160 MB per job
+    try:
+        return max(1, int(os.environ.get('BOXCHAT_IMAGE_MAX_PIXELS') or 40_000_000))
+    except Exception:
+        return 40_000_000
+
+
+def _get_executor():
+    if image_workers() <= 0:
+        return None
+    with _executor_lock:
+        if _executor[0] is None:
+            _executor[0] = ThreadPoolExecutor(max_workers=image_workers(), thread_name_prefix='boxchat-image')
+        return _executor[0]
+
+
+def run_image_job(fn, *args):
+    # Run fn(*args) on the image pool and wait for the result without
+    # blocking the hub; inline when the pool is disabled.
+    executor = _get_executor()
+    if executor is None:
+        return fn(*args)
+    future = executor.submit(fn, *args)
+    if in_eventlet_hub():
+        from eventlet import tpool
+        return tpool.execute(future.result)
+    return future.result()
+
+
+def has_variants(path) -> bool:
+    return os.path.splitext(str(path or ''))[1].lower() in _VARIANT_EXTENSIONS
+
+
+def variant_path(path, size):
+    # <subdir>/<xx>/<sha>.w320.webp / .full.webp for blob <subdir>/<xx>/<sha><ext>
+    base = os.path.splitext(path)[0]
+    return f"{base}.full.webp" if size == FULL_VARIANT else f"{base}.w{int(size)}.webp"
+
+
+def _save_webp(img, target):
+    tmp = target + '.tmp'
+    img.save(tmp, format='WEBP', quality=webp_quality(), method=4)
+    os.replace(tmp, target)
+
+
+def _fit(width, height, size):
+    # Dimensions with the longest edge scaled down to size (as Image.thumbnail)
+    scale = size / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def generate_image_variants(upload_folder, path, sizes=None):
+    # Write the missing variants of one blob; returns (width, height, [variant names])
+    src = os.path.join(upload_folder, path)
+    sizes = sizes or image_variant_sizes()
+    made = []
+    full_made = False
+    with Image.open(src) as opened:
+        # Size comes from the header: nothing is decoded for skipped images.
+        if getattr(opened, 'is_animated', False):
+            return opened.size[0], opened.size[1], made
+        if opened.size[0] * opened.size[1] > image_max_pixels():
+            print(f"[IMAGES] {path} is {opened.size[0]}x{opened.size[1]}, over BOXCHAT_IMAGE_MAX_PIXELS; no variants")
+            width, height = opened.size
+            # EXIF orientations 5-8 are rotated by 90 degrees
+            if opened.getexif().get(0x0112) in (5, 6, 7, 8):
+                width, height = height, width
+            return width, height, made
+        ImageOps.exif_transpose(opened, in_place=True)
+        img = opened
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+        width, height = img.size
+        if not path.lower().endswith('.webp'):
+            target = os.path.join(upload_folder, variant_path(path, FULL_VARIANT))
+            if not os.path.exists(target):
+                _save_webp(img, target)
+                if os.path.getsize(target) >= os.path.getsize(src):
+                    os.remove(target)
+            full_made = os.path.exists(target)
+        current = img
+        for size in sorted(sizes, reverse=True):
+            if max(width, height) <= size:
+                continue
+            target = os.path.join(upload_folder, variant_path(path, size))
+            if not os.path.exists(target):
+                # reducing_gap lets Pillow shrink by whole factors before LANCZOS
+                current = current.resize(_fit(width, height, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+                _save_webp(current, target)
+            made.insert(0, str(size))
+    if full_made:
+        made.append(FULL_VARIANT)
+    return width, height, made
+
+
+def _record_variants(path, width, height, variants):
+    return UploadBlob.query.filter_by(path=path).update(
+        {'width': width, 'height': height, 'variants': ','.join(variants)}, synchronize_session=False
+    )
+
+
+def _variant_job(app, upload_folder, path):
+    try:
+        width, height, made = generate_image_variants(upload_folder, path)
+        with app.app_context():
+            try:
+                run_write(_record_variants, path, width, height, made)
+            finally:
+                from app.extensions import db
+                db.session.remove()
+        _done[path] = True
+        while len(_done) > _MAX_DONE:
+            _done.popitem(last=False)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[IMAGES] variants for {path} failed: {e}")
+    finally:
+        _pending.discard(path)
+
+
+def schedule_image_variants(upload_folder, path):
+    # Queue variant generation for an image blob; no-op while one is queued
+    if not has_variants(path) or path in _pending:
+        return False
+    executor = _get_executor()
+    if executor is None:
+        return False
+    _pending.add(path)
+    executor.submit(_variant_job, current_app._get_current_object(), upload_folder, path)
+    return True
+
+
+def pick_image_variant(upload_folder, path, size, accept_webp=True):
+    # Variant path to serve for ?size=<size>, or None for the original
+    if not accept_webp or not has_variants(path):
+        return None
+    wanted = [s for s in image_variant_sizes() if s >= int(size)] + [FULL_VARIANT]
+    for candidate in wanted:
+        rel = variant_path(path, candidate)
+        if os.path.exists(os.path.join(upload_folder, rel)):
+            return rel
+        if path in _done:
+            continue
+        # Not generated (yet): serve the original this time.
+        schedule_image_variants(upload_folder, path)
+        return None
+    return None
+
+
+def remove_image_variants(upload_folder, path):
+    _done.pop(path, None)
+    base = os.path.join(upload_folder, os.path.splitext(path)[0])
+    for variant in glob.glob(glob.escape(base) + '.w*.webp') + glob.glob(glob.escape(base) + '.full.webp'):
+        try:
+            os.remove(variant)
+        except OSError:
+            pass
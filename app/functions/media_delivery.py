@@ -0,0 +1,82 @@
+# Media delivery for GET /uploads
+#
+# BOXCHAT_MEDIA_DELIVERY picks who streams the bytes once the access check
+# passed:
+#   native      the app (werkzeug send_file: Range / If-Range, 304s)
+#   x-accel     nginx: empty response with X-Accel-Redirect:
+#               <BOXCHAT_MEDIA_ACCEL_PREFIX><path under the upload folder>,
+#               which must be an `internal` location aliased to the folder
+#   x-sendfile  Apache mod_xsendfile / lighttpd: X-Sendfile: <absolute path>
+# In the proxy modes the worker only builds headers and the proxy handles
+# ranges, so scrubbing a video no longer holds a green thread per request.
+#
+# Blobs and their image variants are content-addressed (app/functions/blobs.py):
+# they get a strong ETag from the hash and a year-long private immutable
+# Cache-Control. Legacy files and originals served in place of a missing
+# variant revalidate (no-cache) instead.
+
+import os
+from urllib.parse import quote
+from flask import current_app, request
+from werkzeug.exceptions import NotFound
+from werkzeug.security import safe_join
+from werkzeug.utils import send_file
+
+DELIVERY_MODES = ('native', 'x-accel', 'x-sendfile')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def media_delivery_mode() -> str:
+    mode = str(os.environ.get('BOXCHAT_MEDIA_DELIVERY') or 'native').strip().lower()
+    return mode if mode in DELIVERY_MODES else 'native'
+
+
+def media_accel_prefix() -> str:
+    prefix = str(os.environ.get('BOXCHAT_MEDIA_ACCEL_PREFIX') or '/protected-uploads/').strip()
+    return '/' + prefix.strip('/') + '/'
+
+
+def blob_etag(path):
+    # <sha256> for a blob, <sha256>.w640 / <sha256>.full for its variants
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def send_upload(upload_folder, path, download_name=None, mimetype=None, as_attachment=False,
+                etag=None, immutable=False):
+    # Response for a file under the upload folder (path is relative to it).
+    # etag=None lets werkzeug derive a weak-ish one from mtime and size.
+    if not os.path.isabs(upload_folder):
+        upload_folder = os.path.join(current_app.root_path, upload_folder)
+    full_path = safe_join(upload_folder, path)
+    if full_path is None or not os.path.isfile(full_path):
+        raise NotFound()
+
+    mode = media_delivery_mode()
+    proxied = mode != 'native'
+    rv = send_file(
+        full_path,
+        request.environ,
+        mimetype=mimetype,
+        as_attachment=as_attachment,
+        download_name=download_name,
+        conditional=not proxied,
+        etag=etag if etag is not None else True,
+        use_x_sendfile=proxied,
+        response_class=current_app.response_class,
+    )
+    if proxied:
+        # The proxy sends the body and handles Range; the app still answers 304s.
+        rv.headers.pop('X-Sendfile', None)
+        rv.headers.pop('Content-Length', None)
+        rv = rv.make_conditional(request.environ)
+        if rv.status_code != 304:
+            if mode == 'x-accel':
+                rv.headers['X-Accel-Redirect'] = media_accel_prefix() + quote(path.replace(os.sep, '/'))
+            else:
+                rv.headers['X-Sendfile'] = full_path
+    if immutable:
+        rv.headers['Cache-Control'] = f'private, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        rv.headers['Cache-Control'] = 'private, no-cache'
+    rv.headers.pop('Expires', None)
+    return rv
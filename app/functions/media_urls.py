@@ -0,0 +1,91 @@
+# Signed, expiring media URLs
+#
+# Messages sent to clients (history pages, delta sync, bootstrap and
+# receive_message) carry `signed_file_url` next to `file_url` for room
+# attachments: the same /uploads URL plus `exp` (unix time) and `sig`, an
+# HMAC-SHA256 over "<path>\n<exp>" keyed from SECRET_KEY. GET /uploads checks
+# it in constant time and serves the file without loading the user or asking
+# the attachment index (app/functions/attachments.py). A missing, wrong or
+# expired signature falls back to that login + index check, so a long video
+# or a rotated SECRET_KEY only costs the slower path.
+#
+# The expiry is rounded up to a step of a fifth of BOXCHAT_MEDIA_URL_TTL_SECONDS,
+# so a file gets the same URL (and browser cache entry) for a while and a
+# signed URL outlives a membership by at most TTL + step.
+
+import base64
+import hashlib
+import hmac
+import math
+import os
+import time
+from urllib.parse import quote
+from flask import current_app
+
+SIGNED_SUBDIRS = ('files', 'videos', 'music')
+_KEY_CACHE = {}
+
+
+def media_url_ttl_seconds() -> int:
+    # 0 disables signing
+    try:
+        return max(0, int(os.environ.get('BOXCHAT_MEDIA_URL_TTL_SECONDS') or 300))
+    except Exception:
+        return 300
+
+
+def _signing_key():
+    secret = str(current_app.config.get('SECRET_KEY') or '')
+    key = _KEY_CACHE.get(secret)
+    if key is None:
+        # Own key per purpose: a media signature is never a valid session signature.
+        key = hmac.new(secret.encode('utf-8'), b'boxchat-media-url-v1', hashlib.sha256).digest()
+        _KEY_CACHE.clear()
+        _KEY_CACHE[secret] = key
+    return key
+
+
+def _signature(path, expires_at) -> str:
+    digest = hmac.new(_signing_key(), f"{path}\n{int(expires_at)}".encode('utf-8'), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode('ascii')
+
+
+def _needs_signature(url) -> bool:
+    parts = str(url or '').split('/', 3)
+    # ['', 'uploads', '<subdir>', '<rest>']
+    return len(parts) == 4 and parts[1] == 'uploads' and parts[2] in SIGNED_SUBDIRS
+
+
+def sign_media_url(url, now=None):
+    # Signed form of a protected /uploads URL, else None
+    ttl = media_url_ttl_seconds()
+    if ttl <= 0 or not _needs_signature(url):
+        return None
+    step = max(1, ttl // 5)
+    now = time.time() if now is None else now
+    expires_at = int(math.ceil((now + ttl) / step) * step)
+    return f"{quote(str(url), safe='/')}?exp={expires_at}&sig={_signature(str(url), expires_at)}"
+
+
+def verify_media_signature(path, expires_at, signature, now=None) -> bool:
+    # path is the decoded URL path (/uploads/...)
+    if not signature or not expires_at or media_url_ttl_seconds() <= 0:
+        return False
+    try:
+        expires_at = int(expires_at)
+    except Exception:
+        return False
+    now = time.time() if now is None else now
+    if expires_at < now:
+        return False
+    return hmac.compare_digest(_signature(str(path), expires_at), str(signature))
+
+
+def add_signed_media_urls(items, now=None):
+    # Set `signed_file_url` on serialized messages (dicts the caller owns)
+    now = time.time() if now is None else now
+    for item in items:
+        signed = sign_media_url(item.get('file_url'), now=now)
+        if signed:
+            item['signed_file_url'] = signed
+    return items
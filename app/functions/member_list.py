@@ -0,0 +1,416 @@
+# In-memory member list per room (lazy, presence-sorted)
+#
+# Members are grouped and sorted on the server so clients can page through a
+# room of any size by range instead of loading every member:
+#   owner / admin / online  -> online members by room role
+#   offline                 -> everyone else (hidden users included)
+# Inside a group the order is (lowercase username, user id), which is stable.
+# Positions are flat indexes over the groups in that order.
+#
+# A room list is built lazily with two queries and then maintained by the
+# membership hooks and the presence broadcaster. Every mutation produces ops
+#   {'op': 'INSERT' | 'DELETE' | 'UPDATE', 'index': n, 'member': {...}}
+# that are pushed to the sockets subscribed to a range of that room
+# (app/sockets/member_list.py). Rooms are LRU-evicted past
+# BOXCHAT_MEMBER_LIST_ROOMS, except rooms with subscribers: their windows
+# would stop getting ops, so the cache can exceed the limit while they last.
+
+import os
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from app.extensions import db
+from app.models import Member, MemberRole, Role, User
+
+GROUP_ORDER = ('owner', 'admin', 'online', 'offline')
+
+
+class MemberListEntry:
+    __slots__ = ('user_id', 'username', 'avatar_url', 'role', 'role_ids', 'status')
+
+    def __init__(self, user_id, username, avatar_url=None, role=None, role_ids=(), status='offline'):
+        self.user_id = int(user_id)
+        self.username = str(username or '')
+        self.avatar_url = avatar_url
+        self.role = role or 'member'
+        self.role_ids = sorted({int(r) for r in role_ids})
+        self.status = status
+
+    @property
+    def key(self):
+        return (self.username.lower(), self.user_id)
+
+    @property
+    def group(self):
+        if self.status != 'online':
+            return 'offline'
+        if self.role in ('owner', 'admin'):
+            return self.role
+        return 'online'
+
+    def to_dict(self):
+        return {
+            'id': self.user_id,
+            'username': self.username,
+            'avatar_url': self.avatar_url or 'https://placehold.co/50x50',
+            'role': self.role,
+            'role_ids': list(self.role_ids),
+            'presence_status': self.status,
+        }
+
+
+class RoomMemberList:
+    def __init__(self, room_id):
+        self.room_id = int(room_id)
+        self.entries = {}  # user id -> MemberListEntry
+        self.groups = {gid: [] for gid in GROUP_ORDER}  # group -> sorted keys
+        self.names = []  # sorted keys of every member (prefix search)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _offset(self, group):
+        offset = 0
+        for gid in GROUP_ORDER:
+            if gid == group:
+                return offset
+            offset += len(self.groups[gid])
+        return offset
+
+    def index_of(self, entry):
+        keys = self.groups[entry.group]
+        return self._offset(entry.group) + bisect_left(keys, entry.key)
+
+    def _op(self, op, entry, index):
+        return {'op': op, 'index': index, 'group': entry.group, 'member': entry.to_dict()}
+
+    def insert(self, entry):
+        ops = self.remove(entry.user_id)
+        self.entries[entry.user_id] = entry
+        insort(self.groups[entry.group], entry.key)
+        insort(self.names, entry.key)
+        ops.append(self._op('INSERT', entry, self.index_of(entry)))
+        return ops
+
+    def remove(self, user_id):
+        entry = self.entries.pop(int(user_id), None)
+        if entry is None:
+            return []
+        index = self.index_of(entry)
+        keys = self.groups[entry.group]
+        del keys[bisect_left(keys, entry.key)]
+        del self.names[bisect_left(self.names, entry.key)]
+        return [{'op': 'DELETE', 'index': index, 'group': entry.group, 'member': {'id': entry.user_id}}]
+
+    def update(self, user_id, **changes):
+        # Returns [UPDATE] when the position holds, [DELETE, INSERT] when it moves.
+        entry = self.entries.get(int(user_id))
+        if entry is None:
+            return []
+        if all(getattr(entry, name) == value for name, value in changes.items()):
+            return []
+        old_group, old_key = entry.group, entry.key
+        moved = MemberListEntry(entry.user_id, entry.username, entry.avatar_url, entry.role, entry.role_ids, entry.status)
+        for name, value in changes.items():
+            setattr(moved, name, value)
+        if moved.group == old_group and moved.key == old_key:
+            self.entries[entry.user_id] = moved
+            return [self._op('UPDATE', moved, self.index_of(moved))]
+        return self.insert(moved)
+
+    def group_counts(self):
+        return [{'id': gid, 'count': len(self.groups[gid])} for gid in GROUP_ORDER]
+
+    def range(self, start, count):
+        # [(flat index, entry)] for positions start .. start + count - 1.
+        items = []
+        offset = 0
+        end = start + count
+        for gid in GROUP_ORDER:
+            keys = self.groups[gid]
+            lo = max(start, offset)
+            hi = min(end, offset + len(keys))
+            for pos in range(lo, hi):
+                items.append((pos, self.entries[keys[pos - offset][1]]))
+            offset += len(keys)
+            if offset >= end:
+                break
+        return items
+
+    def search(self, prefix, limit):
+        # Members whose username starts with `prefix` (case-insensitive), in name order.
+        prefix = str(prefix or '').lower()
+        result = []
+        pos = bisect_left(self.names, (prefix,))
+        while pos < len(self.names) and len(result) < limit:
+            name, user_id = self.names[pos]
+            if not name.startswith(prefix):
+                break
+            result.append(self.entries[user_id])
+            pos += 1
+        return result
+
+
+def _max_member_list_rooms() -> int:
+    try:
+        return max(1, int(os.environ.get('BOXCHAT_MEMBER_LIST_ROOMS') or 256))
+    except Exception:
+        return 256
+
+
+_LISTS = OrderedDict()  # room_id -> RoomMemberList, LRU order
+_ROOMS_BY_USER = {}  # user_id -> set(room_id) among loaded lists
+_LIST_LOCK = threading.RLock()
+
+
+def _build_member_list(room_id: int):
+    from app.sockets.presence import presence
+
+    member_list = RoomMemberList(room_id)
+    role_ids = {}
+    for user_id, role_id in (
+        db.session.query(MemberRole.user_id, MemberRole.role_id)
+        .filter(MemberRole.room_id == room_id)
+        .all()
+    ):
+        role_ids.setdefault(int(user_id), set()).add(int(role_id))
+
+    rows = (
+        db.session.query(Member.user_id, Member.role, User.username, User.avatar_url, User.hide_status)
+        .join(User, User.id == Member.user_id)
+        .filter(Member.room_id == room_id)
+        .order_by(Member.id.asc())
+        .all()
+    )
+    online = presence.online_user_ids(uid for uid, *_rest in rows)
+    for user_id, role, username, avatar_url, hidden in rows:
+        user_id = int(user_id)
+        if user_id in member_list.entries:
+            continue
+        if hidden:
+            status = 'hidden'
+        else:
+            status = 'online' if user_id in online else 'offline'
+        entry = MemberListEntry(user_id, username, avatar_url, role, role_ids.get(user_id, ()), status)
+        member_list.entries[user_id] = entry
+    # Sort once instead of inserting one by one.
+    for entry in member_list.entries.values():
+        member_list.groups[entry.group].append(entry.key)
+        member_list.names.append(entry.key)
+    for keys in member_list.groups.values():
+        keys.sort()
+    member_list.names.sort()
+    return member_list
+
+
+def _forget_room(room_id: int):
+    member_list = _LISTS.pop(room_id, None)
+    if member_list is None:
+        return
+    for uid in member_list.entries:
+        rooms = _ROOMS_BY_USER.get(uid)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                _ROOMS_BY_USER.pop(uid, None)
+
+
+def get_room_member_list(room_id: int):
+    room_id = int(room_id)
+    with _LIST_LOCK:
+        member_list = _LISTS.get(room_id)
+        if member_list is not None:
+            _LISTS.move_to_end(room_id)
+            return member_list
+
+    member_list = _build_member_list(room_id)
+    with _LIST_LOCK:
+        existing = _LISTS.get(room_id)
+        if existing is not None:
+            return existing
+        _LISTS[room_id] = member_list
+        for uid in member_list.entries:
+            _ROOMS_BY_USER.setdefault(uid, set()).add(room_id)
+        _evict_rooms()
+    return member_list
+
+
+def _evict_rooms():
+    # Under _LIST_LOCK: drop least recently used lists nobody is subscribed to.
+    excess = len(_LISTS) - _max_member_list_rooms()
+    if excess <= 0:
+        return
+    from app.sockets.member_list import member_list_subscribed_rooms
+
+    subscribed = member_list_subscribed_rooms()
+    for room_id in [rid for rid in _LISTS if rid not in subscribed][:excess]:
+        _forget_room(room_id)
+
+
+def member_list_snapshot(room_id: int, start: int, count: int, group=None):
+    # (groups, total, start, [member dicts with index/group]) for one range, read under
+    # the lock. With `group`, `start` is relative to that group and the range stays in it.
+    member_list = get_room_member_list(room_id)
+    with _LIST_LOCK:
+        start, count = int(start), int(count)
+        if group is not None:
+            size = len(member_list.groups[group])
+            count = max(0, min(count, size - start))
+            start += member_list._offset(group)
+        items = [
+            dict(entry.to_dict(), index=pos, group=entry.group)
+            for pos, entry in member_list.range(start, count)
+        ]
+        return member_list.group_counts(), len(member_list), start, items
+
+
+def with_member_list(room_id: int, fn):
+    # Run fn(member_list) under the list lock (no ops are published meanwhile).
+    room_id = int(room_id)
+    while True:
+        member_list = get_room_member_list(room_id)
+        with _LIST_LOCK:
+            # Evicted before we got the lock: it no longer receives mutations.
+            if _LISTS.get(room_id) is member_list:
+                return fn(member_list)
+
+
+def search_room_members(room_id: int, prefix: str, limit: int = 10):
+    member_list = get_room_member_list(room_id)
+    with _LIST_LOCK:
+        return [entry.to_dict() for entry in member_list.search(prefix, limit)]
+
+
+def _publish(member_list, ops):
+    # Called under _LIST_LOCK so subscribers see ops in mutation order.
+    if not ops:
+        return
+    from app.sockets.member_list import publish_member_list_ops
+
+    publish_member_list_ops(member_list, ops)
+
+
+def member_list_member_added(user_id: int, room_id: int):
+    from app.sockets.presence import presence
+
+    room_id, user_id = int(room_id), int(user_id)
+    with _LIST_LOCK:
+        if room_id not in _LISTS:
+            return
+    row = (
+        db.session.query(Member.role, User.username, User.avatar_url, User.hide_status)
+        .join(User, User.id == Member.user_id)
+        .filter(Member.room_id == room_id, Member.user_id == user_id)
+        .first()
+    )
+    if row is None:
+        return
+    role_ids = [
+        int(rid) for (rid,) in
+        db.session.query(MemberRole.role_id).filter(MemberRole.user_id == user_id, MemberRole.room_id == room_id).all()
+    ]
+    role, username, avatar_url, hidden = row
+    if hidden:
+        status = 'hidden'
+    else:
+        status = 'online' if presence.is_online(user_id) else 'offline'
+    with _LIST_LOCK:
+        member_list = _LISTS.get(room_id)
+        if member_list is None:
+            return
+        ops = member_list.insert(MemberListEntry(user_id, username, avatar_url, role, role_ids, status))
+        _ROOMS_BY_USER.setdefault(user_id, set()).add(room_id)
+        _publish(member_list, ops)
+
+
+def member_list_member_removed(user_id: int, room_id: int):
+    room_id, user_id = int(room_id), int(user_id)
+    with _LIST_LOCK:
+        member_list = _LISTS.get(room_id)
+        if member_list is None:
+            return
+        ops = member_list.remove(user_id)
+        rooms = _ROOMS_BY_USER.get(user_id)
+        if rooms is not None:
+            rooms.discard(room_id)
+        _publish(member_list, ops)
+
+
+def member_list_roles_changed(user_id: int, room_id: int):
+    # Member.role or MemberRole links of one member changed.
+    room_id, user_id = int(room_id), int(user_id)
+    with _LIST_LOCK:
+        member_list = _LISTS.get(room_id)
+        if member_list is None or user_id not in member_list.entries:
+            return
+    role = db.session.query(Member.role).filter(Member.room_id == room_id, Member.user_id == user_id).scalar()
+    role_ids = sorted({
+        int(rid) for (rid,) in
+        db.session.query(MemberRole.role_id).filter(MemberRole.user_id == user_id, MemberRole.room_id == room_id).all()
+    })
+    with _LIST_LOCK:
+        member_list = _LISTS.get(room_id)
+        if member_list is None:
+            return
+        _publish(member_list, member_list.update(user_id, role=role or 'member', role_ids=role_ids))
+
+
+def member_list_role_changed(room_id: int, role_id: int):
+    # A deleted role disappears from the members' role_ids.
+    room_id, role_id = int(room_id), int(role_id)
+    with _LIST_LOCK:
+        member_list = _LISTS.get(room_id)
+        if member_list is None:
+            return
+    if db.session.query(Role.id).filter(Role.id == role_id, Role.room_id == room_id).first() is not None:
+        return
+    with _LIST_LOCK:
+        member_list = _LISTS.get(room_id)
+        if member_list is None:
+            return
+        ops = []
+        for entry in list(member_list.entries.values()):
+            if role_id in entry.role_ids:
+                ops.extend(member_list.update(entry.user_id, role_ids=[r for r in entry.role_ids if r != role_id]))
+        _publish(member_list, ops)
+
+
+def member_list_user_changed(user_id: int, **changes):
+    # username / avatar_url / status of a user, in every loaded room list.
+    user_id = int(user_id)
+    changes = {name: value for name, value in changes.items() if value is not None}
+    if not changes:
+        return
+    with _LIST_LOCK:
+        for room_id in list(_ROOMS_BY_USER.get(user_id, ())):
+            member_list = _LISTS.get(room_id)
+            if member_list is not None:
+                _publish(member_list, member_list.update(user_id, **changes))
+
+
+def member_list_presence_changed(updates):
+    # updates: {'user_id', 'status'} dicts of one presence window; one publish per room.
+    by_room = {}
+    with _LIST_LOCK:
+        for update in updates:
+            user_id = int(update['user_id'])
+            for room_id in list(_ROOMS_BY_USER.get(user_id, ())):
+                member_list = _LISTS.get(room_id)
+                if member_list is not None:
+                    by_room.setdefault(room_id, []).extend(member_list.update(user_id, status=update['status']))
+        for room_id, ops in by_room.items():
+            _publish(_LISTS[room_id], ops)
+
+
+def drop_room_member_list(room_id: int):
+    with _LIST_LOCK:
+        _forget_room(int(room_id))
+
+
+def clear_member_lists():
+    from app.sockets.member_list import reset_member_list_subscriptions
+
+    with _LIST_LOCK:
+        _LISTS.clear()
+        _ROOMS_BY_USER.clear()
+        reset_member_list_subscriptions()
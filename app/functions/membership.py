@@ -0,0 +1,77 @@
+# Membership change hooks
+#
+# Call these AFTER the commit that changes Member/MemberRole/Role rows (or a
+# username) so every in-memory structure keyed by room membership stays in sync.
+# `member_left` also drops the user's unread counters of the room (own commit).
+
+from app.functions.roles import invalidate_permission_context, invalidate_room_permission_contexts
+from app.functions.mentions import (
+    index_member_added, index_member_removed, index_member_roles_changed,
+    index_role_changed, index_user_renamed, drop_room_mention_index
+)
+from app.functions.message_cache import tail_user_profile_changed, drop_channel_tails
+from app.functions.unread import forget_room_unread_counters
+from app.functions.attachments import forget_upload_access
+from app.functions.member_list import (
+    member_list_member_added, member_list_member_removed, member_list_roles_changed,
+    member_list_role_changed, member_list_user_changed, drop_room_member_list
+)
+
+
+def member_joined(user_id: int, room_id: int):
+    from app.sockets.fanout import subscribe_user_to_room
+
+    invalidate_permission_context(user_id, room_id)
+    index_member_added(user_id, room_id)
+    member_list_member_added(user_id, room_id)
+    subscribe_user_to_room(user_id, room_id)
+
+
+def member_left(user_id: int, room_id: int):
+    from app.sockets.fanout import unsubscribe_user_from_room
+    from app.sockets.member_list import drop_member_list_subscriptions
+
+    invalidate_permission_context(user_id, room_id)
+    index_member_removed(user_id, room_id)
+    member_list_member_removed(user_id, room_id)
+    unsubscribe_user_from_room(user_id, room_id)
+    drop_member_list_subscriptions(room_id, user_id)
+    forget_room_unread_counters(user_id, room_id)
+    forget_upload_access(user_id)
+
+
+def member_role_changed(user_id: int, room_id: int):
+    invalidate_permission_context(user_id, room_id)
+    index_member_roles_changed(user_id, room_id)
+    member_list_roles_changed(user_id, room_id)
+
+
+def role_changed(room_id: int, role_id: int):
+    # Role created, renamed, re-permissioned or deleted.
+    invalidate_room_permission_contexts(room_id, {role_id})
+    index_role_changed(room_id, role_id)
+    member_list_role_changed(room_id, role_id)
+
+
+def user_renamed(user_id: int, new_username: str):
+    index_user_renamed(user_id, new_username)
+    tail_user_profile_changed(user_id, username=new_username)
+    member_list_user_changed(user_id, username=new_username)
+
+
+def user_avatar_changed(user_id: int, avatar_url):
+    tail_user_profile_changed(user_id, avatar_url=avatar_url)
+    member_list_user_changed(user_id, avatar_url=avatar_url)
+
+
+def room_deleted(room_id: int, channel_ids=()):
+    from app.sockets.fanout import close_room_subscriptions
+    from app.sockets.member_list import drop_member_list_subscriptions
+
+    invalidate_room_permission_contexts(room_id)
+    drop_room_mention_index(room_id)
+    drop_room_member_list(room_id)
+    drop_member_list_subscriptions(room_id)
+    drop_channel_tails(channel_ids)
+    close_room_subscriptions(room_id)
+    forget_upload_access()
@@ -0,0 +1,278 @@
+# In-memory mention index per room
+#
+# Maps lowercase usernames and role mention tags to ids so @mention parsing
+# never has to load the full member list. A room index is built lazily with
+# three queries and then maintained incrementally by the membership hooks
+# (join/leave/kick/ban, role assignment, role edits, username changes).
+# Every hook bumps a generation (per room; renames and clears bump a global
+# one) even when the room is not indexed, and a build only installs its index
+# when the generation did not move meanwhile, so a change that lands during a
+# build cannot leave a stale index behind.
+
+import os
+import threading
+from collections import OrderedDict
+from app.extensions import db
+from app.models import Member, MemberRole, Role, User
+
+
+class IndexedRole:
+    # Lightweight Role snapshot; quacks like Role for can_user_mention_role.
+    __slots__ = ('id', 'mention_tag', 'can_be_mentioned_by_everyone')
+
+    def __init__(self, role_id, mention_tag, can_be_mentioned_by_everyone=False):
+        self.id = int(role_id)
+        self.mention_tag = str(mention_tag or '')
+        self.can_be_mentioned_by_everyone = bool(can_be_mentioned_by_everyone)
+
+
+class RoomMentionIndex:
+    __slots__ = ('room_id', 'user_by_name', 'name_by_user', 'role_by_tag', 'role_members')
+
+    def __init__(self, room_id):
+        self.room_id = int(room_id)
+        self.user_by_name = {}  # lowercase username -> user id
+        self.name_by_user = {}  # user id -> username
+        self.role_by_tag = {}  # lowercase mention tag -> IndexedRole
+        self.role_members = {}  # role id -> set(user id)
+
+    def add_user(self, user_id, username, role_ids=()):
+        user_id = int(user_id)
+        self.remove_user(user_id)
+        if username:
+            self.user_by_name[str(username).lower()] = user_id
+            self.name_by_user[user_id] = str(username)
+        for rid in role_ids:
+            self.role_members.setdefault(int(rid), set()).add(user_id)
+
+    def remove_user(self, user_id):
+        user_id = int(user_id)
+        old_name = self.name_by_user.pop(user_id, None)
+        if old_name is not None and self.user_by_name.get(old_name.lower()) == user_id:
+            del self.user_by_name[old_name.lower()]
+        for members in self.role_members.values():
+            members.discard(user_id)
+
+    def set_user_roles(self, user_id, role_ids):
+        user_id = int(user_id)
+        role_ids = {int(r) for r in role_ids}
+        for rid, members in self.role_members.items():
+            if rid not in role_ids:
+                members.discard(user_id)
+        for rid in role_ids:
+            self.role_members.setdefault(rid, set()).add(user_id)
+
+    def set_role(self, role):
+        self.remove_role(role.id)
+        self.role_by_tag[role.mention_tag.lower()] = role
+
+    def remove_role(self, role_id):
+        role_id = int(role_id)
+        for tag, role in list(self.role_by_tag.items()):
+            if role.id == role_id:
+                del self.role_by_tag[tag]
+
+    def drop_role_members(self, role_id):
+        self.role_members.pop(int(role_id), None)
+
+
+def _max_indexed_rooms() -> int:
+    try:
+        return max(1, int(os.environ.get('BOXCHAT_MENTION_INDEX_ROOMS') or 512))
+    except Exception:
+        return 512
+
+
+_INDEXES = OrderedDict()  # room_id -> RoomMentionIndex, LRU order
+_ROOMS_BY_USER = {}  # user_id -> set(room_id) among indexed rooms
+_INDEX_LOCK = threading.RLock()
+_ROOM_GENERATIONS = {}  # room_id -> int
+_GLOBAL_GENERATION = [0]
+
+
+def _generation(room_id):
+    return _GLOBAL_GENERATION[0], _ROOM_GENERATIONS.get(room_id, 0)
+
+
+def _bump_generation(room_id):
+    # Under _INDEX_LOCK
+    _ROOM_GENERATIONS[room_id] = _ROOM_GENERATIONS.get(room_id, 0) + 1
+    if len(_ROOM_GENERATIONS) > 2 * _max_indexed_rooms():
+        # Bounded: the global bump makes every build in flight stale anyway.
+        _ROOM_GENERATIONS.clear()
+        _GLOBAL_GENERATION[0] += 1
+
+
+def _build_room_index(room_id: int):
+    index = RoomMentionIndex(room_id)
+    members = (
+        db.session.query(Member.user_id, User.username)
+        .join(User, User.id == Member.user_id)
+        .filter(Member.room_id == room_id)
+        .all()
+    )
+    for user_id, username in members:
+        index.add_user(user_id, username)
+
+    for role_id, mention_tag, by_everyone in (
+        db.session.query(Role.id, Role.mention_tag, Role.can_be_mentioned_by_everyone)
+        .filter(Role.room_id == room_id)
+        .all()
+    ):
+        index.set_role(IndexedRole(role_id, mention_tag, by_everyone))
+
+    for user_id, role_id in (
+        db.session.query(MemberRole.user_id, MemberRole.role_id)
+        .filter(MemberRole.room_id == room_id)
+        .all()
+    ):
+        if int(user_id) in index.name_by_user:
+            index.role_members.setdefault(int(role_id), set()).add(int(user_id))
+    return index
+
+
+def _forget_room(room_id: int):
+    index = _INDEXES.pop(room_id, None)
+    if index is None:
+        return
+    for uid in index.name_by_user:
+        rooms = _ROOMS_BY_USER.get(uid)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                _ROOMS_BY_USER.pop(uid, None)
+
+
+def get_room_mention_index(room_id: int):
+    room_id = int(room_id)
+    with _INDEX_LOCK:
+        index = _INDEXES.get(room_id)
+        if index is not None:
+            _INDEXES.move_to_end(room_id)
+            return index
+        generation = _generation(room_id)
+
+    index = _build_room_index(room_id)
+    with _INDEX_LOCK:
+        existing = _INDEXES.get(room_id)
+        if existing is not None:
+            return existing
+        if _generation(room_id) != generation:
+            # Changed while building: use it for this call only.
+            return index
+        _INDEXES[room_id] = index
+        for uid in index.name_by_user:
+            _ROOMS_BY_USER.setdefault(uid, set()).add(room_id)
+        while len(_INDEXES) > _max_indexed_rooms():
+            _forget_room(next(iter(_INDEXES)))
+    return index
+
+
+def get_role_member_ids(index, role_ids):
+    # Snapshot under the lock: member sets may change while we iterate.
+    with _INDEX_LOCK:
+        result = set()
+        for rid in role_ids:
+            result |= index.role_members.get(int(rid), set())
+        return result
+
+
+def index_member_added(user_id: int, room_id: int):
+    room_id, user_id = int(room_id), int(user_id)
+    with _INDEX_LOCK:
+        _bump_generation(room_id)
+        if room_id not in _INDEXES:
+            return
+    username = db.session.query(User.username).filter(User.id == user_id).scalar()
+    role_ids = [
+        int(rid) for (rid,) in
+        db.session.query(MemberRole.role_id).filter(MemberRole.user_id == user_id, MemberRole.room_id == room_id).all()
+    ]
+    with _INDEX_LOCK:
+        index = _INDEXES.get(room_id)
+        if index is None:
+            return
+        index.add_user(user_id, username, role_ids)
+        _ROOMS_BY_USER.setdefault(user_id, set()).add(room_id)
+
+
+def index_member_removed(user_id: int, room_id: int):
+    room_id, user_id = int(room_id), int(user_id)
+    with _INDEX_LOCK:
+        _bump_generation(room_id)
+        index = _INDEXES.get(room_id)
+        if index is None:
+            return
+        index.remove_user(user_id)
+        rooms = _ROOMS_BY_USER.get(user_id)
+        if rooms is not None:
+            rooms.discard(room_id)
+
+
+def index_member_roles_changed(user_id: int, room_id: int):
+    room_id, user_id = int(room_id), int(user_id)
+    with _INDEX_LOCK:
+        _bump_generation(room_id)
+        index = _INDEXES.get(room_id)
+        if index is None or user_id not in index.name_by_user:
+            return
+    role_ids = [
+        int(rid) for (rid,) in
+        db.session.query(MemberRole.role_id).filter(MemberRole.user_id == user_id, MemberRole.room_id == room_id).all()
+    ]
+    with _INDEX_LOCK:
+        index = _INDEXES.get(room_id)
+        if index is not None and user_id in index.name_by_user:
+            index.set_user_roles(user_id, role_ids)
+
+
+def index_user_renamed(user_id: int, new_username: str):
+    user_id = int(user_id)
+    with _INDEX_LOCK:
+        # The rooms being built do not know the user yet
+        _GLOBAL_GENERATION[0] += 1
+        for room_id in list(_ROOMS_BY_USER.get(user_id, ())):
+            index = _INDEXES.get(room_id)
+            if index is None or user_id not in index.name_by_user:
+                continue
+            old_name = index.name_by_user[user_id]
+            if index.user_by_name.get(old_name.lower()) == user_id:
+                del index.user_by_name[old_name.lower()]
+            index.name_by_user[user_id] = str(new_username)
+            index.user_by_name[str(new_username).lower()] = user_id
+
+
+def index_role_changed(room_id: int, role_id: int):
+    # Refresh one role (created, renamed, toggled or deleted).
+    room_id, role_id = int(room_id), int(role_id)
+    with _INDEX_LOCK:
+        _bump_generation(room_id)
+        if room_id not in _INDEXES:
+            return
+    row = (
+        db.session.query(Role.id, Role.mention_tag, Role.can_be_mentioned_by_everyone)
+        .filter(Role.id == role_id, Role.room_id == room_id)
+        .first()
+    )
+    with _INDEX_LOCK:
+        index = _INDEXES.get(room_id)
+        if index is None:
+            return
+        if row is None:
+            index.remove_role(role_id)
+            index.drop_role_members(role_id)
+        else:
+            index.set_role(IndexedRole(*row))
+
+
+def drop_room_mention_index(room_id: int):
+    with _INDEX_LOCK:
+        _bump_generation(int(room_id))
+        _forget_room(int(room_id))
+
+
+def clear_mention_indexes():
+    with _INDEX_LOCK:
+        _GLOBAL_GENERATION[0] += 1
+        _INDEXES.clear()
+        _ROOMS_BY_USER.clear()
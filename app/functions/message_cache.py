@@ -0,0 +1,297 @@
+# Hot-channel tail cache
+#
+# Keeps the newest N serialized messages of recently read channels in memory
+# so the first history page (`GET /api/v1/channel/<id>/messages` without a
+# cursor) skips the ORM query and serialization. Entries are viewer-neutral:
+# the per-viewer `me` reaction flag is filled in at read time.
+#
+# A tail is loaded on the first miss and then kept current by the write paths
+# (new message, edit, reaction, profile change). Deletes drop the channel tail
+# instead of patching it, so a tail never has holes. Channels are LRU-evicted
+# once the estimated size of all tails exceeds the memory budget.
+
+import json
+import os
+import threading
+from collections import OrderedDict, deque
+from app.extensions import db
+from app.models import Message, MessageReaction
+from app.functions.reactions import get_reaction_summaries
+
+
+def tail_cache_size() -> int:
+    # Messages kept per channel; 0 disables the cache.
+    try:
+        return max(0, int(os.environ.get('BOXCHAT_TAIL_CACHE_MESSAGES') or 100))
+    except Exception:
+        return 100
+
+
+def _tail_cache_budget() -> int:
+    try:
+        return max(0, int(os.environ.get('BOXCHAT_TAIL_CACHE_BYTES') or 32 * 1024 * 1024))
+    except Exception:
+        return 32 * 1024 * 1024
+
+
+def serialize_history_message(msg, reactions=None, author=None):
+    # Shape used by the message history API (and cached tails).
+    user = author if author is not None else msg.user
+    return {
+        'id': msg.id,
+        'user_id': msg.user_id,
+        'username': user.username if user else 'Unknown',
+        'avatar_url': user.avatar_url if user else None,
+        'content': msg.content,
+        'message_type': msg.message_type,
+        'timestamp': msg.timestamp.isoformat() if msg.timestamp else None,
+        'edited_at': msg.edited_at.isoformat() if msg.edited_at else None,
+        'file_url': msg.file_url,
+        'file_name': msg.file_name,
+        'file_size': msg.file_size,
+        'reactions': reactions or {},
+        'reply_to_id': msg.reply_to_id
+    }
+
+
+def _estimate_size(item) -> int:
+    try:
+        return len(json.dumps(item, ensure_ascii=False, default=str)) + 64
+    except Exception:
+        return 1024
+
+
+class ChannelTail:
+    __slots__ = ('channel_id', 'messages', 'sizes', 'reaches_start', 'bytes')
+
+    def __init__(self, channel_id, capacity):
+        self.channel_id = int(channel_id)
+        self.messages = deque(maxlen=capacity)  # oldest -> newest
+        self.sizes = deque(maxlen=capacity)
+        self.reaches_start = False  # True when no older messages exist
+        self.bytes = 0
+
+    def append(self, item):
+        if self.messages and self.messages.maxlen == len(self.messages):
+            self.bytes -= self.sizes[0]
+            self.reaches_start = False
+        size = _estimate_size(item)
+        self.messages.append(item)
+        self.sizes.append(size)
+        self.bytes += size
+
+    def find(self, message_id):
+        message_id = int(message_id)
+        for idx in range(len(self.messages) - 1, -1, -1):
+            if int(self.messages[idx]['id']) == message_id:
+                return idx
+        return None
+
+    def replace(self, idx, item):
+        size = _estimate_size(item)
+        self.bytes += size - self.sizes[idx]
+        self.messages[idx] = item
+        self.sizes[idx] = size
+
+
+_TAILS = OrderedDict()  # channel_id -> ChannelTail, LRU order
+_TAIL_LOCK = threading.Lock()
+_TAIL_STATS = {'hits': 0, 'misses': 0, 'bypass': 0, 'evictions': 0, 'invalidations': 0}
+# Bumped by every write hook; a tail loaded while its channel changed is not stored.
+_CHANNEL_VERSIONS = {}
+_GLOBAL_VERSION = [0]
+
+
+def _version(channel_id):
+    return (_GLOBAL_VERSION[0], _CHANNEL_VERSIONS.get(channel_id, 0))
+
+
+def _bump(channel_id=None):
+    if channel_id is None:
+        _GLOBAL_VERSION[0] += 1
+    else:
+        _CHANNEL_VERSIONS[channel_id] = _CHANNEL_VERSIONS.get(channel_id, 0) + 1
+
+
+def _total_bytes() -> int:
+    return sum(tail.bytes for tail in _TAILS.values())
+
+
+def _enforce_budget():
+    budget = _tail_cache_budget()
+    total = _total_bytes()
+    while _TAILS and total > budget:
+        _channel_id, tail = _TAILS.popitem(last=False)
+        total -= tail.bytes
+        _TAIL_STATS['evictions'] += 1
+
+
+def _load_tail(channel_id, capacity):
+    from sqlalchemy.orm import joinedload
+
+    rows = (
+        Message.query.filter_by(channel_id=channel_id)
+        .options(joinedload(Message.user))
+        .order_by(Message.id.desc())
+        .limit(capacity + 1)
+        .all()
+    )
+    tail = ChannelTail(channel_id, capacity)
+    newest = list(reversed(rows[:capacity]))
+    summaries = get_reaction_summaries([m.id for m in newest])
+    for msg in newest:
+        tail.append(serialize_history_message(msg, summaries.get(msg.id)))
+    tail.reaches_start = len(rows) <= capacity
+    return tail
+
+
+def get_channel_tail_page(channel_id, limit, viewer_id=None):
+    # Newest `limit` messages as (items, has_more_before), or None when not servable.
+    capacity = tail_cache_size()
+    if capacity <= 0 or limit > capacity:
+        with _TAIL_LOCK:
+            _TAIL_STATS['bypass'] += 1
+        return None
+    channel_id = int(channel_id)
+
+    with _TAIL_LOCK:
+        tail = _TAILS.get(channel_id)
+        if tail is not None:
+            _TAILS.move_to_end(channel_id)
+            _TAIL_STATS['hits'] += 1
+            items = list(tail.messages)[-limit:]
+            has_more_before = len(tail.messages) > limit or not tail.reaches_start
+        else:
+            _TAIL_STATS['misses'] += 1
+            version = _version(channel_id)
+
+    if tail is None:
+        tail = _load_tail(channel_id, capacity)
+        with _TAIL_LOCK:
+            if _version(channel_id) == version:
+                _TAILS[channel_id] = tail
+                _TAILS.move_to_end(channel_id)
+                _enforce_budget()
+            items = list(tail.messages)[-limit:]
+            has_more_before = len(tail.messages) > limit or not tail.reaches_start
+
+    # Copy entries (they are shared) and fill in the viewer's own reactions.
+    items = [dict(item, reactions={e: dict(r) for e, r in (item.get('reactions') or {}).items()}) for item in items]
+    if viewer_id is not None and items:
+        ids = [int(item['id']) for item in items if item.get('reactions')]
+        mine = set()
+        if ids:
+            mine = {
+                (int(message_id), emoji) for message_id, emoji in
+                db.session.query(MessageReaction.message_id, MessageReaction.emoji)
+                .filter(MessageReaction.message_id.in_(ids), MessageReaction.user_id == int(viewer_id))
+                .all()
+            }
+        for item in items:
+            for emoji, summary in item['reactions'].items():
+                summary['me'] = (int(item['id']), emoji) in mine
+    return items, has_more_before
+
+
+def tail_message_added(msg, author=None):
+    # Append a freshly written message if its channel tail is cached.
+    channel_id = int(msg.channel_id)
+    item = serialize_history_message(msg, author=author)
+    with _TAIL_LOCK:
+        _bump(channel_id)
+        tail = _TAILS.get(channel_id)
+        if tail is None:
+            return
+        if tail.messages and int(tail.messages[-1]['id']) >= int(msg.id):
+            # Appended out of id order (concurrent senders): reload on next read.
+            _TAILS.pop(channel_id, None)
+            _TAIL_STATS['invalidations'] += 1
+            return
+        tail.append(item)
+        _enforce_budget()
+
+
+def tail_message_edited(channel_id, message_id, content, edited_at=None):
+    with _TAIL_LOCK:
+        _bump(int(channel_id))
+        tail = _TAILS.get(int(channel_id))
+        idx = tail.find(message_id) if tail is not None else None
+        if idx is None:
+            return
+        item = dict(tail.messages[idx])
+        item['content'] = content
+        item['edited_at'] = edited_at.isoformat() if edited_at else item.get('edited_at')
+        tail.replace(idx, item)
+
+
+def tail_reactions_changed(channel_id, message_id):
+    channel_id = int(channel_id)
+    with _TAIL_LOCK:
+        _bump(channel_id)
+        tail = _TAILS.get(channel_id)
+        if tail is None or tail.find(message_id) is None:
+            return
+        version = _version(channel_id)
+    summary = get_reaction_summaries([message_id]).get(int(message_id), {})
+    with _TAIL_LOCK:
+        if _version(channel_id) != version:
+            # Another change raced this one; the summary may be stale.
+            if _TAILS.pop(channel_id, None) is not None:
+                _TAIL_STATS['invalidations'] += 1
+            return
+        tail = _TAILS.get(channel_id)
+        idx = tail.find(message_id) if tail is not None else None
+        if idx is None:
+            return
+        item = dict(tail.messages[idx])
+        item['reactions'] = summary
+        tail.replace(idx, item)
+
+
+def tail_user_profile_changed(user_id, username=None, avatar_url=None):
+    # Patch author fields in every cached tail (rename / avatar change).
+    user_id = int(user_id)
+    with _TAIL_LOCK:
+        _bump()
+        for tail in _TAILS.values():
+            for idx, item in enumerate(tail.messages):
+                if int(item.get('user_id') or 0) != user_id:
+                    continue
+                item = dict(item)
+                if username is not None:
+                    item['username'] = username
+                if avatar_url is not None:
+                    item['avatar_url'] = avatar_url
+                tail.replace(idx, item)
+
+
+def drop_channel_tail(channel_id):
+    with _TAIL_LOCK:
+        _bump(int(channel_id))
+        if _TAILS.pop(int(channel_id), None) is not None:
+            _TAIL_STATS['invalidations'] += 1
+
+
+def drop_channel_tails(channel_ids):
+    for channel_id in channel_ids or []:
+        drop_channel_tail(channel_id)
+
+
+def clear_tail_cache():
+    with _TAIL_LOCK:
+        _bump()
+        _TAILS.clear()
+
+
+def get_tail_cache_stats():
+    with _TAIL_LOCK:
+        lookups = _TAIL_STATS['hits'] + _TAIL_STATS['misses']
+        return {
+            **_TAIL_STATS,
+            'hit_ratio': round(_TAIL_STATS['hits'] / lookups, 4) if lookups else None,
+            'channels': len(_TAILS),
+            'messages': sum(len(tail.messages) for tail in _TAILS.values()),
+            'bytes': _total_bytes(),
+            'budget_bytes': _tail_cache_budget(),
+            'capacity_per_channel': tail_cache_size(),
+        }
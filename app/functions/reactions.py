@@ -0,0 +1,118 @@
+# Reaction summaries
+#
+# Message payloads carry a compact summary per emoji instead of every reacting
+# username: {emoji: {'count': n, 'me': bool, 'users': [first few usernames]}}.
+# Everything is aggregated in SQL (GROUP BY + a ROW_NUMBER() window for the
+# preview names), so cost no longer grows with the number of reactions.
+# The full list of reactors is served page by page by list_message_reactors.
+
+import os
+from app.extensions import db
+from app.models import MessageReaction, User
+
+
+def reaction_preview_size() -> int:
+    try:
+        return max(0, int(os.environ.get('BOXCHAT_REACTION_PREVIEW_USERS') or 3))
+    except Exception:
+        return 3
+
+
+def get_reaction_summaries(message_ids, viewer_id=None):
+    # Returns {message_id: {emoji: summary}} for the given messages (3 queries total).
+    message_ids = [int(mid) for mid in message_ids or []]
+    result = {mid: {} for mid in message_ids}
+    if not message_ids:
+        return result
+
+    counts = (
+        db.session.query(
+            MessageReaction.message_id,
+            MessageReaction.emoji,
+            db.func.count(MessageReaction.id),
+            db.func.min(MessageReaction.id).label('first_id'),
+        )
+        .filter(MessageReaction.message_id.in_(message_ids))
+        .group_by(MessageReaction.message_id, MessageReaction.emoji)
+        .order_by(MessageReaction.message_id, 'first_id')
+        .all()
+    )
+    if not counts:
+        return result
+    for message_id, emoji, count, _first_id in counts:
+        result[int(message_id)][emoji] = {'count': int(count), 'me': False, 'users': []}
+
+    if viewer_id is not None:
+        for message_id, emoji in (
+            db.session.query(MessageReaction.message_id, MessageReaction.emoji)
+            .filter(MessageReaction.message_id.in_(message_ids), MessageReaction.user_id == int(viewer_id))
+            .all()
+        ):
+            summary = result.get(int(message_id), {}).get(emoji)
+            if summary is not None:
+                summary['me'] = True
+
+    preview = reaction_preview_size()
+    if preview:
+        ranked = (
+            db.session.query(
+                MessageReaction.message_id.label('message_id'),
+                MessageReaction.emoji.label('emoji'),
+                User.username.label('username'),
+                db.func.row_number().over(
+                    partition_by=(MessageReaction.message_id, MessageReaction.emoji),
+                    order_by=MessageReaction.id,
+                ).label('rn'),
+            )
+            .join(User, User.id == MessageReaction.user_id)
+            .filter(MessageReaction.message_id.in_(message_ids))
+            .subquery()
+        )
+        for message_id, emoji, username in (
+            db.session.query(ranked.c.message_id, ranked.c.emoji, ranked.c.username)
+            .filter(ranked.c.rn <= preview)
+            .order_by(ranked.c.message_id, ranked.c.emoji, ranked.c.rn)
+            .all()
+        ):
+            summary = result.get(int(message_id), {}).get(emoji)
+            if summary is not None:
+                summary['users'].append(username)
+    return result
+
+
+def get_reaction_summary(message_id, viewer_id=None):
+    return get_reaction_summaries([message_id], viewer_id).get(int(message_id), {})
+
+
+def count_emoji_reactions(message_id, emoji) -> int:
+    return int(
+        db.session.query(db.func.count(MessageReaction.id))
+        .filter(MessageReaction.message_id == int(message_id), MessageReaction.emoji == emoji)
+        .scalar() or 0
+    )
+
+
+def list_message_reactors(message_id, emoji=None, after_id=None, limit=50):
+    # One page of reactors ordered by reaction id; returns (items, next_cursor).
+    query = (
+        db.session.query(MessageReaction.id, MessageReaction.emoji, User.id, User.username, User.avatar_url)
+        .join(User, User.id == MessageReaction.user_id)
+        .filter(MessageReaction.message_id == int(message_id))
+    )
+    if emoji:
+        query = query.filter(MessageReaction.emoji == emoji)
+    if after_id is not None:
+        query = query.filter(MessageReaction.id > int(after_id))
+    rows = query.order_by(MessageReaction.id.asc()).limit(limit + 1).all()
+    items = [
+        {
+            'reaction_id': int(reaction_id),
+            'emoji': r_emoji,
+            'user_id': int(user_id),
+            'username': username,
+            'avatar_url': avatar_url,
+        }
+        for reaction_id, r_emoji, user_id, username, avatar_url in rows[:limit]
+    ]
+    next_cursor = items[-1]['reaction_id'] if len(rows) > limit and items else None
+    return items, next_cursor
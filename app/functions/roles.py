@@ -1,5 +1,9 @@
+import os
 import re
 import json
+import threading
+from collections import OrderedDict
+from sqlalchemy import text
 from app.extensions import db
 from app.models import Role, MemberRole, RoleMentionPermission, Member
 
@@ -78,25 +82,212 @@ def ensure_user_default_roles(user_id: int, room_id: int):
 
 
 def seed_roles_for_existing_rooms():
-    members = Member.query.all()
-    seen_room_ids = set()
-    for m in members:
-        if m.room_id not in seen_room_ids:
-            ensure_default_roles(m.room_id)
-            seen_room_ids.add(m.room_id)
-        ensure_user_default_roles(m.user_id, m.room_id)
+    # Set-based backfill of the default role data for every room with members:
+    # missing `everyone`/`admin` roles, then missing member -> role links
+    # (everyone for all members, admin for owners/admins). A handful of
+    # INSERT ... SELECT statements regardless of the number of memberships.
+    # Returns rows inserted per step.
+    inserted = {}
+    for tag, permissions in (('everyone', '[]'), ('admin', json.dumps(list(ROLE_PERMISSION_KEYS)))):
+        inserted[f'{tag}_roles'] = db.session.execute(text("""
+            INSERT INTO role (room_id, name, mention_tag, is_system, can_be_mentioned_by_everyone, permissions_json, created_at)
+            SELECT rooms.room_id, :tag, :tag, 1, 0, :permissions, CURRENT_TIMESTAMP
+            FROM (SELECT DISTINCT room_id FROM member) AS rooms
+            WHERE NOT EXISTS (SELECT 1 FROM role r WHERE r.room_id = rooms.room_id AND r.mention_tag = :tag)
+        """), {'tag': tag, 'permissions': permissions}).rowcount
+
+    db.session.execute(text("""
+        UPDATE role SET permissions_json = :permissions
+        WHERE mention_tag = 'admin' AND (permissions_json IS NULL OR permissions_json = '')
+    """), {'permissions': json.dumps(list(ROLE_PERMISSION_KEYS))})
+
+    # The first role with the tag is the room's default role (as in ensure_default_roles).
+    for tag, member_filter in (('everyone', ''), ('admin', "AND mb.role IN ('owner', 'admin')")):
+        inserted[f'{tag}_links'] = db.session.execute(text(f"""
+            INSERT INTO member_role (user_id, room_id, role_id, assigned_at)
+            SELECT DISTINCT mb.user_id, mb.room_id, dr.role_id, CURRENT_TIMESTAMP
+            FROM member mb
+            JOIN (
+                SELECT room_id, MIN(id) AS role_id FROM role WHERE mention_tag = :tag GROUP BY room_id
+            ) AS dr ON dr.room_id = mb.room_id
+            WHERE NOT EXISTS (
+                SELECT 1 FROM member_role mr
+                WHERE mr.user_id = mb.user_id AND mr.room_id = mb.room_id AND mr.role_id = dr.role_id
+            ) {member_filter}
+        """), {'tag': tag}).rowcount
     db.session.commit()
+    return inserted
+
+
+class PermissionContext:
+    # Resolved permission state of one user in one room (immutable snapshot).
+    __slots__ = ('user_id', 'room_id', 'member_role', 'role_ids', 'permissions', 'mentionable_role_ids')
+
+    def __init__(self, user_id, room_id, member_role=None, role_ids=(), permissions=(), mentionable_role_ids=()):
+        self.user_id = int(user_id)
+        self.room_id = int(room_id)
+        self.member_role = member_role
+        self.role_ids = frozenset(role_ids)
+        self.permissions = frozenset(permissions)
+        self.mentionable_role_ids = frozenset(mentionable_role_ids)
+
+    @property
+    def is_member(self):
+        return self.member_role is not None
+
+    @property
+    def is_room_admin(self):
+        return self.member_role in ('owner', 'admin')
+
+    def has_permission(self, permission_key: str):
+        if permission_key not in ROLE_PERMISSION_KEYS or not self.is_member:
+            return False
+        return self.is_room_admin or permission_key in self.permissions
+
+    def can_mention_role(self, target_role: Role):
+        if not self.is_member:
+            return False
+        # Owners/admins can mention any role
+        if self.is_room_admin:
+            return True
+        if target_role.can_be_mentioned_by_everyone:
+            return True
+        return int(target_role.id) in self.mentionable_role_ids
+
+
+def _permission_cache_size() -> int:
+    try:
+        return max(0, int(os.environ.get('BOXCHAT_PERMISSION_CACHE_SIZE') or 10000))
+    except Exception:
+        return 10000
+
+
+_PERMISSION_CACHE = OrderedDict()  # (user_id, room_id) -> PermissionContext, LRU order
+_PERMISSION_CACHE_BY_ROOM = {}  # room_id -> set(user_id)
+_PERMISSION_CACHE_LOCK = threading.Lock()
+# Bumped by invalidations; a context loaded while its key, room or the whole
+# cache was invalidated is not stored (it may predate the change).
+_PERMISSION_KEY_GENERATIONS = {}  # (user_id, room_id) -> int
+_PERMISSION_ROOM_GENERATIONS = {}  # room_id -> int
+_PERMISSION_GLOBAL_GENERATION = [0]
+
+
+def _generation(key):
+    return (
+        _PERMISSION_GLOBAL_GENERATION[0],
+        _PERMISSION_ROOM_GENERATIONS.get(key[1], 0),
+        _PERMISSION_KEY_GENERATIONS.get(key, 0),
+    )
+
+
+def _bump_generation(generations, key):
+    generations[key] = generations.get(key, 0) + 1
+    if len(generations) > 2 * max(1, _permission_cache_size()):
+        # Keep the counters bounded: forgetting them is safe once every
+        # load in flight is made stale by the global generation.
+        generations.clear()
+        _PERMISSION_GLOBAL_GENERATION[0] += 1
+
+
+def _cache_forget(key):
+    ctx = _PERMISSION_CACHE.pop(key, None)
+    users = _PERMISSION_CACHE_BY_ROOM.get(key[1])
+    if users is not None:
+        users.discard(key[0])
+        if not users:
+            _PERMISSION_CACHE_BY_ROOM.pop(key[1], None)
+    return ctx
+
+
+def _load_permission_context(user_id: int, room_id: int):
+    member = Member.query.filter_by(user_id=user_id, room_id=room_id).first()
+    if not member:
+        return PermissionContext(user_id, room_id)
+
+    rows = (
+        db.session.query(MemberRole.role_id, Role.room_id, Role.permissions_json)
+        .outerjoin(Role, Role.id == MemberRole.role_id)
+        .filter(MemberRole.user_id == user_id, MemberRole.room_id == room_id)
+        .all()
+    )
+    role_ids = set()
+    permissions = set()
+    for role_id, role_room_id, permissions_json in rows:
+        role_ids.add(int(role_id))
+        if role_room_id is not None and int(role_room_id) == int(room_id):
+            permissions |= _parse_permissions_json(permissions_json)
+
+    mentionable = set()
+    if role_ids and member.role not in ('owner', 'admin'):
+        mentionable = {
+            int(target_id) for (target_id,) in
+            db.session.query(RoleMentionPermission.target_role_id).filter(
+                RoleMentionPermission.room_id == room_id,
+                RoleMentionPermission.source_role_id.in_(sorted(role_ids)),
+            ).all()
+        }
+    return PermissionContext(user_id, room_id, member.role or 'member', role_ids, permissions, mentionable)
+
+
+def get_permission_context(user_id: int, room_id: int):
+    key = (int(user_id), int(room_id))
+    with _PERMISSION_CACHE_LOCK:
+        ctx = _PERMISSION_CACHE.get(key)
+        if ctx is not None:
+            _PERMISSION_CACHE.move_to_end(key)
+            return ctx
+        generation = _generation(key)
+
+    ctx = _load_permission_context(key[0], key[1])
+
+    max_size = _permission_cache_size()
+    if max_size > 0:
+        with _PERMISSION_CACHE_LOCK:
+            if _generation(key) != generation:
+                # Invalidated while loading: use it for this call only.
+                return ctx
+            _PERMISSION_CACHE[key] = ctx
+            _PERMISSION_CACHE.move_to_end(key)
+            _PERMISSION_CACHE_BY_ROOM.setdefault(key[1], set()).add(key[0])
+            while len(_PERMISSION_CACHE) > max_size:
+                _cache_forget(next(iter(_PERMISSION_CACHE)))
+    return ctx
+
+
+def invalidate_permission_context(user_id: int, room_id: int):
+    key = (int(user_id), int(room_id))
+    with _PERMISSION_CACHE_LOCK:
+        _bump_generation(_PERMISSION_KEY_GENERATIONS, key)
+        _cache_forget(key)
+
+
+def invalidate_room_permission_contexts(room_id: int, role_ids=None):
+    # Drop cached contexts of a room; with role_ids only those holding one of the roles.
+    room_id = int(room_id)
+    role_ids = {int(r) for r in role_ids} if role_ids is not None else None
+    with _PERMISSION_CACHE_LOCK:
+        # Loads in flight cannot be filtered by role yet: all of the room's are stale.
+        _bump_generation(_PERMISSION_ROOM_GENERATIONS, room_id)
+        for uid in list(_PERMISSION_CACHE_BY_ROOM.get(room_id, ())):
+            ctx = _PERMISSION_CACHE.get((uid, room_id))
+            if ctx is None or role_ids is None or (ctx.role_ids & role_ids):
+                _cache_forget((uid, room_id))
+
+
+def clear_permission_cache():
+    with _PERMISSION_CACHE_LOCK:
+        _PERMISSION_GLOBAL_GENERATION[0] += 1
+        _PERMISSION_CACHE.clear()
+        _PERMISSION_CACHE_BY_ROOM.clear()
 
 
 def get_user_role_ids(user_id: int, room_id: int):
-    links = MemberRole.query.filter_by(user_id=user_id, room_id=room_id).all()
-    return {link.role_id for link in links}
+    return set(get_permission_context(user_id, room_id).role_ids)
 
 
-def parse_role_permissions(role: Role):
-    raw = getattr(role, 'permissions_json', None) or '[]'
+def _parse_permissions_json(raw):
     try:
-        parsed = json.loads(raw)
+        parsed = json.loads(raw or '[]')
         if not isinstance(parsed, list):
             return set()
         return {str(x) for x in parsed if str(x) in ROLE_PERMISSION_KEYS}
@@ -104,52 +295,22 @@ def parse_role_permissions(role: Role):
         return set()
 
 
+def parse_role_permissions(role: Role):
+    return _parse_permissions_json(getattr(role, 'permissions_json', None))
+
+
 def get_user_permissions(user_id: int, room_id: int):
-    member = Member.query.filter_by(user_id=user_id, room_id=room_id).first()
-    if not member:
+    ctx = get_permission_context(user_id, room_id)
+    if not ctx.is_member:
         return set()
-    if member.role in ('owner', 'admin'):
+    if ctx.is_room_admin:
         return set(ROLE_PERMISSION_KEYS)
-    role_ids = get_user_role_ids(user_id, room_id)
-    if not role_ids:
-        return set()
-    roles = Role.query.filter(Role.room_id == room_id, Role.id.in_(list(role_ids))).all()
-    permissions = set()
-    for role in roles:
-        permissions |= parse_role_permissions(role)
-    return permissions
+    return set(ctx.permissions)
 
 
 def user_has_room_permission(user_id: int, room_id: int, permission_key: str):
-    if permission_key not in ROLE_PERMISSION_KEYS:
-        return False
-    member = Member.query.filter_by(user_id=user_id, room_id=room_id).first()
-    if not member:
-        return False
-    if member.role in ('owner', 'admin'):
-        return True
-    return permission_key in get_user_permissions(user_id, room_id)
+    return get_permission_context(user_id, room_id).has_permission(permission_key)
 
 
 def can_user_mention_role(user_id: int, room_id: int, target_role: Role):
-    member = Member.query.filter_by(user_id=user_id, room_id=room_id).first()
-    if not member:
-        return False
-
-    # Owners/admins can mention any role
-    if member.role in ('owner', 'admin'):
-        return True
-
-    if target_role.can_be_mentioned_by_everyone:
-        return True
-
-    user_role_ids = get_user_role_ids(user_id, room_id)
-    if not user_role_ids:
-        return False
-
-    permission = RoleMentionPermission.query.filter(
-        RoleMentionPermission.room_id == room_id,
-        RoleMentionPermission.target_role_id == target_role.id,
-        RoleMentionPermission.source_role_id.in_(list(user_role_ids))
-    ).first()
-    return permission is not None
+    return get_permission_context(user_id, room_id).can_mention_role(target_role)
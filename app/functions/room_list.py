@@ -0,0 +1,147 @@
+# Room list of one user (sidebar payload)
+#
+# Shared by `GET /api/v1/rooms` and `GET /api/v1/bootstrap`: every room the
+# user is a member of with its channels, the caller's role and effective
+# permissions, member count, unread counters and, for DMs, the partner.
+
+import json
+from sqlalchemy import func
+from sqlalchemy.orm import subqueryload
+from app.extensions import db
+from app.models import User, Room, Member, MemberRole, Role
+from app.functions.roles import ROLE_PERMISSION_KEYS, parse_role_permissions
+from app.functions.unread import get_unread_counts
+
+
+def _member_counts(room_ids):
+    # room_id -> member count, one grouped query over ix_member_room_user.
+    if not room_ids:
+        return {}
+    rows = (
+        db.session.query(Member.room_id, func.count(Member.id))
+        .filter(Member.room_id.in_(room_ids))
+        .group_by(Member.room_id)
+        .all()
+    )
+    return {int(room_id): int(count or 0) for room_id, count in rows}
+
+
+def _dm_partners(user_id, room_ids):
+    # room_id -> the other member's User for the given DM rooms.
+    if not room_ids:
+        return {}
+    partners = {}
+    for room_id, user in (
+        db.session.query(Member.room_id, User)
+        .join(User, User.id == Member.user_id)
+        .filter(Member.room_id.in_(room_ids), Member.user_id != user_id)
+        .order_by(Member.id.asc())
+        .all()
+    ):
+        partners.setdefault(int(room_id), user)
+    return partners
+
+
+def serialize_user_rooms(user_id):
+    # Only the caller's own Member rows are loaded; other members are counted
+    # in SQL (a user in a few 50k-member servers must not pull every Member).
+    user_id = int(user_id)
+    rooms = []
+    room_to_my_member = {}
+    for room, my_member in (
+        db.session.query(Room, Member)
+        .join(Member, Member.room_id == Room.id)
+        .filter(Member.user_id == user_id)
+        .options(subqueryload(Room.channels))
+        .order_by(Room.id.asc(), Member.id.asc())
+        .all()
+    ):
+        if int(room.id) in room_to_my_member:
+            continue
+        rooms.append(room)
+        room_to_my_member[int(room.id)] = my_member
+
+    room_ids = [int(r.id) for r in rooms]
+    member_counts = _member_counts(room_ids)
+    dm_partners = _dm_partners(user_id, [int(r.id) for r in rooms if r.type == 'dm'])
+
+    # Preload role links for the user across all rooms to avoid N+1.
+    room_to_role_ids: dict[int, set[int]] = {}
+    all_role_ids: set[int] = set()
+    if room_ids:
+        for link in MemberRole.query.filter(
+            MemberRole.user_id == user_id,
+            MemberRole.room_id.in_(room_ids),
+        ).all():
+            rid = int(getattr(link, 'role_id', 0) or 0)
+            rm = int(getattr(link, 'room_id', 0) or 0)
+            if rid and rm:
+                room_to_role_ids.setdefault(rm, set()).add(rid)
+                all_role_ids.add(rid)
+
+    role_by_id = {}
+    if all_role_ids:
+        role_by_id = {int(r.id): r for r in Role.query.filter(Role.id.in_(sorted(all_role_ids))).all()}
+
+    unread_by_channel = get_unread_counts(user_id)
+
+    rooms_data = []
+    for room in rooms:
+        room_id = int(room.id)
+        my_member = room_to_my_member.get(room_id)
+
+        # Compute permissions without extra DB roundtrips.
+        if my_member and str(getattr(my_member, 'role', 'member') or 'member') in {'owner', 'admin'}:
+            perms = set(ROLE_PERMISSION_KEYS)
+        else:
+            perms = set()
+            for rid in room_to_role_ids.get(room_id, set()):
+                role = role_by_id.get(int(rid))
+                if role and int(getattr(role, 'room_id', 0) or 0) == room_id:
+                    perms |= parse_role_permissions(role)
+
+        room_name = room.name
+        dm_partner = None
+        if room.type == 'dm':
+            other = dm_partners.get(room_id)
+            if other is not None:
+                dm_partner = {
+                    'id': int(other.id),
+                    'username': other.username,
+                    'avatar_url': other.avatar_url or 'https://placehold.co/50x50',
+                }
+                if other.username:
+                    room_name = other.username
+
+        room_dict = {
+            'id': room_id,
+            'name': room_name,
+            'type': room.type,
+            'my_role': getattr(my_member, 'role', None) if my_member else 'member',
+            'my_permissions': sorted(list(perms)),
+            'is_public': bool(room.is_public),
+            'description': getattr(room, 'description', None) or '',
+            'avatar_url': room.avatar_url,
+            'banner_url': getattr(room, 'banner_url', None),
+            'member_count': member_counts.get(room_id, 0),
+            'dm_partner': dm_partner,
+            'unread_count': 0,
+            'channels': []
+        }
+
+        for channel in (room.channels or []):
+            channel_dict = {
+                'id': channel.id,
+                'name': channel.name,
+                'description': channel.description,
+                'icon_emoji': channel.icon_emoji,
+                'icon_image_url': channel.icon_image_url,
+                'writer_role_ids': json.loads(channel.writer_role_ids_json or '[]') if getattr(channel, 'writer_role_ids_json', None) else [],
+                'unread_count': unread_by_channel.get(int(channel.id), 0),
+            }
+            room_dict['unread_count'] += channel_dict['unread_count']
+            room_dict['channels'].append(channel_dict)
+
+        rooms_data.append(room_dict)
+
+    return rooms_data
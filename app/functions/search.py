@@ -0,0 +1,198 @@
+# Full-text message search (SQLite FTS5)
+#
+# `message_fts` is an external-content FTS5 index over message.content created
+# by migration 13 and kept in sync by triggers. Searches are scoped to channels
+# of rooms the caller is a member of and paginated with keyset cursors:
+#   sort=relevance -> ORDER BY bm25, id   cursor "<score>:<id>"
+#   sort=recent    -> ORDER BY id DESC    cursor "<id>"
+# `recent` streams the index newest-first and stops after one page. bm25()
+# walks the full posting list of every query word to get its document
+# frequency, so a word found in more than BOXCHAT_SEARCH_RANK_MAX_HITS messages
+# (a stop word, in effect) makes relevance fall back to `recent`. Snippets are
+# computed for the returned page only.
+
+import html
+import os
+import re
+from sqlalchemy import DateTime, text
+from app.extensions import db
+
+_MARK_OPEN = '\ue000'  # private-use chars: cannot collide with HTML escaping
+_MARK_CLOSE = '\ue001'
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_rank_max_hits() -> int:
+    # Relevance ranking is skipped for queries with a word more common than this.
+    try:
+        return max(0, int(os.environ.get('BOXCHAT_SEARCH_RANK_MAX_HITS') or 10000))
+    except Exception:
+        return 10000
+
+
+def fts_available() -> bool:
+    try:
+        row = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_fts'")
+        ).first()
+        return row is not None
+    except Exception:
+        return False
+
+
+def _fts_phrases(raw: str):
+    # Every word quoted (no operator injection). A trailing `*` asks for a prefix
+    # match on the last word; it is opt-in because FTS5 materializes the merged
+    # posting list of a prefix, which is slow for prefixes of very common words.
+    tokens = _TOKEN_RE.findall(raw or '')[:12]
+    phrases = [f'"{t}"' for t in tokens]
+    if phrases and (raw or '').rstrip().endswith('*'):
+        phrases[-1] = phrases[-1] + '*'
+    return phrases
+
+
+def build_fts_query(raw: str):
+    # Free text -> safe FTS5 expression (implicit AND of the words), or None.
+    phrases = _fts_phrases(raw)
+    return ' '.join(phrases) if phrases else None
+
+
+def _has_common_phrase(phrases, max_hits) -> bool:
+    # Probe each word's posting list up to `max_hits` rows (cheap, streamed).
+    for phrase in phrases:
+        hits = db.session.execute(
+            text('SELECT COUNT(*) FROM (SELECT rowid FROM message_fts WHERE message_fts MATCH :phrase LIMIT :cap)'),
+            {'phrase': phrase, 'cap': max_hits + 1},
+        ).scalar()
+        if int(hits or 0) > max_hits:
+            return True
+    return False
+
+
+def _render_snippet(raw):
+    # Escape message text, then turn the private-use markers into <mark> tags.
+    escaped = html.escape(raw or '')
+    return escaped.replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>')
+
+
+def parse_search_cursor(raw: str):
+    # "<score>:<id>" continues a relevance listing, "<id>" a recency listing.
+    if not raw:
+        return None
+    try:
+        if ':' not in raw:
+            return (int(raw),)
+        score, message_id = raw.rsplit(':', 1)
+        return (float(score), int(message_id))
+    except Exception:
+        return None
+
+
+def search_messages(user_id, query, sort='relevance', room_id=None, channel_id=None, cursor=None, limit=20):
+    # Returns (items, next_cursor, sort); `sort` is the order actually used.
+    # items: id, channel_id, room_id, user_id, username, timestamp, snippet, score.
+    phrases = _fts_phrases(query)
+    if not phrases:
+        return [], None, sort
+    match = ' '.join(phrases)
+    if cursor is not None and len(cursor) == 1:
+        sort = 'recent'
+    if sort != 'recent':
+        max_hits = search_rank_max_hits()
+        if max_hits <= 0 or _has_common_phrase(phrases, max_hits):
+            sort = 'recent'
+            # A relevance cursor cannot continue a recency listing.
+            if cursor is not None and len(cursor) != 1:
+                cursor = None
+
+    params = {'match': match, 'uid': int(user_id), 'limit': int(limit) + 1}
+    scope = [
+        'm.channel_id IN (SELECT c.id FROM channel c JOIN member mb ON mb.room_id = c.room_id '
+        "WHERE mb.user_id = :uid AND COALESCE(mb.role, 'member') != 'banned')"
+    ]
+    if room_id is not None:
+        scope.append('m.channel_id IN (SELECT id FROM channel WHERE room_id = :room_id)')
+        params['room_id'] = int(room_id)
+    if channel_id is not None:
+        scope.append('m.channel_id = :channel_id')
+        params['channel_id'] = int(channel_id)
+    scope_sql = ' AND '.join(scope)
+
+    if sort == 'recent':
+        keyset = ''
+        if cursor:
+            keyset = 'AND message_fts.rowid < :before_id'
+            params['before_id'] = cursor[0]
+        sql = f"""
+            SELECT m.id AS id, 0.0 AS score
+            FROM message_fts JOIN message m ON m.id = message_fts.rowid
+            WHERE message_fts MATCH :match AND {scope_sql} {keyset}
+            ORDER BY message_fts.rowid DESC
+            LIMIT :limit
+        """
+    else:
+        keyset = ''
+        if cursor:
+            keyset = 'WHERE score > :after_score OR (score = :after_score AND id > :after_id)'
+            params['after_score'], params['after_id'] = cursor
+        sql = f"""
+            SELECT id, score FROM (
+                SELECT m.id AS id, bm25(message_fts) AS score
+                FROM message_fts JOIN message m ON m.id = message_fts.rowid
+                WHERE message_fts MATCH :match AND {scope_sql}
+            ) {keyset}
+            ORDER BY score ASC, id ASC
+            LIMIT :limit
+        """
+
+    rows = db.session.execute(text(sql), params).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not rows:
+        return [], None, sort
+
+    # Drive the FTS lookups from the page ids (rowid = ? per id) so snippets
+    # never walk the whole posting list of a common term.
+    ids = [int(r.id) for r in rows]
+    id_params = {f'id{i}': mid for i, mid in enumerate(ids)}
+    page_values = ', '.join(f'(:id{i})' for i in range(len(ids)))
+    details = {
+        int(r.id): r for r in db.session.execute(text(f"""
+            WITH page(id) AS (VALUES {page_values})
+            SELECT m.id AS id, m.channel_id AS channel_id, c.room_id AS room_id, m.user_id AS user_id,
+                   u.username AS username, m.timestamp AS timestamp,
+                   snippet(message_fts, 0, :open, :close, '…', 16) AS snippet
+            FROM page
+            CROSS JOIN message_fts ON message_fts.rowid = page.id
+            JOIN message m ON m.id = page.id
+            JOIN channel c ON c.id = m.channel_id
+            LEFT JOIN user u ON u.id = m.user_id
+            WHERE message_fts MATCH :match
+        """).columns(timestamp=DateTime), {'match': match, 'open': _MARK_OPEN, 'close': _MARK_CLOSE, **id_params}).all()
+    }
+
+    items = []
+    for r in rows:
+        d = details.get(int(r.id))
+        if d is None:
+            continue
+        items.append({
+            'id': int(d.id),
+            'channel_id': int(d.channel_id),
+            'room_id': int(d.room_id),
+            'user_id': int(d.user_id),
+            'username': d.username or 'Unknown',
+            # Typed column: a datetime, formatted like the history payloads
+            'timestamp': d.timestamp.isoformat() if d.timestamp else None,
+            'snippet': _render_snippet(d.snippet),
+            'score': float(r.score) if sort != 'recent' else None,
+        })
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        if sort == 'recent':
+            next_cursor = str(int(last.id))
+        else:
+            next_cursor = f'{float(last.score)!r}:{int(last.id)}'
+    return items, next_cursor, sort
@@ -0,0 +1,124 @@
+# Server-side unread counters
+#
+# One UnreadCounter row per (user, channel) holds how many messages by other
+# users arrived after the user's read pointer (ReadMessage). Rows are created
+# lazily: a send bumps every other member of the channel's room with a single
+# INSERT ... SELECT ... ON CONFLICT DO UPDATE, in the same transaction as the
+# message itself. `mark_channel_read` resets the row to 0.
+#
+# Deleting one message decrements the users that had not read it yet; bulk
+# deletes recount the affected channels from the read pointers instead.
+
+from sqlalchemy import text
+from app.extensions import db
+from app.models import UnreadCounter
+
+
+def bump_unread_counters(channel_id, sender_id, count=1):
+    # +count for every member of the channel's room except the sender (caller commits).
+    db.session.execute(text("""
+        INSERT INTO unread_counter (user_id, channel_id, unread_count)
+        SELECT mb.user_id, c.id, :count
+        FROM channel c JOIN member mb ON mb.room_id = c.room_id
+        WHERE c.id = :channel_id AND mb.user_id != :sender_id AND COALESCE(mb.role, 'member') != 'banned'
+        ON CONFLICT (user_id, channel_id) DO UPDATE SET unread_count = unread_count + excluded.unread_count
+    """), {'channel_id': int(channel_id), 'sender_id': int(sender_id), 'count': int(count)})
+
+
+def bump_unread_counters_batch(messages):
+    # messages: (channel_id, sender_id) pairs of one committed batch; one statement per pair.
+    counts = {}
+    for channel_id, sender_id in messages:
+        key = (int(channel_id), int(sender_id))
+        counts[key] = counts.get(key, 0) + 1
+    for (channel_id, sender_id), count in counts.items():
+        bump_unread_counters(channel_id, sender_id, count)
+
+
+def reset_unread_counter(user_id, channel_id):
+    # Caller commits.
+    db.session.execute(text("""
+        INSERT INTO unread_counter (user_id, channel_id, unread_count) VALUES (:user_id, :channel_id, 0)
+        ON CONFLICT (user_id, channel_id) DO UPDATE SET unread_count = 0
+    """), {'user_id': int(user_id), 'channel_id': int(channel_id)})
+
+
+def unread_message_deleted(channel_id, message_id, author_id):
+    # Call before deleting a single message: users who had not read it lose one unread.
+    db.session.execute(text("""
+        UPDATE unread_counter SET unread_count = MAX(unread_count - 1, 0)
+        WHERE channel_id = :channel_id AND user_id != :author_id AND unread_count > 0
+          AND user_id NOT IN (
+              SELECT rm.user_id FROM read_message rm
+              WHERE rm.channel_id = :channel_id AND rm.last_read_message_id >= :message_id
+          )
+    """), {'channel_id': int(channel_id), 'message_id': int(message_id), 'author_id': int(author_id or 0)})
+
+
+def recount_unread_counters(channel_ids):
+    # Recompute counters of the given channels from the read pointers (after bulk deletes).
+    channel_ids = sorted({int(cid) for cid in channel_ids or []})
+    if not channel_ids:
+        return
+    params = {f'c{i}': cid for i, cid in enumerate(channel_ids)}
+    id_list = ', '.join(f':c{i}' for i in range(len(channel_ids)))
+    db.session.execute(text(f"""
+        UPDATE unread_counter SET unread_count = (
+            SELECT COUNT(*) FROM message m
+            WHERE m.channel_id = unread_counter.channel_id
+              AND m.user_id != unread_counter.user_id
+              AND m.id > COALESCE((
+                  SELECT MAX(rm.last_read_message_id) FROM read_message rm
+                  WHERE rm.user_id = unread_counter.user_id AND rm.channel_id = unread_counter.channel_id
+              ), 0)
+        )
+        WHERE channel_id IN ({id_list})
+    """), params)
+
+
+def clear_unread_counters(user_id=None, channel_ids=None):
+    # Drop counters of a user, of channels, or of a user in some channels (caller commits).
+    query = UnreadCounter.query
+    if user_id is not None:
+        query = query.filter(UnreadCounter.user_id == int(user_id))
+    if channel_ids is not None:
+        channel_ids = [int(cid) for cid in channel_ids]
+        if not channel_ids:
+            return
+        query = query.filter(UnreadCounter.channel_id.in_(channel_ids))
+    query.delete(synchronize_session=False)
+
+
+def forget_room_unread_counters(user_id, room_id):
+    # A member left: drop their counters so a later re-join starts from zero.
+    db.session.execute(text("""
+        DELETE FROM unread_counter
+        WHERE user_id = :user_id AND channel_id IN (SELECT id FROM channel WHERE room_id = :room_id)
+    """), {'user_id': int(user_id), 'room_id': int(room_id)})
+    db.session.commit()
+
+
+def get_unread_counts(user_id, channel_ids=None) -> dict:
+    # channel_id -> unread count for one user (channels without a row are 0).
+    query = db.session.query(UnreadCounter.channel_id, UnreadCounter.unread_count).filter(
+        UnreadCounter.user_id == int(user_id)
+    )
+    if channel_ids is not None:
+        channel_ids = [int(cid) for cid in channel_ids]
+        if not channel_ids:
+            return {}
+        query = query.filter(UnreadCounter.channel_id.in_(channel_ids))
+    return {int(cid): int(count or 0) for cid, count in query.all()}
+
+
+def get_channel_unread_counts(channel_id, user_ids) -> dict:
+    # user_id -> unread count in one channel (for personal notifications).
+    user_ids = [int(uid) for uid in user_ids or []]
+    if not user_ids:
+        return {}
+    rows = (
+        db.session.query(UnreadCounter.user_id, UnreadCounter.unread_count)
+        .filter(UnreadCounter.channel_id == int(channel_id), UnreadCounter.user_id.in_(user_ids))
+        .all()
+    )
+    return {int(uid): int(count or 0) for uid, count in rows}
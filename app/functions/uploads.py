@@ -0,0 +1,304 @@
+# Resumable chunked uploads
+#
+# An upload session (UploadSession row + empty part file in
+# <upload folder>/.partial) is created with the final size. The client then
+# PUTs chunk i (chunk_size bytes, the last one shorter) at offset
+# i * chunk_size, in order. Each chunk is copied from the request stream to
+# the part file in small blocks, so memory per upload stays constant whatever
+# the file size, and `received` only advances once the bytes are on disk: a
+# chunk cut off by a dropped connection is truncated away and sent again.
+# The SHA-256 is carried along chunk by chunk in this process (re-read from
+# disk only when another worker took some chunks), and finalizing hands the
+# part file to the content-addressed store (app/functions/blobs.py), which
+# moves it into files/music/videos with os.replace (same filesystem, atomic)
+# or drops it when identical content is already stored; if that fails the
+# session is restored with its part file, so /complete can be retried.
+# Sessions untouched for BOXCHAT_UPLOAD_SESSION_TTL_SECONDS expire together
+# with their part files.
+
+import hashlib
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from werkzeug.utils import secure_filename
+from app.extensions import db
+from app.models import UploadSession
+from app.functions.blobs import PARTIAL_DIR, hash_file, store_blob
+from app.functions.files import allowed_file, upload_target
+from app.utils.write_queue import run_write
+
+_COPY_BLOCK = 64 * 1024
+_EXPIRE_INTERVAL_SECONDS = 60.0
+_last_expire = [0.0]
+# upload id -> (bytes hashed, sha256 state) for sessions receiving chunks here
+_chunk_hashes = OrderedDict()
+_MAX_CHUNK_HASHES = 256
+
+
+def upload_chunk_size() -> int:
+    try:
+        return max(64 * 1024, int(os.environ.get('BOXCHAT_UPLOAD_CHUNK_SIZE') or 8 * 1024 * 1024))
+    except Exception:
+        return 8 * 1024 * 1024
+
+
+def upload_session_ttl() -> int:
+    try:
+        return max(60, int(os.environ.get('BOXCHAT_UPLOAD_SESSION_TTL_SECONDS') or 86400))
+    except Exception:
+        return 86400
+
+
+def upload_sessions_per_user() -> int:
+    try:
+        return max(1, int(os.environ.get('BOXCHAT_UPLOAD_SESSIONS_PER_USER') or 8))
+    except Exception:
+        return 8
+
+
+class UploadError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _partial_path(upload_folder, upload_id):
+    return os.path.join(upload_folder, PARTIAL_DIR, f'{upload_id}.part')
+
+
+def upload_progress(upload, received=None, expires_at=None) -> dict:
+    received = int(upload.received if received is None else received)
+    expires_at = expires_at or upload.expires_at
+    total = int(upload.total_size)
+    chunk_size = int(upload.chunk_size)
+    return {
+        'upload_id': upload.id,
+        'filename': upload.filename,
+        'type': upload.file_type,
+        'size': total,
+        'chunk_size': chunk_size,
+        'chunk_count': (total + chunk_size - 1) // chunk_size,
+        'received': received,
+        'next_chunk': received // chunk_size,
+        'complete': received >= total,
+        'expires_at': expires_at.strftime('%Y-%m-%dT%H:%M:%SZ') if expires_at else None,
+    }
+
+
+def _add_session(fields):
+    db.session.add(UploadSession(**fields))
+
+
+def create_upload_session(user_id, filename, total_size, upload_folder, max_size=None):
+    maybe_expire_upload_sessions(upload_folder)
+    if not filename or not allowed_file(filename):
+        raise UploadError('unsupported file type', 415)
+    safe_name = secure_filename(filename)
+    if not safe_name or not allowed_file(safe_name):
+        raise UploadError('unsupported file type', 415)
+    try:
+        total_size = int(total_size)
+    except Exception:
+        raise UploadError('size must be an integer')
+    if total_size < 0:
+        raise UploadError('size must be an integer')
+    if max_size is not None and total_size > int(max_size):
+        raise UploadError('File too large', 413)
+    now = datetime.utcnow()
+    active = UploadSession.query.filter(
+        UploadSession.user_id == int(user_id), UploadSession.expires_at > now
+    ).count()
+    if active >= upload_sessions_per_user():
+        raise UploadError('too many uploads in progress', 429)
+
+    subdir, file_type = upload_target(safe_name)
+    fields = {
+        'id': uuid.uuid4().hex,
+        'user_id': int(user_id),
+        'filename': safe_name,
+        'subdir': subdir,
+        'file_type': file_type,
+        'total_size': total_size,
+        'chunk_size': upload_chunk_size(),
+        'received': 0,
+        'created_at': now,
+        'expires_at': now + timedelta(seconds=upload_session_ttl()),
+    }
+    path = _partial_path(upload_folder, fields['id'])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    try:
+        run_write(_add_session, fields)
+    except Exception:
+        _remove_quietly(path)
+        raise
+    return UploadSession(**fields)
+
+
+def get_upload_session(upload_id, user_id):
+    # The caller's own, unexpired session or None.
+    upload = UploadSession.query.get(str(upload_id or ''))
+    if upload is None or upload.user_id != int(user_id) or upload.expires_at <= datetime.utcnow():
+        return None
+    return upload
+
+
+def _advance_session(upload_id, offset, received, expires_at):
+    # Conditional on the offset: two racing PUTs of the same chunk advance it once.
+    return UploadSession.query.filter_by(id=upload_id, received=offset).update(
+        {'received': received, 'expires_at': expires_at}, synchronize_session=False
+    )
+
+
+def append_upload_chunk(upload, index, stream, content_length, upload_folder) -> dict:
+    chunk_size = int(upload.chunk_size)
+    total = int(upload.total_size)
+    received = int(upload.received)
+    offset = int(index) * chunk_size
+    if index < 0 or offset >= total:
+        raise UploadError('chunk index out of range', 416)
+    if offset < received:
+        # Already stored (a retry after a lost response).
+        return upload_progress(upload)
+    if offset > received:
+        raise UploadError(f'expected chunk {received // chunk_size}', 409)
+    expected = min(chunk_size, total - offset)
+    if content_length is not None and int(content_length) != expected:
+        raise UploadError(f'chunk {index} must be {expected} bytes')
+
+    path = _partial_path(upload_folder, upload.id)
+    if not os.path.exists(path):
+        raise UploadError('upload not found', 404)
+    state = _chunk_hashes.get(upload.id)
+    hasher = state[1].copy() if state and state[0] == offset else None
+    if hasher is None and offset == 0:
+        hasher = hashlib.sha256()
+    written = 0
+    with open(path, 'r+b') as fh:
+        fh.seek(offset)
+        try:
+            while written < expected:
+                block = stream.read(min(_COPY_BLOCK, expected - written))
+                if not block:
+                    break
+                fh.write(block)
+                if hasher is not None:
+                    hasher.update(block)
+                written += len(block)
+            overflow = bool(stream.read(1)) if written == expected else False
+        except Exception:
+            overflow = False
+        if written != expected or overflow:
+            fh.truncate(offset)
+            raise UploadError(f'chunk {index} incomplete ({written} of {expected} bytes), send it again')
+        fh.truncate(offset + expected)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+    expires_at = datetime.utcnow() + timedelta(seconds=upload_session_ttl())
+    if not run_write(_advance_session, upload.id, offset, offset + expected, expires_at):
+        raise UploadError('chunk was written concurrently, query progress', 409)
+    _remember_hash(upload.id, offset + expected, hasher)
+    return upload_progress(upload, offset + expected, expires_at)
+
+
+def _delete_sessions(upload_ids):
+    return UploadSession.query.filter(UploadSession.id.in_(list(upload_ids))).delete(synchronize_session=False)
+
+
+def _restore_session(fields):
+    db.session.add(UploadSession(**fields))
+
+
+def _remember_hash(upload_id, hashed, hasher):
+    _chunk_hashes.pop(upload_id, None)
+    if hasher is None:
+        return
+    _chunk_hashes[upload_id] = (hashed, hasher)
+    while len(_chunk_hashes) > _MAX_CHUNK_HASHES:
+        _chunk_hashes.popitem(last=False)
+
+
+def finalize_upload(upload, upload_folder) -> dict:
+    # Store the finished file; returns the /upload_file response fields.
+    upload_id, subdir, file_type, filename = upload.id, upload.subdir, upload.file_type, upload.filename
+    total = int(upload.total_size)
+    if int(upload.received) < total:
+        raise UploadError(f'upload incomplete: {upload.received} of {upload.total_size} bytes', 409)
+    path = _partial_path(upload_folder, upload_id)
+    if not os.path.exists(path):
+        raise UploadError('upload not found', 404)
+    fields = {column.name: getattr(upload, column.name) for column in UploadSession.__table__.columns}
+    # Deleting the session claims it: a concurrent /complete gets 409.
+    if not run_write(_delete_sessions, [upload_id]):
+        raise UploadError('upload already finalized', 409)
+    state = _chunk_hashes.pop(upload_id, None)
+    try:
+        if state and state[0] == total:
+            sha, size = state[1].hexdigest(), total
+        else:
+            sha, size = hash_file(path)
+        url = store_blob(path, sha, size, subdir, filename, upload_folder, keep_source_on_error=True)
+    except Exception:
+        # Keep the part file and give the session back so /complete can be retried.
+        if os.path.exists(path):
+            fields['expires_at'] = datetime.utcnow() + timedelta(seconds=upload_session_ttl())
+            try:
+                run_write(_restore_session, fields)
+                if state:
+                    _chunk_hashes[upload_id] = state
+            except Exception as e:
+                db.session.rollback()
+                print(f"[UPLOADS] restoring upload {upload_id} failed: {e}")
+        raise
+    return {'url': url, 'type': file_type, 'filename': filename}
+
+
+def abort_upload(upload, upload_folder):
+    upload_id = upload.id
+    run_write(_delete_sessions, [upload_id])
+    _chunk_hashes.pop(upload_id, None)
+    _remove_quietly(_partial_path(upload_folder, upload_id))
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def expire_upload_sessions(upload_folder, now=None, limit=500) -> int:
+    # Drop expired sessions and their part files; returns how many were removed.
+    now = now or datetime.utcnow()
+    upload_ids = [
+        upload_id for (upload_id,) in
+        UploadSession.query.with_entities(UploadSession.id)
+        .filter(UploadSession.expires_at <= now)
+        .limit(limit)
+        .all()
+    ]
+    if not upload_ids:
+        return 0
+    run_write(_delete_sessions, upload_ids)
+    for upload_id in upload_ids:
+        _chunk_hashes.pop(upload_id, None)
+        _remove_quietly(_partial_path(upload_folder, upload_id))
+    return len(upload_ids)
+
+
+def maybe_expire_upload_sessions(upload_folder):
+    # At most once a minute per process, piggybacked on new uploads.
+    if time.monotonic() - _last_expire[0] < _EXPIRE_INTERVAL_SECONDS:
+        return 0
+    _last_expire[0] = time.monotonic()
+    try:
+        removed = expire_upload_sessions(upload_folder)
+    except Exception as e:
+        print(f"[UPLOADS] expiring upload sessions failed: {e}")
+        return 0
+    if removed:
+        print(f"[UPLOADS] expired {removed} abandoned upload session(s)")
+    return removed
@@ -3,6 +3,10 @@ from sqlalchemy import inspect, text
 
 def ensure_schema_migrations(conn):
     conn.execute(text('CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY NOT NULL)'))
+    # Set once the default role backfill committed for that version
+    if not _has_column(inspect(conn), 'schema_migrations', 'roles_seeded'):
+        conn.execute(text('ALTER TABLE schema_migrations ADD COLUMN roles_seeded INTEGER NOT NULL DEFAULT 0'))
+        conn.commit()
 
 
 def get_current_version(conn) -> int:
@@ -16,6 +20,18 @@ def set_version(conn, version: int):
     conn.execute(text('INSERT INTO schema_migrations(version) VALUES (:v)'), {'v': int(version)})
 
 
+def roles_seeded(conn, version: int) -> bool:
+    ensure_schema_migrations(conn)
+    row = conn.execute(
+        text('SELECT roles_seeded FROM schema_migrations WHERE version = :v'), {'v': int(version)}
+    ).first()
+    return bool(row and row[0])
+
+
+def mark_roles_seeded(conn, version: int):
+    conn.execute(text('UPDATE schema_migrations SET roles_seeded = 1 WHERE version = :v'), {'v': int(version)})
+
+
 def _has_column(inspector, table: str, column: str) -> bool:
     try:
         cols = [c['name'] for c in inspector.get_columns(table)]
@@ -31,6 +47,7 @@ def _create_table_if_missing(inspector, conn, table_name: str, ddl: str):
 
 
 def migrate(db_engine):
+    # Returns (version before, version after); they differ when a step ran.
     with db_engine.connect() as conn:
         current = get_current_version(conn)
         inspector = inspect(conn)
@@ -184,4 +201,187 @@ def migrate(db_engine):
                 pass
             set_version(conn, 9)
 
+        if current < 10:
+            # Keyset pagination of channel history (WHERE channel_id = ? AND id < ? ORDER BY id).
+            try:
+                conn.execute(text('CREATE INDEX IF NOT EXISTS ix_message_channel_id_id ON message (channel_id, id)'))
+            except Exception:
+                pass
+            set_version(conn, 10)
+
+        if current < 11:
+            # Reaction summaries (GROUP BY message_id, emoji) and reactor pages (ORDER BY id).
+            try:
+                conn.execute(text('CREATE INDEX IF NOT EXISTS ix_message_reaction_message_emoji ON message_reaction (message_id, emoji, id)'))
+            except Exception:
+                pass
+            set_version(conn, 11)
+
+        if current < 12:
+            inspector = inspect(conn)
+            _create_table_if_missing(
+                inspector,
+                conn,
+                'channel_change',
+                """CREATE TABLE channel_change (
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    channel_id INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    kind VARCHAR(20) NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    user_id INTEGER,
+                    emoji VARCHAR(50),
+                    delta INTEGER,
+                    created_at DATETIME,
+                    CONSTRAINT uq_channel_change_seq UNIQUE (channel_id, seq),
+                    FOREIGN KEY(channel_id) REFERENCES channel (id)
+                )""",
+            )
+            set_version(conn, 12)
+
+        if current < 13:
+            # Full-text search over message.content: external-content FTS5 table kept
+            # in sync by triggers (covers ORM writes, bulk deletes and raw SQL alike).
+            try:
+                conn.execute(text(
+                    "CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5("
+                    "content, content='message', content_rowid='id', "
+                    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message BEGIN "
+                    "INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message BEGIN "
+                    "INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content); END"
+                ))
+                conn.execute(text(
+                    "CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF content ON message BEGIN "
+                    "INSERT INTO message_fts(message_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+                    "INSERT INTO message_fts(rowid, content) VALUES (new.id, new.content); END"
+                ))
+                # Backfill existing history
+                conn.execute(text("INSERT INTO message_fts(message_fts) VALUES ('rebuild')"))
+            except Exception as e:
+                # SQLite without FTS5: message search stays disabled.
+                print(f"[MIGRATIONS] FTS5 unavailable, message search disabled: {e}")
+            set_version(conn, 13)
+
+        if current < 14:
+            inspector = inspect(conn)
+            _create_table_if_missing(
+                inspector,
+                conn,
+                'unread_counter',
+                """CREATE TABLE unread_counter (
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    channel_id INTEGER NOT NULL,
+                    unread_count INTEGER NOT NULL DEFAULT 0,
+                    CONSTRAINT uq_unread_counter_user_channel UNIQUE (user_id, channel_id),
+                    FOREIGN KEY(user_id) REFERENCES user (id),
+                    FOREIGN KEY(channel_id) REFERENCES channel (id)
+                )""",
+            )
+            # Backfill from the read pointers: one row per member and channel of their rooms.
+            conn.execute(text("""
+                INSERT OR IGNORE INTO unread_counter (user_id, channel_id, unread_count)
+                SELECT mb.user_id, c.id, (
+                    SELECT COUNT(*) FROM message m
+                    WHERE m.channel_id = c.id AND m.user_id != mb.user_id
+                      AND m.id > COALESCE((
+                          SELECT MAX(rm.last_read_message_id) FROM read_message rm
+                          WHERE rm.user_id = mb.user_id AND rm.channel_id = c.id
+                      ), 0)
+                )
+                FROM member mb JOIN channel c ON c.room_id = mb.room_id
+                WHERE COALESCE(mb.role, 'member') != 'banned'
+            """))
+            set_version(conn, 14)
+
+        if current < 15:
+            inspector = inspect(conn)
+            _create_table_if_missing(
+                inspector,
+                conn,
+                'upload_session',
+                """CREATE TABLE upload_session (
+                    id VARCHAR(32) NOT NULL PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    filename VARCHAR(200) NOT NULL,
+                    subdir VARCHAR(20) NOT NULL,
+                    file_type VARCHAR(20) NOT NULL,
+                    total_size BIGINT NOT NULL,
+                    chunk_size INTEGER NOT NULL,
+                    received BIGINT NOT NULL DEFAULT 0,
+                    created_at DATETIME,
+                    expires_at DATETIME NOT NULL,
+                    FOREIGN KEY(user_id) REFERENCES user (id)
+                )""",
+            )
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_upload_session_expires_at ON upload_session (expires_at)'))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_upload_session_user_id ON upload_session (user_id)'))
+            set_version(conn, 15)
+
+        if current < 16:
+            inspector = inspect(conn)
+            _create_table_if_missing(
+                inspector,
+                conn,
+                'upload_blob',
+                """CREATE TABLE upload_blob (
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    path VARCHAR(200) NOT NULL UNIQUE,
+                    sha256 VARCHAR(64) NOT NULL,
+                    size BIGINT NOT NULL,
+                    ref_count INTEGER NOT NULL DEFAULT 0,
+                    created_at DATETIME
+                )""",
+            )
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_upload_blob_sha256 ON upload_blob (sha256)'))
+            set_version(conn, 16)
+
+        if current < 17:
+            inspector = inspect(conn)
+            if not _has_column(inspector, 'upload_blob', 'width'):
+                conn.execute(text('ALTER TABLE upload_blob ADD COLUMN width INTEGER'))
+            if not _has_column(inspector, 'upload_blob', 'height'):
+                conn.execute(text('ALTER TABLE upload_blob ADD COLUMN height INTEGER'))
+            if not _has_column(inspector, 'upload_blob', 'variants'):
+                conn.execute(text('ALTER TABLE upload_blob ADD COLUMN variants VARCHAR(100)'))
+            set_version(conn, 17)
+
+        if current < 18:
+            inspector = inspect(conn)
+            _create_table_if_missing(
+                inspector,
+                conn,
+                'attachment',
+                """CREATE TABLE attachment (
+                    id INTEGER NOT NULL PRIMARY KEY,
+                    file_url VARCHAR(500) NOT NULL,
+                    room_id INTEGER NOT NULL DEFAULT 0,
+                    user_id INTEGER NOT NULL DEFAULT 0,
+                    created_at DATETIME,
+                    CONSTRAINT uq_attachment_url_room_user UNIQUE (file_url, room_id, user_id)
+                )""",
+            )
+            # Backfill from the messages and music libraries that exist already.
+            conn.execute(text("""
+                INSERT OR IGNORE INTO attachment (file_url, room_id, user_id, created_at)
+                SELECT DISTINCT m.file_url, c.room_id, 0, CURRENT_TIMESTAMP
+                FROM message m JOIN channel c ON c.id = m.channel_id
+                WHERE m.file_url LIKE '/uploads/%'
+            """))
+            conn.execute(text("""
+                INSERT OR IGNORE INTO attachment (file_url, room_id, user_id, created_at)
+                SELECT DISTINCT file_url, 0, user_id, CURRENT_TIMESTAMP
+                FROM user_music
+                WHERE file_url LIKE '/uploads/%'
+            """))
+            set_version(conn, 18)
+
+        latest = get_current_version(conn)
         conn.commit()
+    return current, latest
@@ -3,10 +3,10 @@
 
 from app.models.user import User, UserMusic, AuthThrottle, Friendship, FriendRequest
 from app.models.chat import Room, Channel, Member, RoomBan, Role, MemberRole, RoleMentionPermission
-from app.models.content import Message, MessageReaction, ReadMessage, StickerPack, Sticker
+from app.models.content import Message, MessageReaction, ChannelChange, ReadMessage, UnreadCounter, UploadSession, UploadBlob, Attachment, StickerPack, Sticker
 
 __all__ = [
     'User', 'UserMusic', 'AuthThrottle', 'Friendship', 'FriendRequest',
     'Room', 'Channel', 'Member', 'RoomBan', 'Role', 'MemberRole', 'RoleMentionPermission',
-    'Message', 'MessageReaction', 'ReadMessage', 'StickerPack', 'Sticker'
+    'Message', 'MessageReaction', 'ChannelChange', 'ReadMessage', 'UnreadCounter', 'UploadSession', 'UploadBlob', 'Attachment', 'StickerPack', 'Sticker'
 ]
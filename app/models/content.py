@@ -35,6 +35,22 @@ class MessageReaction(db.Model):
     # Relationships
     user = db.relationship('User', backref='reactions')
 
+class ChannelChange(db.Model):
+    # Append-only per-channel change log (drives /api/v1/channel/<id>/changes)
+    id = db.Column(db.Integer, primary_key=True)
+    channel_id = db.Column(db.Integer, db.ForeignKey('channel.id'), nullable=False)
+    seq = db.Column(db.Integer, nullable=False)  # monotonic within the channel, starts at 1
+    kind = db.Column(db.String(20), nullable=False)  # 'new', 'edit', 'delete', 'reaction'
+    message_id = db.Column(db.Integer, nullable=False)  # no FK: deleted messages stay referenced
+    user_id = db.Column(db.Integer, nullable=True)  # reacting user for 'reaction'
+    emoji = db.Column(db.String(50), nullable=True)
+    delta = db.Column(db.Integer, nullable=True)  # +1 / -1 for 'reaction'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('channel_id', 'seq', name='uq_channel_change_seq'),
+    )
+
 class ReadMessage(db.Model):
     #Track read messages in channels
     id = db.Column(db.Integer, primary_key=True)
@@ -47,6 +63,67 @@ class ReadMessage(db.Model):
     user = db.relationship('User', backref='read_messages')
     channel = db.relationship('Channel', backref='read_by_users')
 
+class UnreadCounter(db.Model):
+    # Messages by others after the user's read pointer, maintained on write (see app/functions/unread.py)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    channel_id = db.Column(db.Integer, db.ForeignKey('channel.id'), nullable=False)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'channel_id', name='uq_unread_counter_user_channel'),
+    )
+
+class UploadSession(db.Model):
+    # Resumable chunked upload in progress (see app/functions/uploads.py); the
+    # bytes live in <upload folder>/.partial/<id>.part until it is finalized
+    id = db.Column(db.String(32), primary_key=True)  # random hex token
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(200), nullable=False)  # secure_filename() of the client name
+    subdir = db.Column(db.String(20), nullable=False)  # 'files', 'music' or 'videos'
+    file_type = db.Column(db.String(20), nullable=False)  # 'image', 'music', 'video' or 'file'
+    total_size = db.Column(db.BigInteger, nullable=False)
+    chunk_size = db.Column(db.Integer, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)  # contiguous bytes from offset 0
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_upload_session_expires_at', 'expires_at'),
+        db.Index('ix_upload_session_user_id', 'user_id'),
+    )
+
+class Attachment(db.Model):
+    # Who may fetch an /uploads URL (see app/functions/attachments.py): members
+    # of room_id (a message there links it) or user_id (music library owner).
+    # The unused side is 0 so the unique key also covers it.
+    id = db.Column(db.Integer, primary_key=True)
+    file_url = db.Column(db.String(500), nullable=False)
+    room_id = db.Column(db.Integer, nullable=False, default=0)
+    user_id = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('file_url', 'room_id', 'user_id', name='uq_attachment_url_room_user'),
+    )
+
+class UploadBlob(db.Model):
+    # One stored upload file, shared by every identical upload in the same
+    # subfolder (see app/functions/blobs.py)
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(200), nullable=False, unique=True)  # '<subdir>/<sha[:2]>/<sha256><ext>'
+    sha256 = db.Column(db.String(64), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # handed-out URLs still in use
+    width = db.Column(db.Integer, nullable=True)  # images, once variants were generated
+    height = db.Column(db.Integer, nullable=True)
+    variants = db.Column(db.String(100), nullable=True)  # e.g. '64,320,full' (see app/functions/image_variants.py)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_upload_blob_sha256', 'sha256'),
+    )
+
 class StickerPack(db.Model):
     # Collection of stickers
     id = db.Column(db.Integer, primary_key=True)
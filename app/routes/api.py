@@ -1,35 +1,59 @@
 # API routes (uploads, settings, channel management, message actions)
 
 import os
+import mimetypes
 import re
 import inspect
 import json
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, send_from_directory, current_app, abort
+from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash, current_app, abort
 from flask_login import login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from datetime import datetime, timedelta
-from sqlalchemy import or_, and_, func
-from sqlalchemy.orm import joinedload, subqueryload
+from sqlalchemy import or_, func
+from sqlalchemy.orm import joinedload
 from app.extensions import db, socketio
 from app.models import (
     User, Room, Channel, Member, Message, UserMusic,
     MessageReaction, ReadMessage, RoomBan, Role, MemberRole, RoleMentionPermission
 )
 from app.functions import (
-    allowed_file, save_uploaded_file, resize_image, is_image_file, is_music_file, is_video_file,
+    allowed_file, save_uploaded_file, resize_image, is_image_file, is_music_file, is_video_file, upload_target,
+    acquire_upload_url, release_upload_urls, blob_path_for_url, pick_image_variant,
+    can_access_upload, add_message_attachments, add_music_attachment, prune_attachments,
+    get_upload_acl_cache_stats, sign_media_url, verify_media_signature, add_signed_media_urls,
+    send_upload, blob_etag, media_delivery_mode,
     normalize_role_tag, ensure_default_roles, ensure_user_default_roles, can_user_mention_role,
-    ROLE_PERMISSION_KEYS, parse_role_permissions, get_user_permissions, user_has_room_permission
+    ROLE_PERMISSION_KEYS, parse_role_permissions, get_user_permissions, user_has_room_permission,
+    get_permission_context, invalidate_room_permission_contexts,
+    get_reaction_summaries, get_reaction_summary, count_emoji_reactions, list_message_reactors,
+    serialize_history_message, get_channel_tail_page, tail_message_added, tail_message_edited,
+    tail_reactions_changed, drop_channel_tail, drop_channel_tails,
+    clear_tail_cache, get_tail_cache_stats,
+    record_channel_change, record_bulk_message_deletes, record_bulk_reaction_removals,
+    get_channel_change_seq, purge_channel_changes, collect_channel_changes, get_emoji_counts,
+    bump_unread_counters, reset_unread_counter, unread_message_deleted, recount_unread_counters,
+    clear_unread_counters, serialize_user_rooms,
+    member_joined, member_left, member_role_changed, role_changed, user_renamed, user_avatar_changed,
+    room_deleted
 )
+from app.sockets.presence import presence
 from app.routes.spa import send_spa_index
 from app.routes.api_friends import register_friends_routes
 from app.routes.api_search import register_search_routes
+from app.routes.api_bootstrap import register_bootstrap_routes
+from app.routes.api_members import register_member_list_routes
+from app.routes.api_uploads import register_upload_routes
 from app.utils.ip import get_client_ip as _get_client_ip
-from app.utils.paths import safe_resolve_under
+from app.utils.sql_metrics import get_sql_metrics_stats
+from app.utils.write_queue import get_write_queue_stats, run_write
 
 api_bp = Blueprint('api', __name__)
 
 register_friends_routes(api_bp)
 register_search_routes(api_bp)
+register_bootstrap_routes(api_bp)
+register_member_list_routes(api_bp)
+register_upload_routes(api_bp)
 
 
 def _get_giphy_key():
@@ -111,8 +135,7 @@ def _giphy_call_with_optional_offset(api_instance, method_name: str, api_key: st
 # Helper functions
 def get_role(user_id, room_id):
     # Get user role in room
-    member = Member.query.filter_by(user_id=user_id, room_id=room_id).first()
-    return member.role if member else None
+    return get_permission_context(user_id, room_id).member_role
 
 
 def has_room_permission(user_id, room, permission_key: str):
@@ -155,9 +178,26 @@ def get_active_room_ban(user_id: int, room_id: int):
     return room_ban
 
 
-def save_file(file, subfolder='files'):
+def save_file(file, subfolder='files', process=None):
     # Wrapper for save_uploaded_file that uses current_app's upload folder
-    return save_uploaded_file(file, subfolder, current_app.config['UPLOAD_FOLDER'])
+    return save_uploaded_file(file, subfolder, current_app.config['UPLOAD_FOLDER'], process=process)
+
+
+def release_files(*urls):
+    # Drop references to upload URLs that were replaced or deleted (call after the commit)
+    return release_upload_urls([url for url in urls if url], get_upload_folder())
+
+
+def _message_file_urls(query):
+    # Upload URLs of the messages selected by `query`, once per message: each
+    # row holds its own blob reference
+    rows = (
+        query.with_entities(Message.file_url, func.count())
+        .filter(Message.file_url.isnot(None))
+        .group_by(Message.file_url)
+        .all()
+    )
+    return [url for url, count in rows for _ in range(count)]
 
 
 def get_upload_folder():
@@ -165,10 +205,6 @@ def get_upload_folder():
     return current_app.config.get('UPLOAD_FOLDER', 'uploads')
 
 
-def _safe_upload_abs_path(filename: str):
-    return safe_resolve_under(get_upload_folder(), filename)
-
-
 def _wants_json():
     if request.is_json:
         return True
@@ -179,18 +215,9 @@ def _wants_json():
 
 
 def _emit_presence_update_for_user(user):
-    memberships = (
-        Member.query.filter_by(user_id=user.id)
-        .options(joinedload(Member.room).subqueryload(Room.channels))
-        .all()
-    )
-    for m in memberships:
-        for ch in m.room.channels:
-            socketio.emit('presence_updated', {
-                'user_id': user.id,
-                'username': user.username,
-                'status': user.presence_status
-            }, room=str(ch.id), skip_sid=None)
+    # Broadcast as part of the next debounced presence_batch of each room
+    status, last_seen = presence.status_of(user)
+    presence.announce(user.id, user.username, status, last_seen)
 
 # --- CHANNEL MANAGEMENT ---
 
@@ -237,12 +264,14 @@ def edit_channel(room_id, channel_id):
     if 'icon_file' in request.files:
         file = request.files['icon_file']
         if file and file.filename:
-            filepath = save_file(file, 'channel_icons')
+            # Resized to 32x32 before it is stored
+            filepath = save_file(file, 'channel_icons', process=lambda path: resize_image(path, (32, 32)))
             if filepath:
-                # Resize to 32x32
-                full_path = os.path.join(get_upload_folder(), 'channel_icons', filepath.split('/')[-1])
-                resize_image(full_path, (32, 32))
+                old_icon_url = channel.icon_image_url
                 channel.icon_image_url = filepath
+                db.session.commit()
+                if old_icon_url != filepath:
+                    release_files(old_icon_url)
     
     db.session.commit()
     return jsonify({'success': True})
@@ -259,8 +288,15 @@ def delete_channel(room_id, channel_id):
     if channel.room_id != room_id:
         return jsonify({'error': 'Неверный канал'}), 400
     
+    file_urls = _message_file_urls(Message.query.filter(Message.channel_id == channel_id))
+    file_urls.append(channel.icon_image_url)
+    purge_channel_changes([channel_id])
+    clear_unread_counters(channel_ids=[channel_id])
     db.session.delete(channel)
     db.session.commit()
+    drop_channel_tail(channel_id)
+    run_write(prune_attachments, file_urls)
+    release_files(*file_urls)
     return jsonify({'success': True})
 
 
@@ -313,9 +349,15 @@ def settings():
         if file and file.filename:
             filepath = save_file(file, 'avatars')
             if filepath:
+                old_avatar_url = current_user.avatar_url
                 current_user.avatar_url = filepath
+                db.session.commit()
+                if old_avatar_url != filepath:
+                    release_files(old_avatar_url)
 
     db.session.commit()
+    presence.set_hidden(current_user.id, current_user.hide_status)
+    user_avatar_changed(current_user.id, current_user.avatar_url)
     _emit_presence_update_for_user(current_user)
 
     if _wants_json():
@@ -341,6 +383,7 @@ def user_settings_api():
         })
 
     data = request.get_json(silent=True) or {}
+    renamed_to = None
     if 'bio' in data:
         current_user.bio = str(data.get('bio') or '')[:300]
     if 'username' in data:
@@ -355,6 +398,7 @@ def user_settings_api():
         ).first()
         if exists:
             return jsonify({'error': 'username already taken'}), 409
+        renamed_to = next_username if next_username != current_user.username else None
         current_user.username = next_username
     if 'privacy_searchable' in data:
         current_user.privacy_searchable = bool(data.get('privacy_searchable'))
@@ -368,6 +412,10 @@ def user_settings_api():
             current_user.presence_status = 'online'
 
     db.session.commit()
+    if 'hide_status' in data:
+        presence.set_hidden(current_user.id, current_user.hide_status)
+    if renamed_to:
+        user_renamed(current_user.id, renamed_to)
     _emit_presence_update_for_user(current_user)
 
     return jsonify({'success': True})
@@ -386,32 +434,18 @@ def upload_user_avatar_api():
         return jsonify({'error': 'unsupported avatar type'}), 415
 
     old_avatar_url = getattr(current_user, 'avatar_url', None)
-    filepath = save_file(file, 'avatars')
+    # Normalize and resize the avatar before it is stored to reduce payload size.
+    filepath = save_file(file, 'avatars', process=lambda path: resize_image(path, (256, 256)))
     if not filepath:
         return jsonify({'error': 'failed to save avatar'}), 500
 
-    # Normalize and resize stored avatar to reduce payload size.
-    try:
-        if str(filepath).startswith('/uploads/'):
-            rel = str(filepath).lstrip('/uploads/').lstrip('/')
-            abs_path = _safe_upload_abs_path(rel)
-            if abs_path:
-                resize_image(str(abs_path), (256, 256))
-    except Exception:
-        pass
-
     current_user.avatar_url = filepath
     db.session.commit()
+    user_avatar_changed(current_user.id, filepath)
 
-    # Best-effort cleanup of previous avatar file.
-    try:
-        if old_avatar_url and str(old_avatar_url).startswith('/uploads/') and old_avatar_url != filepath:
-            rel_old = str(old_avatar_url).lstrip('/uploads/').lstrip('/')
-            abs_old = _safe_upload_abs_path(rel_old)
-            if abs_old and abs_old.exists():
-                abs_old.unlink()
-    except Exception:
-        pass
+    # Previous avatar file goes with its last reference.
+    if old_avatar_url != filepath:
+        release_files(old_avatar_url)
 
     return jsonify({'success': True, 'avatar_url': current_user.avatar_url})
 
@@ -420,17 +454,11 @@ def upload_user_avatar_api():
 def delete_user_avatar():
     # Delete user avatar
     if current_user.avatar_url and current_user.avatar_url != "https://placehold.co/50x50":
-        if current_user.avatar_url.startswith('/uploads/'):
-            try:
-                filename = current_user.avatar_url.lstrip('/uploads/').lstrip('/')
-                abs_path = _safe_upload_abs_path(filename)
-                if abs_path and abs_path.exists():
-                    abs_path.unlink()
-            except:
-                pass
-        
+        old_avatar_url = current_user.avatar_url
         current_user.avatar_url = "https://placehold.co/50x50"
         db.session.commit()
+        release_files(old_avatar_url)
+        user_avatar_changed(current_user.id, current_user.avatar_url)
     
     return jsonify({'success': True})
 
@@ -451,31 +479,37 @@ def delete_user_account():
     user_id = current_user.id
     
     try:
+        # Upload URLs to release once everything is gone
+        file_urls = _message_file_urls(Message.query.filter(Message.user_id == user_id))
+        for music_url, cover_url in db.session.query(UserMusic.file_url, UserMusic.cover_url).filter(UserMusic.user_id == user_id).all():
+            file_urls.extend([music_url, cover_url])
+        file_urls.append(current_user.avatar_url)
         # Delete user's music
         UserMusic.query.filter_by(user_id=user_id).delete()        
         # Delete reactions
+        record_bulk_reaction_removals(MessageReaction.query.filter_by(user_id=user_id))
         MessageReaction.query.filter_by(user_id=user_id).delete()
-        # Delete read messages
+        # Delete read messages and unread counters
         ReadMessage.query.filter_by(user_id=user_id).delete()
+        clear_unread_counters(user_id=user_id)
         # Delete memberships
+        left_room_ids = [int(rid) for (rid,) in db.session.query(Member.room_id).filter(Member.user_id == user_id).all()]
         Member.query.filter_by(user_id=user_id).delete()
         # Delete messages
+        record_bulk_message_deletes(Message.query.filter_by(user_id=user_id))
+        touched_channel_ids = [int(cid) for (cid,) in db.session.query(Message.channel_id).filter(Message.user_id == user_id).distinct().all()]
         Message.query.filter_by(user_id=user_id).delete()
-        # Delete avatar file
-        if current_user.avatar_url and current_user.avatar_url.startswith('/uploads/'):
-            try:
-                filename = current_user.avatar_url.lstrip('/uploads/').lstrip('/')
-                abs_path = _safe_upload_abs_path(filename)
-                if abs_path and abs_path.exists():
-                    abs_path.unlink()
-            except:
-                pass
-        
+        recount_unread_counters(touched_channel_ids)
         # Delete account
         from flask_login import logout_user
         logout_user()
         db.session.delete(current_user)
         db.session.commit()
+        for rid in left_room_ids:
+            member_left(user_id, rid)
+        clear_tail_cache()
+        run_write(prune_attachments, file_urls)
+        release_files(*file_urls)
         
         return jsonify({'success': True})
     except Exception as e:
@@ -503,7 +537,11 @@ def room_settings(room_id):
             if file and file.filename:
                 filepath = save_file(file, 'room_avatars')
                 if filepath:
+                    old_avatar_url = room.avatar_url
                     room.avatar_url = filepath
+                    db.session.commit()
+                    if old_avatar_url != filepath:
+                        release_files(old_avatar_url)
         
         db.session.commit()
         flash('Настройки комнаты обновлены')
@@ -515,24 +553,37 @@ def room_settings(room_id):
     return render_template('room_settings.html', room=room, room_bans=room_bans)
 
 
+def _mark_channel_read(user_id, channel_id):
+    # Write unit (run_write): move the read marker to the last message; returns its id.
+    from app.models import Message, ReadMessage
+    last_msg = Message.query.filter_by(channel_id=channel_id).order_by(Message.id.desc()).first()
+    if last_msg:
+        rm = ReadMessage.query.filter_by(user_id=user_id, channel_id=channel_id).first()
+        if rm:
+            rm.last_read_message_id = last_msg.id
+            rm.last_read_at = datetime.utcnow()
+        else:
+            db.session.add(ReadMessage(user_id=user_id, channel_id=channel_id, last_read_message_id=last_msg.id))
+    reset_unread_counter(user_id, channel_id)
+    return last_msg.id if last_msg else None
+
+
 @api_bp.route('/channel/<int:channel_id>/mark_read', methods=['POST'])
 @login_required
 def mark_channel_read(channel_id):
     # Mark channel as read for current user (set last_read to last message)
-    from app.models import Channel, Message, ReadMessage
+    from app.models import Channel
     ch = Channel.query.get_or_404(channel_id)
-    last_msg = Message.query.filter_by(channel_id=channel_id).order_by(Message.id.desc()).first()
-    if not last_msg:
-        return jsonify({'success': True, 'message': 'no_messages'})
+    last_message_id = run_write(_mark_channel_read, current_user.id, channel_id)
+    if last_message_id is None:
+        return jsonify({'success': True, 'message': 'no_messages', 'unread_count': 0})
 
-    rm = ReadMessage.query.filter_by(user_id=current_user.id, channel_id=channel_id).first()
-    if rm:
-        rm.last_read_message_id = last_msg.id
-        rm.last_read_at = datetime.utcnow()
-    else:
-        rm = ReadMessage(user_id=current_user.id, channel_id=channel_id, last_read_message_id=last_msg.id)
-        db.session.add(rm)
-    db.session.commit()
+    # Clear the badge on the user's other tabs/devices
+    socketio.emit('unread_updated', {
+        'room_id': ch.room_id,
+        'channel_id': channel_id,
+        'unread_count': 0,
+    }, room=f"user_{current_user.id}")
 
     # notify others in channel about read status
     socketio.emit('read_status_updated', {
@@ -541,7 +592,7 @@ def mark_channel_read(channel_id):
         'channel_id': channel_id
     }, room=str(channel_id))
 
-    return jsonify({'success': True})
+    return jsonify({'success': True, 'unread_count': 0})
 
 
 @api_bp.route('/room/<int:room_id>/avatar/delete', methods=['POST'])
@@ -553,17 +604,10 @@ def delete_room_avatar(room_id):
         return jsonify({'error': 'no rights'}), 403
     
     if room.avatar_url:
-        if room.avatar_url.startswith('/uploads/'):
-            try:
-                filename = room.avatar_url.lstrip('/uploads/').lstrip('/')
-                abs_path = _safe_upload_abs_path(filename)
-                if abs_path and abs_path.exists():
-                    abs_path.unlink()
-            except:
-                pass
-
+        old_avatar_url = room.avatar_url
         room.avatar_url = None
         db.session.commit()
+        release_files(old_avatar_url)
     
     return jsonify({'success': True})
 
@@ -583,18 +627,8 @@ def upload_file():
         return jsonify({'error': 'unsupported file type'}), 415
     # Save according to type with validation
     try:
-        if is_image_file(file.filename):
-            filepath = save_file(file, 'files')
-            filetype = 'image'
-        elif is_music_file(file.filename):
-            filepath = save_file(file, 'music')
-            filetype = 'music'
-        elif is_video_file(file.filename):
-            filepath = save_file(file, 'videos')
-            filetype = 'video'
-        else:
-            filepath = save_file(file, 'files')
-            filetype = 'file'
+        subdir, filetype = upload_target(file.filename)
+        filepath = save_file(file, subdir)
     except Exception as e:
         return jsonify({'error': f'upload error: {str(e)}'}), 500
 
@@ -610,13 +644,18 @@ def upload_file():
     return jsonify({'success': True, 'url': filepath, 'type': filetype, 'filename': filename})
 
 @api_bp.route('/uploads/<path:filename>')
-@login_required
 def uploaded_file(filename):
     # Serve uploaded file
     filename = str(filename or '').lstrip('/\\')
     if not filename:
         abort(404)
 
+    # A valid ?exp=&sig= (app/functions/media_urls.py) is checked without the
+    # database; everything else needs a session and the checks below.
+    signed = verify_media_signature(f"/uploads/{filename}", request.args.get('exp'), request.args.get('sig'))
+    if not signed and not current_user.is_authenticated:
+        return current_app.login_manager.unauthorized()
+
     # Only allow configured upload subdirectories.
     try:
         from config import UPLOAD_SUBDIRS as _UPLOAD_SUBDIRS
@@ -631,36 +670,46 @@ def uploaded_file(filename):
     # - Avatars/icons/banners are visible to all authenticated users.
     # - Room attachments (files/videos) require membership in the room where they were posted.
     # - Music library files require ownership.
-    if subdir in {'files', 'videos', 'music'}:
-        full_url = f"/uploads/{filename}"
-        allowed = False
+    if subdir in {'files', 'videos', 'music'} and not signed:
+        # One lookup in the attachment index (app/functions/attachments.py), cached per user.
         try:
-            msg = (
-                Message.query
-                .join(Channel, Message.channel_id == Channel.id)
-                .join(Room, Channel.room_id == Room.id)
-                .join(Member, and_(Member.room_id == Room.id, Member.user_id == current_user.id))
-                .filter(Message.file_url == full_url)
-                .first()
-            )
-            if msg:
-                allowed = True
+            allowed = can_access_upload(current_user.id, f"/uploads/{filename}")
         except Exception:
             allowed = False
-
-        if not allowed and subdir == 'music':
-            try:
-                allowed = UserMusic.query.filter_by(user_id=current_user.id, file_url=full_url).first() is not None
-            except Exception:
-                allowed = False
-
         if not allowed:
             abort(404)
 
     inline = is_image_file(filename) or is_music_file(filename) or is_video_file(filename)
-    resp = send_from_directory(get_upload_folder(), filename, as_attachment=not inline)
+    # Content-addressed URLs (<subdir>/<sha256>/<name>) are served from the
+    # shared blob; the name only picks the MIME type and download name.
+    stored_path = blob_path_for_url(f"/uploads/{filename}")
+    size = request.args.get('size', type=int)
+    variant = None
+    if stored_path and size and size > 0:
+        # ?size=N: smallest WebP variant with a longest edge of at least N px
+        accept_webp = 'image/webp' in (request.headers.get('Accept') or '')
+        variant = pick_image_variant(get_upload_folder(), stored_path, size, accept_webp=accept_webp)
+    if variant:
+        download_name = os.path.splitext(filename.rsplit('/', 1)[-1])[0] + '.webp'
+        resp = send_upload(
+            get_upload_folder(), variant, download_name=download_name, mimetype='image/webp',
+            etag=blob_etag(variant), immutable=True,
+        )
+    elif stored_path:
+        download_name = filename.rsplit('/', 1)[-1]
+        # The original in place of a variant that is not made yet must not be
+        # cached for good under the ?size= URL.
+        resp = send_upload(
+            get_upload_folder(), stored_path, as_attachment=not inline, download_name=download_name,
+            mimetype=mimetypes.guess_type(download_name)[0] or 'application/octet-stream',
+            etag=blob_etag(stored_path), immutable=not (size and size > 0),
+        )
+    else:
+        resp = send_upload(get_upload_folder(), filename, as_attachment=not inline)
     try:
         resp.headers.setdefault('X-Content-Type-Options', 'nosniff')
+        if size and stored_path:
+            resp.vary.add('Accept')
     except Exception:
         pass
     return resp
@@ -697,6 +746,7 @@ def add_music():
         cover_url=cover_url
     )
     db.session.add(music)
+    add_music_attachment(filepath, current_user.id)
     db.session.commit()
     
     return jsonify({'success': True, 'id': music.id})
@@ -713,6 +763,8 @@ def delete_music(music_id):
     
     db.session.delete(music)
     db.session.commit()
+    run_write(prune_attachments, [music.file_url])
+    release_files(music.file_url, music.cover_url)
     
     return jsonify({'success': True})
 
@@ -824,12 +876,19 @@ def delete_message(message_id):
         return jsonify({'error': 'no access'}), 403
     
     channel_id = message.channel_id
+    file_url = message.file_url
+    unread_message_deleted(channel_id, message_id, message.user_id)
     db.session.delete(message)
+    change_seq = record_channel_change(channel_id, 'delete', message_id)
     db.session.commit()
+    drop_channel_tail(channel_id)
+    run_write(prune_attachments, [file_url])
+    release_files(file_url)
     
     socketio.emit('message_deleted', {
         'message_id': message_id,
-        'channel_id': channel_id
+        'channel_id': channel_id,
+        'change_seq': change_seq,
     }, room=str(channel_id))
     
     return jsonify({'success': True})
@@ -845,24 +904,21 @@ def edit_message(message_id):
     
     data = request.get_json(silent=True) or {}
     new_content = data.get('content', '')
+    change_seq = None
     if new_content:
         message.content = new_content
         message.edited_at = datetime.utcnow()
+        change_seq = record_channel_change(message.channel_id, 'edit', message.id)
         db.session.commit()
+        tail_message_edited(message.channel_id, message.id, new_content, message.edited_at)
     
-    # Load reactions
-    reactions_data = {}
-    for reaction in message.reactions:
-        if reaction.emoji not in reactions_data:
-            reactions_data[reaction.emoji] = []
-        reactions_data[reaction.emoji].append(reaction.user.username)
-    
+    # Reactions are unchanged by an edit; clients keep their own summary.
     payload = {
         'message_id': message_id,
         'content': new_content,
         'channel_id': message.channel_id,
-        'edited_at_iso': message.edited_at.strftime('%Y-%m-%dT%H:%M:%SZ'),
-        'reactions': reactions_data
+        'edited_at_iso': message.edited_at.strftime('%Y-%m-%dT%H:%M:%SZ') if message.edited_at else None,
+        'change_seq': change_seq,
     }
 
     # Emit to channel room so all connected clients (except possibly the editor) receive update
@@ -904,7 +960,14 @@ def forward_message(message_id):
         file_size=message.file_size
     )
     db.session.add(new_msg)
+    db.session.flush()
+    change_seq = record_channel_change(target_channel_id, 'new', new_msg.id)
+    bump_unread_counters(target_channel_id, current_user.id)
+    add_message_attachments([(new_msg.file_url, target_channel_id)])
     db.session.commit()
+    # The forward shares the stored file: one more reference to it.
+    acquire_upload_url(new_msg.file_url)
+    tail_message_added(new_msg, author=current_user)
     
     socketio.emit('receive_message', {
         'id': new_msg.id,
@@ -915,8 +978,10 @@ def forward_message(message_id):
         'timestamp_iso': new_msg.timestamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
         'message_type': new_msg.message_type,
         'file_url': new_msg.file_url,
+        'signed_file_url': sign_media_url(new_msg.file_url),
         'file_name': new_msg.file_name,
-        'file_size': new_msg.file_size
+        'file_size': new_msg.file_size,
+        'change_seq': change_seq,
     }, room=str(target_channel_id))
     
     return jsonify({'success': True})
@@ -952,26 +1017,62 @@ def toggle_reaction(message_id):
         )
         db.session.add(reaction)
         action = 'added'
-    
+    change_seq = record_channel_change(
+        message.channel_id, 'reaction', message_id,
+        user_id=current_user.id, emoji=emoji, delta=1 if action == 'added' else -1,
+    )
     db.session.commit()
-    
-    # Get updated reactions
-    reactions = MessageReaction.query.filter_by(message_id=message_id).all()
-    reaction_data = {}
-    for r in reactions:
-        if r.emoji not in reaction_data:
-            reaction_data[r.emoji] = []
-        reaction_data[r.emoji].append(r.user.username)
-    
+    tail_reactions_changed(message.channel_id, message_id)
+
+    # Broadcast a delta (+1/-1 for one user and emoji) with the new emoji count;
+    # clients patch their summary instead of receiving the full reactor list.
+    count = count_emoji_reactions(message_id, emoji)
     socketio.emit('reactions_updated', {
         'message_id': message_id,
-        'reactions': reaction_data,
+        'channel_id': message.channel_id,
         'action': action,
         'emoji': emoji,
-        'user': current_user.username
+        'delta': 1 if action == 'added' else -1,
+        'count': count,
+        'user': current_user.username,
+        'user_id': current_user.id,
+        'change_seq': change_seq,
     }, room=str(message.channel_id))
-    
-    return jsonify({'success': True, 'action': action, 'reactions': reaction_data})
+
+    return jsonify({
+        'success': True,
+        'action': action,
+        'emoji': emoji,
+        'count': count,
+        'reactions': get_reaction_summary(message_id, current_user.id),
+    })
+
+
+@api_bp.route('/api/v1/message/<int:message_id>/reactions', methods=['GET'])
+@login_required
+def list_message_reactions(message_id):
+    # Paginated list of who reacted (optionally to one emoji); cursor = reaction id
+    message = Message.query.get_or_404(message_id)
+    channel = Channel.query.get(message.channel_id)
+    if not channel or not Member.query.filter_by(user_id=current_user.id, room_id=channel.room_id).first():
+        return jsonify({'error': 'Access denied'}), 403
+
+    limit = request.args.get('limit', 50, type=int)
+    if limit < 1:
+        limit = 1
+    if limit > 200:
+        limit = 200
+    emoji = (request.args.get('emoji') or '').strip() or None
+    after_id = request.args.get('after_id', type=int)
+
+    items, next_cursor = list_message_reactors(message_id, emoji=emoji, after_id=after_id, limit=limit)
+    return jsonify({
+        'message_id': message_id,
+        'emoji': emoji,
+        'reactors': items,
+        'count': len(items),
+        'next_cursor': next_cursor,
+    })
 
 # --- ROOM MANAGEMENT ---
 
@@ -986,11 +1087,19 @@ def delete_room(room_id):
     if not has_room_permission(current_user.id, room, 'delete_server'):
         return jsonify({'error': 'no rights to delete the server'}), 403
     
+    channel_ids = [c.id for c in room.channels]
+    file_urls = _message_file_urls(Message.query.filter(Message.channel_id.in_(channel_ids))) if channel_ids else []
+    file_urls.extend([room.avatar_url, room.banner_url] + [c.icon_image_url for c in room.channels])
+    purge_channel_changes(channel_ids)
+    clear_unread_counters(channel_ids=channel_ids)
     # Delete all members first
     Member.query.filter_by(room_id=room_id).delete()
     # Delete room (cascade will delete channels and messages)
     db.session.delete(room)
     db.session.commit()
+    room_deleted(room_id, channel_ids)
+    run_write(prune_attachments, file_urls)
+    release_files(*file_urls)
     
     return jsonify({'success': True})
 
@@ -1017,6 +1126,7 @@ def leave_room(room_id):
     print(f"[LEAVE ROOM] User {current_user.id} left room {room_id}")
     db.session.delete(member)
     db.session.commit()
+    member_left(current_user.id, room_id)
     
     return jsonify({'success': True})
 
@@ -1035,6 +1145,7 @@ def delete_dm(room_id):
     
     db.session.delete(member)
     db.session.commit()
+    member_left(current_user.id, room_id)
     
     return jsonify({'success': True})
 
@@ -1080,6 +1191,7 @@ def join_room_by_invite(token):
     ensure_default_roles(room.id)
     ensure_user_default_roles(current_user.id, room.id)
     db.session.commit()
+    member_joined(current_user.id, room.id)
     
     flash(f'you have joined {room.name}')
     return redirect(url_for('main.view_room', room_id=room.id))
@@ -1128,92 +1240,7 @@ def get_current_user():
 @login_required
 def get_user_rooms():
     # Get all rooms the user is member of - for desktop clients
-    rooms = (
-        Room.query.join(Member)
-        .filter(Member.user_id == current_user.id)
-        .options(
-            subqueryload(Room.channels),
-            subqueryload(Room.members).joinedload(Member.user),
-        )
-        .all()
-    )
-
-    room_ids = [int(r.id) for r in rooms]
-    room_to_my_member = {}
-    for r in rooms:
-        my_member = next((m for m in (r.members or []) if int(m.user_id) == int(current_user.id)), None)
-        room_to_my_member[int(r.id)] = my_member
-
-    # Preload role links for the current user across all rooms to avoid N+1.
-    room_to_role_ids: dict[int, set[int]] = {}
-    all_role_ids: set[int] = set()
-    if room_ids:
-        for link in MemberRole.query.filter(
-            MemberRole.user_id == int(current_user.id),
-            MemberRole.room_id.in_(room_ids),
-        ).all():
-            rid = int(getattr(link, 'role_id', 0) or 0)
-            rm = int(getattr(link, 'room_id', 0) or 0)
-            if rid and rm:
-                room_to_role_ids.setdefault(rm, set()).add(rid)
-                all_role_ids.add(rid)
-
-    role_by_id = {}
-    if all_role_ids:
-        role_by_id = {int(r.id): r for r in Role.query.filter(Role.id.in_(sorted(all_role_ids))).all()}
-
-    rooms_data = []
-    for room in rooms:
-        room_id = int(room.id)
-        my_member = room_to_my_member.get(room_id)
-
-        # Compute permissions without extra DB roundtrips.
-        if my_member and str(getattr(my_member, 'role', 'member') or 'member') in {'owner', 'admin'}:
-            perms = set(ROLE_PERMISSION_KEYS)
-        else:
-            perms = set()
-            for rid in room_to_role_ids.get(room_id, set()):
-                role = role_by_id.get(int(rid))
-                if role and int(getattr(role, 'room_id', 0) or 0) == room_id:
-                    perms |= parse_role_permissions(role)
-
-        room_name = room.name
-        if room.type == 'dm':
-            try:
-                other_member = next((m for m in (room.members or []) if int(m.user_id) != int(current_user.id)), None)
-                if other_member and other_member.user and other_member.user.username:
-                    room_name = other_member.user.username
-            except Exception:
-                room_name = room.name
-
-        room_dict = {
-            'id': room_id,
-            'name': room_name,
-            'type': room.type,
-            'my_role': getattr(my_member, 'role', None) if my_member else 'member',
-            'my_permissions': sorted(list(perms)),
-            'is_public': bool(room.is_public),
-            'description': getattr(room, 'description', None) or '',
-            'avatar_url': room.avatar_url,
-            'banner_url': getattr(room, 'banner_url', None),
-            'member_count': len(room.members or []),
-            'channels': []
-        }
-
-        for channel in (room.channels or []):
-            channel_dict = {
-                'id': channel.id,
-                'name': channel.name,
-                'description': channel.description,
-                'icon_emoji': channel.icon_emoji,
-                'icon_image_url': channel.icon_image_url,
-                'writer_role_ids': json.loads(channel.writer_role_ids_json or '[]') if getattr(channel, 'writer_role_ids_json', None) else [],
-            }
-            room_dict['channels'].append(channel_dict)
-
-        rooms_data.append(room_dict)
-
-    return jsonify({'rooms': rooms_data})
+    return jsonify({'rooms': serialize_user_rooms(current_user.id)})
 
 
 @api_bp.route('/api/v1/room/<int:room_id>/members', methods=['GET'])
@@ -1234,13 +1261,14 @@ def get_room_members(room_id):
     for m in members:
         if not m.user:
             continue
+        presence_status, _last_seen = presence.status_of(m.user)
         payload.append({
             'id': m.user.id,
             'username': m.user.username,
             'avatar_url': m.user.avatar_url or 'https://placehold.co/50x50',
             'role': m.role,
             'role_ids': sorted(role_map.get(m.user.id, [])),
-            'presence_status': 'hidden' if getattr(m.user, 'hide_status', False) else (m.user.presence_status or 'offline'),
+            'presence_status': presence_status,
             'muted_until': m.muted_until.isoformat() if getattr(m, 'muted_until', None) else None,
         })
 
@@ -1323,8 +1351,11 @@ def upload_room_avatar_api(room_id):
     filepath = save_file(file, 'room_avatars')
     if not filepath:
         return jsonify({'error': 'failed to save avatar'}), 500
+    old_avatar_url = room.avatar_url
     room.avatar_url = filepath
     db.session.commit()
+    if old_avatar_url != filepath:
+        release_files(old_avatar_url)
     return jsonify({'success': True, 'avatar_url': room.avatar_url})
 
 
@@ -1342,8 +1373,11 @@ def upload_room_banner_api(room_id):
     filepath = save_file(file, 'room_avatars')
     if not filepath:
         return jsonify({'error': 'failed to save banner'}), 500
+    old_banner_url = room.banner_url
     room.banner_url = filepath
     db.session.commit()
+    if old_banner_url != filepath:
+        release_files(old_banner_url)
     return jsonify({'success': True, 'banner_url': room.banner_url})
 
 
@@ -1353,8 +1387,10 @@ def delete_room_banner_api(room_id):
     room = Room.query.get_or_404(room_id)
     if not has_room_permission(current_user.id, room, 'manage_server'):
         return jsonify({'error': 'Access denied'}), 403
+    old_banner_url = room.banner_url
     room.banner_url = None
     db.session.commit()
+    release_files(old_banner_url)
     return jsonify({'success': True})
 
 
@@ -1424,6 +1460,7 @@ def create_room_role(room_id):
     )
     db.session.add(role)
     db.session.commit()
+    role_changed(room_id, role.id)
     return jsonify({'success': True, 'role_id': role.id})
 
 
@@ -1463,6 +1500,7 @@ def update_room_role(room_id, role_id):
         role.permissions_json = json.dumps(sorted(list(set(cleaned))))
 
     db.session.commit()
+    role_changed(room_id, role.id)
     return jsonify({'success': True})
 
 
@@ -1484,9 +1522,11 @@ def delete_room_role(room_id, role_id):
             RoleMentionPermission.target_role_id == role.id,
         )
     ).delete(synchronize_session=False)
+    deleted_role_id = role.id
     MemberRole.query.filter_by(room_id=room_id, role_id=role.id).delete(synchronize_session=False)
     db.session.delete(role)
     db.session.commit()
+    role_changed(room_id, deleted_role_id)
     return jsonify({'success': True})
 
 
@@ -1521,6 +1561,7 @@ def update_role_mention_permissions(room_id, target_role_id):
             ))
 
     db.session.commit()
+    invalidate_room_permission_contexts(room_id, valid_ids | existing_ids)
     return jsonify({'success': True, 'target_role_id': target_role.id, 'source_role_ids': sorted(valid_ids)})
 
 
@@ -1568,6 +1609,7 @@ def assign_member_roles(room_id, user_id):
         member.role = 'member'
 
     db.session.commit()
+    member_role_changed(user_id, room_id)
     try:
         for m in Member.query.filter_by(room_id=room_id).all():
             socketio.emit('room_state_refresh', {'room_id': room_id}, room=f"user_{m.user_id}")
@@ -1575,6 +1617,11 @@ def assign_member_roles(room_id, user_id):
         pass
     return jsonify({'success': True, 'user_id': user_id, 'role_ids': sorted(valid_ids)})
 
+def _channel_has_message(channel_id, condition):
+    # One index probe: is there any message of the channel matching `condition`?
+    return db.session.query(Message.id).filter(Message.channel_id == channel_id, condition).limit(1).first() is not None
+
+
 @api_bp.route('/api/v1/channel/<int:channel_id>/messages', methods=['GET'])
 @login_required
 def get_channel_messages(channel_id):
@@ -1589,67 +1636,198 @@ def get_channel_messages(channel_id):
 
     rm = ReadMessage.query.filter_by(user_id=current_user.id, channel_id=channel_id).first()
     last_read_message_id = rm.last_read_message_id if rm else None
+    # Read before the page so /changes?since=<change_seq> can only overlap it, never miss anything.
+    change_seq = get_channel_change_seq(channel_id)
     
     limit = request.args.get('limit', 50, type=int)
-    offset = request.args.get('offset', 0, type=int)
     if limit < 1:
         limit = 1
     if limit > 200:
         limit = 200
+
+    # Keyset pagination by message id (uses ix_message_channel_id_id):
+    #   before_id=X  -> `limit` messages older than X
+    #   after_id=X   -> `limit` messages newer than X
+    #   around_id=X  -> page centered on X; `around_id=last_read` centers on last_read_message_id
+    # `offset` is deprecated (cost grows with the offset) and only kept for old clients.
+    before_id = request.args.get('before_id', type=int)
+    after_id = request.args.get('after_id', type=int)
+    around_raw = (request.args.get('around_id') or '').strip().lower()
+    around_id = None
+    if around_raw in {'last_read', 'last-read', 'unread'}:
+        around_id = last_read_message_id
+    elif around_raw:
+        try:
+            around_id = int(around_raw)
+        except Exception:
+            return jsonify({'error': 'Invalid around_id'}), 400
+    offset_raw = request.args.get('offset')
+    offset = request.args.get('offset', 0, type=int)
     if offset < 0:
         offset = 0
-    
-    messages = (
-        Message.query.filter_by(channel_id=channel_id)
-        .options(
-            joinedload(Message.user),
-            subqueryload(Message.reactions).joinedload(MessageReaction.user),
+
+    base_query = Message.query.filter_by(channel_id=channel_id).options(joinedload(Message.user))
+    has_more_before = False
+    has_more_after = False
+    deprecated_offset = False
+    messages_data = None
+    cached = None
+    if around_id is None and after_id is None and before_id is None and not offset_raw:
+        # First page: served from the hot-channel tail cache when possible.
+        cached = get_channel_tail_page(channel_id, limit, current_user.id)
+
+    if cached is not None:
+        messages_data, has_more_before = cached
+    elif around_id is not None:
+        older_limit = limit // 2
+        newer_limit = limit - older_limit
+        older = (
+            base_query.filter(Message.id < around_id)
+            .order_by(Message.id.desc())
+            .limit(older_limit + 1)
+            .all()
         )
-        .order_by(Message.timestamp.desc())
-        .limit(limit)
-        .offset(offset)
-        .all()
-    )
-    
-    messages_data = []
-    for msg in reversed(messages):
-        reactions = {}
-        for reaction in msg.reactions:
-            if reaction.emoji not in reactions:
-                reactions[reaction.emoji] = []
-            reactions[reaction.emoji].append(reaction.user.username)
-        
-        msg_dict = {
-            'id': msg.id,
-            'user_id': msg.user_id,
-            'username': msg.user.username if msg.user else 'Unknown',
-            'avatar_url': msg.user.avatar_url if msg.user else None,
-            'content': msg.content,
-            'message_type': msg.message_type,
-            'timestamp': msg.timestamp.isoformat(),
-            'edited_at': msg.edited_at.isoformat() if msg.edited_at else None,
-            'file_url': msg.file_url,
-            'file_name': msg.file_name,
-            'file_size': msg.file_size,
-            'reactions': reactions,
-            'reply_to_id': msg.reply_to_id
-        }
-        messages_data.append(msg_dict)
-    
-    return jsonify({'messages': messages_data, 'count': len(messages_data), 'last_read_message_id': last_read_message_id})
+        newer = (
+            base_query.filter(Message.id >= around_id)
+            .order_by(Message.id.asc())
+            .limit(newer_limit + 1)
+            .all()
+        )
+        has_more_before = len(older) > older_limit
+        has_more_after = len(newer) > newer_limit
+        messages = list(reversed(older[:older_limit])) + newer[:newer_limit]
+    elif after_id is not None:
+        rows = (
+            base_query.filter(Message.id > after_id)
+            .order_by(Message.id.asc())
+            .limit(limit + 1)
+            .all()
+        )
+        has_more_after = len(rows) > limit
+        messages = rows[:limit]
+        has_more_before = _channel_has_message(channel_id, Message.id <= after_id)
+    elif before_id is not None or not offset_raw:
+        query = base_query
+        if before_id is not None:
+            query = query.filter(Message.id < before_id)
+        rows = query.order_by(Message.id.desc()).limit(limit + 1).all()
+        has_more_before = len(rows) > limit
+        messages = list(reversed(rows[:limit]))
+        has_more_after = before_id is not None and _channel_has_message(channel_id, Message.id >= before_id)
+    else:
+        # Deprecated: OFFSET pagination by timestamp.
+        deprecated_offset = True
+        rows = (
+            base_query.order_by(Message.timestamp.desc())
+            .limit(limit)
+            .offset(offset)
+            .all()
+        )
+        has_more_before = len(rows) == limit
+        has_more_after = offset > 0
+        messages = list(reversed(rows))
+
+    if messages_data is None:
+        reaction_summaries = get_reaction_summaries([msg.id for msg in messages], current_user.id)
+        messages_data = [serialize_history_message(msg, reaction_summaries.get(msg.id)) for msg in messages]
+    add_signed_media_urls(messages_data)
+
+    oldest_id = messages_data[0]['id'] if messages_data else None
+    newest_id = messages_data[-1]['id'] if messages_data else None
+    response = jsonify({
+        'messages': messages_data,
+        'count': len(messages_data),
+        'last_read_message_id': last_read_message_id,
+        'has_more_before': has_more_before,
+        'has_more_after': has_more_after,
+        # Pass as before_id / after_id to fetch the adjacent page.
+        'prev_cursor': oldest_id if has_more_before and oldest_id is not None else None,
+        'next_cursor': newest_id if has_more_after and newest_id is not None else None,
+        'change_seq': change_seq,
+    })
+    if deprecated_offset:
+        response.headers['Deprecation'] = 'true'
+    return response
+
+
+@api_bp.route('/api/v1/channel/<int:channel_id>/changes', methods=['GET'])
+@login_required
+def get_channel_changes(channel_id):
+    # Delta sync after a reconnect: everything that changed after `since` (a change_seq)
+    channel = Channel.query.get_or_404(channel_id)
+    member = Member.query.filter_by(user_id=current_user.id, room_id=channel.room_id).first()
+    if not member:
+        return jsonify({'error': 'Access denied'}), 403
+
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'error': 'since is required'}), 400
+    limit = request.args.get('limit', 500, type=int)
+    if limit < 1:
+        limit = 1
+    if limit > 1000:
+        limit = 1000
+
+    delta, last_seq, has_more = collect_channel_changes(channel_id, since, limit=limit)
+
+    new_messages = []
+    if delta['new']:
+        rows = (
+            Message.query.filter(Message.channel_id == channel_id, Message.id.in_(delta['new']))
+            .options(joinedload(Message.user))
+            .order_by(Message.id.asc())
+            .all()
+        )
+        summaries = get_reaction_summaries([m.id for m in rows], current_user.id)
+        new_messages = add_signed_media_urls([serialize_history_message(m, summaries.get(m.id)) for m in rows])
+
+    edited = []
+    if delta['edited']:
+        edited = [
+            {
+                'id': mid,
+                'content': content,
+                'edited_at': edited_at.isoformat() if edited_at else None,
+            }
+            for mid, content, edited_at in (
+                db.session.query(Message.id, Message.content, Message.edited_at)
+                .filter(Message.channel_id == channel_id, Message.id.in_(delta['edited']))
+                .all()
+            )
+        ]
+
+    # Current totals for every touched (message, emoji) so replaying deltas stays idempotent.
+    counts = get_emoji_counts((r['message_id'], r['emoji']) for r in delta['reactions'])
+    reaction_counts = [
+        {'message_id': mid, 'emoji': emoji, 'count': count}
+        for (mid, emoji), count in sorted(counts.items(), key=lambda item: (item[0][0], item[0][1] or ''))
+    ]
+
+    return jsonify({
+        'channel_id': channel_id,
+        'since': since,
+        'change_seq': last_seq,
+        'has_more': has_more,
+        'new': new_messages,
+        'edited': edited,
+        'deleted': delta['deleted'],
+        'reactions': delta['reactions'],
+        'reaction_counts': reaction_counts,
+    })
 
 @api_bp.route('/api/v1/user/<int:user_id>/profile', methods=['GET'])
 @login_required
 def get_user_profile(user_id):
     # Get user profile - for desktop clients
     user = User.query.get_or_404(user_id)
+    presence_status, last_seen = presence.status_of(user)
     return jsonify({
         'id': user.id,
         'username': user.username,
         'avatar_url': user.avatar_url or 'https://placehold.co/50x50',
         'bio': user.bio or '',
-        'presence_status': user.presence_status or 'offline' if not user.hide_status else 'hidden',
-        'last_seen': user.last_seen.isoformat() if user.last_seen else None
+        'presence_status': presence_status,
+        'last_seen': last_seen.isoformat() if last_seen else None
     })
 
 @api_bp.route('/api/v1/room/<int:room_id>/join', methods=['POST'])
@@ -1680,6 +1858,7 @@ def join_room_api(room_id):
     ensure_default_roles(room_id)
     ensure_user_default_roles(current_user.id, room_id)
     db.session.commit()
+    member_joined(current_user.id, room_id)
 
     return jsonify({'success': True, 'message': 'Joined room'})
 
@@ -1757,8 +1936,11 @@ def ban_user(user_id):
                 try:
                     channel_ids = [c.id for c in target_membership.room.channels]
                     if channel_ids:
+                        record_bulk_message_deletes(Message.query.filter(Message.user_id == user_id, Message.channel_id.in_(channel_ids)))
                         deleted = Message.query.filter(Message.user_id == user_id, Message.channel_id.in_(channel_ids)).delete(synchronize_session=False)
+                        recount_unread_counters(channel_ids)
                         db.session.commit()
+                        drop_channel_tails(channel_ids)
                         try:
                             socketio.emit('bulk_messages_deleted', {'user_id': user_id, 'room_id': room_id, 'deleted': deleted}, room=str(room_id))
                         except Exception:
@@ -1787,6 +1969,7 @@ def ban_user(user_id):
             # Delete the member record so server doesn't appear in dashboard
             db.session.delete(target_membership)
             db.session.commit()
+            member_left(user_id, room_id)
 
             # Notify room members to remove this member from UI
             try:
@@ -1856,12 +2039,18 @@ def ban_user(user_id):
     for m in memberships:
         db.session.delete(m)
     db.session.commit()
+    for rid in set(room_ids):
+        member_left(user_id, rid)
 
     # Optional deletion of all messages for global ban
     if data.get('delete_messages'):
         try:
+            record_bulk_message_deletes(Message.query.filter(Message.user_id == user_id))
+            touched_channel_ids = [int(cid) for (cid,) in db.session.query(Message.channel_id).filter(Message.user_id == user_id).distinct().all()]
             deleted = Message.query.filter(Message.user_id == user_id).delete(synchronize_session=False)
+            recount_unread_counters(touched_channel_ids)
             db.session.commit()
+            clear_tail_cache()
             try:
                 for rid in set(room_ids):
                     try:
@@ -2055,6 +2244,22 @@ def get_banned_ips():
         'total_ips': len(banned_ips_list)
     })
 
+@api_bp.route('/admin/metrics', methods=['GET'])
+@login_required
+def get_admin_metrics():
+    # In-process cache and performance counters
+    if not current_user.is_superuser:
+        return jsonify({'error': 'not enough rights'}), 403
+
+    return jsonify({
+        'success': True,
+        'message_tail_cache': get_tail_cache_stats(),
+        'sql': get_sql_metrics_stats(),
+        'write_queue': get_write_queue_stats(),
+        'upload_acl_cache': get_upload_acl_cache_stats(),
+        'media_delivery': media_delivery_mode(),
+    })
+
 @api_bp.route('/admin/user/<int:user_id>/kick_from_room/<int:room_id>', methods=['POST'])
 @login_required
 def kick_user_from_room(user_id, room_id):
@@ -2091,6 +2296,7 @@ def kick_user_from_room(user_id, room_id):
 
     db.session.delete(target_member)
     db.session.commit()
+    member_left(user_id, room_id)
 
     # Notify room and target user
     try:
@@ -2224,6 +2430,7 @@ def promote_user(user_id):
     ensure_default_roles(room_id)
     ensure_user_default_roles(user_id, room_id)
     db.session.commit()
+    member_role_changed(user_id, room_id)
 
     return jsonify({'success': True, 'message': 'user promoted to admin'})
 
@@ -2275,6 +2482,7 @@ def demote_user(user_id):
         for link in links:
             db.session.delete(link)
     db.session.commit()
+    member_role_changed(user_id, room_id)
 
     return jsonify({'success': True, 'message': 'user is demoted to member'})
 
@@ -2320,8 +2528,11 @@ def delete_user_messages(user_id):
         return jsonify({'success': True, 'deleted': 0})
 
     # delete messages from these channels by user
+    record_bulk_message_deletes(Message.query.filter(Message.user_id == user_id, Message.channel_id.in_(channel_ids)))
     deleted = Message.query.filter(Message.user_id == user_id, Message.channel_id.in_(channel_ids)).delete(synchronize_session=False)
+    recount_unread_counters(channel_ids)
     db.session.commit()
+    drop_channel_tails(channel_ids)
 
     # Notify room listeners that messages from this user were removed
     socketio.emit('bulk_messages_deleted', {'user_id': user_id, 'room_id': room_id, 'deleted': deleted}, room=str(room_id))
@@ -0,0 +1,149 @@
+import hashlib
+import json
+
+from flask import request, jsonify, current_app
+from flask_login import login_required, current_user
+from sqlalchemy import and_, or_, func, case
+from sqlalchemy.orm import joinedload
+
+from app.extensions import db
+from app.models import Channel, Member, Message, ReadMessage, FriendRequest
+from app.functions import (
+    serialize_user_rooms, serialize_history_message, get_channel_tail_page, get_reaction_summaries,
+    get_channel_change_seq, add_signed_media_urls
+)
+
+
+def _friend_request_counts(user_id):
+    # Pending incoming/outgoing requests in one grouped query.
+    incoming, outgoing = (
+        db.session.query(
+            func.coalesce(func.sum(case((FriendRequest.to_user_id == user_id, 1), else_=0)), 0),
+            func.coalesce(func.sum(case((FriendRequest.from_user_id == user_id, 1), else_=0)), 0),
+        )
+        .filter(
+            FriendRequest.status == 'pending',
+            or_(FriendRequest.to_user_id == user_id, FriendRequest.from_user_id == user_id),
+        )
+        .one()
+    )
+    return {'incoming': int(incoming or 0), 'outgoing': int(outgoing or 0)}
+
+
+def _resolve_channel(user_id, channel_id):
+    # (channel_id, room_id, last_read_message_id) of a channel the user can read, or None.
+    # Without an explicit id the most recently read channel ("last opened") is used.
+    query = (
+        db.session.query(Channel.id, Channel.room_id, ReadMessage.last_read_message_id)
+        .join(Member, and_(Member.room_id == Channel.room_id, Member.user_id == user_id))
+        .outerjoin(ReadMessage, and_(ReadMessage.channel_id == Channel.id, ReadMessage.user_id == user_id))
+    )
+    if channel_id is not None:
+        return query.filter(Channel.id == channel_id).first()
+    return (
+        query.filter(ReadMessage.id.isnot(None))
+        .order_by(ReadMessage.last_read_at.desc(), ReadMessage.id.desc())
+        .first()
+    )
+
+
+def _first_message_page(user_id, channel_id, limit):
+    # Same first page as GET /api/v1/channel/<id>/messages without a cursor.
+    cached = get_channel_tail_page(channel_id, limit, user_id)
+    if cached is not None:
+        return cached
+    rows = (
+        Message.query.filter_by(channel_id=channel_id)
+        .options(joinedload(Message.user))
+        .order_by(Message.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    messages = list(reversed(rows[:limit]))
+    summaries = get_reaction_summaries([m.id for m in messages], user_id)
+    return [serialize_history_message(m, summaries.get(m.id)) for m in messages], len(rows) > limit
+
+
+def register_bootstrap_routes(api_bp):
+    @api_bp.route('/api/v1/bootstrap', methods=['GET'])
+    @login_required
+    def bootstrap():
+        # Everything the SPA needs on a cold start in one response:
+        #   ?channel_id=<id>  first message page of that channel (default: last opened one)
+        #   ?channel_id=0     no message page
+        #   ?limit=<n>        page size (1..200, default 50)
+        # Answers If-None-Match with 304 when nothing changed.
+        user_id = int(current_user.id)
+
+        channel_raw = (request.args.get('channel_id') or '').strip().lower()
+        want_channel = channel_raw not in {'0', 'none', 'false'}
+        channel_id = None
+        if want_channel and channel_raw:
+            try:
+                channel_id = int(channel_raw)
+            except Exception:
+                return jsonify({'error': 'Invalid channel_id'}), 400
+        limit = request.args.get('limit', 50, type=int)
+        if limit < 1:
+            limit = 1
+        if limit > 200:
+            limit = 200
+
+        rooms = serialize_user_rooms(user_id)
+
+        channel_payload = None
+        target = _resolve_channel(user_id, channel_id) if want_channel else None
+        if target is not None:
+            target_channel_id, target_room_id, last_read_message_id = target
+            # Read before the page so /changes?since=<change_seq> can only overlap it.
+            change_seq = get_channel_change_seq(target_channel_id)
+            messages_data, has_more_before = _first_message_page(user_id, int(target_channel_id), limit)
+            oldest_id = messages_data[0]['id'] if messages_data else None
+            channel_payload = {
+                'channel_id': int(target_channel_id),
+                'room_id': int(target_room_id),
+                'messages': messages_data,
+                'count': len(messages_data),
+                'last_read_message_id': last_read_message_id,
+                'has_more_before': has_more_before,
+                'has_more_after': False,
+                'prev_cursor': oldest_id if has_more_before and oldest_id is not None else None,
+                'next_cursor': None,
+                'change_seq': change_seq,
+            }
+
+        payload = {
+            'user': {
+                'id': current_user.id,
+                'username': current_user.username,
+                'avatar_url': current_user.avatar_url or 'https://placehold.co/50x50',
+                'bio': current_user.bio or '',
+                'presence_status': current_user.presence_status or 'offline',
+                'hide_status': current_user.hide_status or False,
+                'is_superuser': current_user.is_superuser or False,
+            },
+            'session': {
+                'cookie_name': current_app.config.get('SESSION_COOKIE_NAME', 'session'),
+                'remember_cookie_name': current_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token'),
+                'auth_mode': request.cookies.get('boxchat_auth_mode', 'session'),
+                'uid_cookie': request.cookies.get('boxchat_uid'),
+            },
+            'rooms': rooms,
+            'unread_total': sum(int(r.get('unread_count') or 0) for r in rooms),
+            'friend_requests': _friend_request_counts(user_id),
+            'channel': channel_payload,
+        }
+
+        # The ETag leaves out signed media URLs (they change every few minutes);
+        # an expired one still works through the cookie check.
+        etag = hashlib.sha1(
+            json.dumps(payload, separators=(',', ':'), sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        if channel_payload is not None:
+            add_signed_media_urls(channel_payload['messages'])
+        body = json.dumps(payload, separators=(',', ':'), sort_keys=True, default=str)
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(etag, weak=True)
+        # Always revalidate: the body is per user and changes with every message.
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
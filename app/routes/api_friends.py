@@ -140,7 +140,7 @@ def register_friends_routes(api_bp):
     @login_required
     def respond_friend_request(request_id):
         from app.models import FriendRequest, Friendship
-        from app.functions import ensure_default_roles, ensure_user_default_roles
+        from app.functions import ensure_default_roles, ensure_user_default_roles, member_joined
 
         fr = FriendRequest.query.get_or_404(request_id)
         if fr.to_user_id != current_user.id:
@@ -201,6 +201,9 @@ def register_friends_routes(api_bp):
         fr.status = 'accepted'
         fr.responded_at = now
         db.session.commit()
+        if dm_room_id and not existing_dm:
+            member_joined(fr.from_user_id, dm_room_id)
+            member_joined(fr.to_user_id, dm_room_id)
         socketio.emit('friend_request_updated', {
             'request_id': fr.id,
             'status': 'accepted',
@@ -213,7 +216,7 @@ def register_friends_routes(api_bp):
     @api_bp.route('/api/v1/dm/<int:user_id>/create', methods=['POST'])
     @login_required
     def create_dm(user_id):
-        from app.functions import ensure_default_roles, ensure_user_default_roles
+        from app.functions import ensure_default_roles, ensure_user_default_roles, member_joined
 
         user = User.query.get_or_404(user_id)
 
@@ -245,5 +248,7 @@ def register_friends_routes(api_bp):
         ensure_user_default_roles(current_user.id, dm.id)
         ensure_user_default_roles(user_id, dm.id)
         db.session.commit()
+        member_joined(current_user.id, dm.id)
+        member_joined(user_id, dm.id)
 
         return jsonify({'success': True, 'room_id': dm.id})
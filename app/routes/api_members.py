@@ -0,0 +1,52 @@
+from flask import request, jsonify
+from flask_login import login_required, current_user
+
+from app.models import Member
+from app.functions import member_list_snapshot, search_room_members
+from app.functions.member_list import GROUP_ORDER
+
+
+def register_member_list_routes(api_bp):
+    @api_bp.route('/api/v1/room/<int:room_id>/member_list', methods=['GET'])
+    @login_required
+    def get_room_member_list_range(room_id):
+        # One range of the presence-sorted member list:
+        #   ?start=0&limit=100          flat positions over all groups
+        #   ?group=online&start=0       positions inside one group
+        if not Member.query.filter_by(user_id=current_user.id, room_id=room_id).first():
+            return jsonify({'error': 'Access denied'}), 403
+        group = (request.args.get('group') or '').strip().lower() or None
+        if group is not None and group not in GROUP_ORDER:
+            return jsonify({'error': 'Invalid group'}), 400
+        start = request.args.get('start', 0, type=int)
+        if start < 0:
+            start = 0
+        limit = request.args.get('limit', 100, type=int)
+        if limit < 1:
+            limit = 1
+        if limit > 200:
+            limit = 200
+
+        groups, total, flat_start, members = member_list_snapshot(room_id, start, limit, group=group)
+        return jsonify({
+            'room_id': room_id,
+            'groups': groups,
+            'total': total,
+            'group': group,
+            'start': flat_start,
+            'members': members,
+        })
+
+    @api_bp.route('/api/v1/room/<int:room_id>/members/search', methods=['GET'])
+    @login_required
+    def search_room_members_prefix(room_id):
+        # Mention autocomplete: members whose username starts with `prefix`.
+        if not Member.query.filter_by(user_id=current_user.id, room_id=room_id).first():
+            return jsonify({'error': 'Access denied'}), 403
+        prefix = (request.args.get('prefix') or '').strip()
+        limit = request.args.get('limit', 10, type=int)
+        if limit < 1:
+            limit = 1
+        if limit > 25:
+            limit = 25
+        return jsonify({'room_id': room_id, 'members': search_room_members(room_id, prefix, limit)})
@@ -4,6 +4,7 @@ from sqlalchemy import func
 
 from app.extensions import db
 from app.models import Room, Member
+from app.functions.search import fts_available, parse_search_cursor, search_messages
 
 
 def register_search_routes(api_bp):
@@ -41,3 +42,38 @@ def register_search_routes(api_bp):
         } for r, member_count in rows]
 
         return jsonify({'servers': rooms_data})
+
+    @api_bp.route('/api/v1/search/messages', methods=['GET'])
+    @login_required
+    def search_messages_api():
+        query = request.args.get('q', '', type=str).strip()
+        if not query:
+            return jsonify({'messages': [], 'next_cursor': None})
+        if len(query) > 200:
+            return jsonify({'error': 'query is too long'}), 400
+        if not fts_available():
+            return jsonify({'error': 'Message search is not available'}), 503
+
+        sort = request.args.get('sort', 'relevance', type=str)
+        if sort not in {'relevance', 'recent'}:
+            sort = 'relevance'
+        limit = request.args.get('limit', 20, type=int)
+        if limit < 1:
+            limit = 1
+        if limit > 50:
+            limit = 50
+        cursor_raw = request.args.get('cursor', '', type=str).strip()
+        cursor = parse_search_cursor(cursor_raw)
+        if cursor_raw and cursor is None:
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+        items, next_cursor, sort = search_messages(
+            current_user.id,
+            query,
+            sort=sort,
+            room_id=request.args.get('room_id', type=int),
+            channel_id=request.args.get('channel_id', type=int),
+            cursor=cursor,
+            limit=limit,
+        )
+        return jsonify({'messages': items, 'next_cursor': next_cursor, 'sort': sort})
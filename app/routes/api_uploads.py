@@ -0,0 +1,94 @@
+from flask import request, jsonify, current_app
+from flask_login import login_required, current_user
+
+from app.extensions import db
+from app.functions import (
+    create_upload_session, get_upload_session, upload_progress, append_upload_chunk, finalize_upload,
+    abort_upload
+)
+from app.functions.uploads import UploadError
+
+
+def _upload_folder():
+    return current_app.config.get('UPLOAD_FOLDER', 'uploads')
+
+
+def register_upload_routes(api_bp):
+    # Resumable chunked uploads (see app/functions/uploads.py):
+    #   POST   /api/v1/uploads                      {filename, size} -> session + chunk_size
+    #   PUT    /api/v1/uploads/<id>/chunks/<index>  raw bytes of chunk <index>
+    #   GET    /api/v1/uploads/<id>                 progress (received, next_chunk)
+    #   POST   /api/v1/uploads/<id>/complete        -> same body as /upload_file
+    #   DELETE /api/v1/uploads/<id>                 abort
+
+    @api_bp.route('/api/v1/uploads', methods=['POST'])
+    @login_required
+    def create_chunked_upload():
+        data = request.get_json(silent=True) or {}
+        try:
+            upload = create_upload_session(
+                current_user.id,
+                str(data.get('filename') or ''),
+                data.get('size'),
+                _upload_folder(),
+                max_size=current_app.config.get('MAX_CONTENT_LENGTH'),
+            )
+        except UploadError as e:
+            return jsonify({'error': str(e)}), e.status
+        return jsonify(upload_progress(upload)), 201
+
+    @api_bp.route('/api/v1/uploads/<upload_id>', methods=['GET'])
+    @login_required
+    def get_chunked_upload(upload_id):
+        upload = get_upload_session(upload_id, current_user.id)
+        if not upload:
+            return jsonify({'error': 'upload not found'}), 404
+        return jsonify(upload_progress(upload))
+
+    @api_bp.route('/api/v1/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+    @login_required
+    def put_upload_chunk(upload_id, index):
+        upload = get_upload_session(upload_id, current_user.id)
+        if not upload:
+            return jsonify({'error': 'upload not found'}), 404
+        # Optional cross-check of the client's idea of the offset.
+        offset = request.headers.get('Upload-Offset')
+        if offset is not None:
+            try:
+                offset = int(offset)
+            except Exception:
+                return jsonify({'error': 'invalid Upload-Offset'}), 400
+            if offset != index * int(upload.chunk_size):
+                return jsonify({'error': 'Upload-Offset does not match the chunk index'}), 400
+        try:
+            progress = append_upload_chunk(
+                upload, index, request.stream, request.content_length, _upload_folder()
+            )
+        except UploadError as e:
+            # Report where the upload really stands so the client can resume from there.
+            db.session.expire_all()
+            upload = get_upload_session(upload_id, current_user.id)
+            body = dict(upload_progress(upload), error=str(e)) if upload else {'error': str(e)}
+            return jsonify(body), e.status
+        return jsonify(progress)
+
+    @api_bp.route('/api/v1/uploads/<upload_id>/complete', methods=['POST'])
+    @login_required
+    def complete_chunked_upload(upload_id):
+        upload = get_upload_session(upload_id, current_user.id)
+        if not upload:
+            return jsonify({'error': 'upload not found'}), 404
+        try:
+            result = finalize_upload(upload, _upload_folder())
+        except UploadError as e:
+            return jsonify({'error': str(e)}), e.status
+        return jsonify(dict(result, success=True))
+
+    @api_bp.route('/api/v1/uploads/<upload_id>', methods=['DELETE'])
+    @login_required
+    def abort_chunked_upload(upload_id):
+        upload = get_upload_session(upload_id, current_user.id)
+        if not upload:
+            return jsonify({'error': 'upload not found'}), 404
+        abort_upload(upload, _upload_folder())
+        return jsonify({'success': True})
@@ -6,7 +6,7 @@ from datetime import datetime
 from app.extensions import db, socketio
 from app.models import Room, Channel, Member, Message, ReadMessage, User, RoomBan
 from app.routes.spa import send_spa_index
-from app.functions import ensure_default_roles, ensure_user_default_roles
+from app.functions import ensure_default_roles, ensure_user_default_roles, member_joined
 
 main_bp = Blueprint('main', __name__)
 
@@ -84,6 +84,7 @@ def create_room():
     ensure_default_roles(new_room.id)
     ensure_user_default_roles(current_user.id, new_room.id)
     db.session.commit()
+    member_joined(current_user.id, new_room.id)
     
     return redirect(url_for('main.view_room', room_id=new_room.id))
 
@@ -120,6 +121,8 @@ def start_dm(user_id):
     ensure_user_default_roles(current_user.id, room.id)
     ensure_user_default_roles(other.id, room.id)
     db.session.commit()
+    member_joined(current_user.id, room.id)
+    member_joined(other.id, room.id)
     
     # Notify other user via Socket.IO
     socketio.emit('new_dm_created', {
@@ -157,6 +160,7 @@ def join_room_view(room_id):
             ensure_default_roles(room_id)
             ensure_user_default_roles(current_user.id, room_id)
             db.session.commit()
+            member_joined(current_user.id, room_id)
     
     return redirect(url_for('main.view_room', room_id=room_id))
 
@@ -185,5 +189,6 @@ def join_room_by_invite(token):
         ensure_default_roles(room.id)
         ensure_user_default_roles(current_user.id, room.id)
         db.session.commit()
+        member_joined(current_user.id, room.id)
     
     return redirect(url_for('main.view_room', room_id=room.id))
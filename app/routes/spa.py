@@ -1,38 +1,248 @@
 from __future__ import annotations
 
+# SPA shell and static assets from frontend/dist
+#
+# The dist tree is indexed once (at blueprint registration, then again when
+# it changes) instead of stat-ing every request path:
+#   - index.html is kept in memory with a strong ETag and its .br / .gz copies
+#     (gzipped in memory when there is no .gz), so a navigation is a dict
+#     lookup plus a 304 check;
+#   - hashed Vite assets (assets/<name>-<hash>.<ext>) are sent with
+#     `public, max-age=31536000, immutable`, everything else revalidates;
+#   - a `<file>.br` / `<file>.gz` next to a file (tools/precompress_frontend.py)
+#     is sent to clients that accept it; compressible files without a .gz get
+#     an in-memory gzip copy.
+# The dist directory and index.html are re-stat-ed at most every
+# BOXCHAT_SPA_RELOAD_SECONDS and the index is rebuilt after `npm run build`.
+
+import gzip
+import hashlib
+import mimetypes
 import os
-from flask import Blueprint, current_app, send_from_directory
+import re
+import threading
+import time
+from flask import Blueprint, current_app, request
+from werkzeug.utils import send_file
 
 spa_bp = Blueprint('spa', __name__)
 
+MISSING_BUILD_MESSAGE = (
+    "frontend build is missing: expected frontend/dist/index.html. "
+    "Run: cd frontend && npm install && npm run build"
+)
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+# Vite output names: assets/index-<8+ char base64url hash>.js
+_HASHED_ASSET_RE = re.compile(r'^assets/.+-[A-Za-z0-9_-]{8,}\.[A-Za-z0-9]+$')
+_COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/wasm')
+_ENCODING_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+_MIN_COMPRESS_BYTES = 1024
+
+
+def spa_reload_seconds() -> float:
+    # 0 never looks at the dist directory again after startup
+    try:
+        return max(0.0, float(os.environ.get('BOXCHAT_SPA_RELOAD_SECONDS') or 2))
+    except Exception:
+        return 2.0
 
-def _dist_dir() -> str:
-    dist_dir = current_app.config.get('FRONTEND_DIST_DIR')
+
+def _dist_dir(app=None) -> str:
+    app = app or current_app
+    dist_dir = app.config.get('FRONTEND_DIST_DIR')
     if dist_dir:
         return dist_dir
     root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
     return os.path.join(root_dir, 'frontend', 'dist')
 
 
-def send_spa_index():
+def _dist_signature(dist_dir):
+    # Changes when files are added/removed at the top of dist (vite build
+    # recreates index.html) or index.html is rewritten in place.
+    parts = []
+    for path in (dist_dir, os.path.join(dist_dir, 'index.html')):
+        try:
+            st = os.stat(path)
+            parts.append((st.st_ino, st.st_mtime_ns, st.st_size))
+        except OSError:
+            parts.append(None)
+    return tuple(parts)
+
+
+def _is_compressible(mimetype):
+    return bool(mimetype) and mimetype.startswith(_COMPRESSIBLE_TYPES)
+
+
+class SpaAsset:
+    __slots__ = ('path', 'full_path', 'mimetype', 'etag', 'immutable', 'encoded', 'gzip_body')
+
+    def __init__(self, path, full_path, mimetype, etag, immutable):
+        self.path = path
+        self.full_path = full_path
+        self.mimetype = mimetype
+        self.etag = etag
+        self.immutable = immutable
+        self.encoded = {}  # 'br' / 'gzip' -> full path of the precompressed file
+        self.gzip_body = None  # in-memory gzip when there is no .gz file
+
+
+class SpaIndex:
+    def __init__(self, dist_dir):
+        self.dist_dir = dist_dir
+        self.signature = _dist_signature(dist_dir)
+        self.assets = {}
+        self.index_body = None
+        self.index_encoded = {}  # 'br' / 'gzip' -> compressed index.html
+        self.index_etag = None
+        self._load()
+
+    def _load(self):
+        if not os.path.isdir(self.dist_dir):
+            return
+        names = set()
+        for base, _dirs, files in os.walk(self.dist_dir):
+            for name in files:
+                names.add(os.path.relpath(os.path.join(base, name), self.dist_dir).replace(os.sep, '/'))
+        for rel in sorted(names):
+            if rel.endswith(('.br', '.gz')) and rel[:-3] in names:
+                continue
+            full_path = os.path.join(self.dist_dir, rel)
+            try:
+                with open(full_path, 'rb') as fh:
+                    body = fh.read()
+            except OSError:
+                continue
+            mimetype = mimetypes.guess_type(rel)[0] or 'application/octet-stream'
+            asset = SpaAsset(
+                rel, full_path, mimetype, hashlib.sha1(body).hexdigest(),
+                bool(_HASHED_ASSET_RE.match(rel)),
+            )
+            for encoding, suffix in _ENCODING_SUFFIXES:
+                if rel + suffix in names:
+                    asset.encoded[encoding] = full_path + suffix
+            if 'gzip' not in asset.encoded and _is_compressible(mimetype) and len(body) >= _MIN_COMPRESS_BYTES:
+                asset.gzip_body = gzip.compress(body, compresslevel=6, mtime=0)
+            if rel == 'index.html':
+                self.index_body = body
+                self.index_etag = asset.etag
+                for encoding, encoded_path in asset.encoded.items():
+                    try:
+                        with open(encoded_path, 'rb') as fh:
+                            self.index_encoded[encoding] = fh.read()
+                    except OSError:
+                        pass
+                if 'gzip' not in self.index_encoded and asset.gzip_body is not None:
+                    self.index_encoded['gzip'] = asset.gzip_body
+                continue
+            self.assets[rel] = asset
+
+
+_INDEX = [None]
+_INDEX_LOCK = threading.Lock()
+_LAST_CHECK = [0.0]
+
+
+def load_spa_index(dist_dir) -> SpaIndex:
+    index = SpaIndex(dist_dir)
+    with _INDEX_LOCK:
+        _INDEX[0] = index
+        _LAST_CHECK[0] = time.monotonic()
+    print(f"[SPA] indexed {len(index.assets)} asset(s) in {dist_dir}"
+          + ('' if index.index_body is not None else ' (no index.html)'))
+    return index
+
+
+def _current_index() -> SpaIndex:
     dist_dir = _dist_dir()
-    index_path = os.path.join(dist_dir, 'index.html')
-    if not os.path.exists(index_path):
-        return (
-            "frontend build is missing: expected frontend/dist/index.html. "
-            "Run: cd frontend && npm install && npm run build",
-            500,
-        )
-    return send_from_directory(dist_dir, 'index.html')
+    index = _INDEX[0]
+    if index is None or index.dist_dir != dist_dir:
+        return load_spa_index(dist_dir)
+    interval = spa_reload_seconds()
+    now = time.monotonic()
+    if interval > 0 and now - _LAST_CHECK[0] >= interval:
+        _LAST_CHECK[0] = now
+        if _dist_signature(dist_dir) != index.signature:
+            return load_spa_index(dist_dir)
+    return index
+
+
+@spa_bp.record_once
+def _index_on_startup(state):
+    try:
+        load_spa_index(_dist_dir(state.app))
+    except Exception as e:
+        print(f"[SPA] indexing frontend/dist failed: {e}")
+
+
+def _accepts(encoding) -> bool:
+    return request.accept_encodings[encoding] > 0
+
+
+def _cache_headers(resp, immutable):
+    if immutable:
+        resp.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+def _send_memory(body, mimetype, etag, encoding=None, vary=False):
+    resp = current_app.response_class(body, mimetype=mimetype)
+    if encoding:
+        resp.headers['Content-Encoding'] = encoding
+    if vary:
+        resp.vary.add('Accept-Encoding')
+    # One strong ETag per representation
+    resp.set_etag(etag + ('-' + encoding if encoding else ''))
+    return resp.make_conditional(request)
+
+
+def send_spa_index():
+    index = _current_index()
+    if index.index_body is None:
+        return MISSING_BUILD_MESSAGE, 500
+    for encoding, _suffix in _ENCODING_SUFFIXES:
+        body = index.index_encoded.get(encoding)
+        if body is not None and _accepts(encoding):
+            resp = _send_memory(body, 'text/html', index.index_etag, encoding=encoding, vary=True)
+            return _cache_headers(resp, immutable=False)
+    resp = _send_memory(index.index_body, 'text/html', index.index_etag, vary=bool(index.index_encoded))
+    return _cache_headers(resp, immutable=False)
+
+
+def _send_asset(asset):
+    vary = bool(asset.encoded) or asset.gzip_body is not None
+    for encoding, _suffix in _ENCODING_SUFFIXES:
+        if encoding in asset.encoded and _accepts(encoding):
+            resp = send_file(
+                asset.encoded[encoding], request.environ, mimetype=asset.mimetype,
+                etag=f'{asset.etag}-{encoding}', conditional=True,
+                response_class=current_app.response_class,
+            )
+            resp.headers['Content-Encoding'] = encoding
+            resp.vary.add('Accept-Encoding')
+            return _cache_headers(resp, asset.immutable)
+    if asset.gzip_body is not None and _accepts('gzip'):
+        return _cache_headers(_send_memory(asset.gzip_body, asset.mimetype, asset.etag, 'gzip', vary=True), asset.immutable)
+    resp = send_file(
+        asset.full_path, request.environ, mimetype=asset.mimetype, etag=asset.etag, conditional=True,
+        response_class=current_app.response_class,
+    )
+    if vary:
+        resp.vary.add('Accept-Encoding')
+    return _cache_headers(resp, asset.immutable)
 
 
 @spa_bp.route('/', defaults={'path': ''}, methods=['GET'])
 @spa_bp.route('/<path:path>', methods=['GET'])
 def serve_spa(path: str):
-    dist_dir = _dist_dir()
-
-    candidate = os.path.join(dist_dir, path)
-    if path and os.path.isfile(candidate):
-        return send_from_directory(dist_dir, path)
-
+    asset = _current_index().assets.get(path) if path else None
+    if asset is not None:
+        try:
+            return _send_asset(asset)
+        except FileNotFoundError:
+            # Rebuilt between two checks: index again.
+            asset = load_spa_index(_dist_dir()).assets.get(path)
+            if asset is not None:
+                return _send_asset(asset)
     return send_spa_index()
@@ -1,20 +1,27 @@
 # Socket.IO event handlers
 
+from flask import current_app, request
 from flask_socketio import join_room, emit
 from flask_login import current_user
 from app.extensions import db, socketio
-from app.models import Message, Member, Room, Channel, User, Role, MemberRole, RoomBan
-from app.functions import can_user_mention_role
+from app.models import Message, Member, Room, Channel, User, RoomBan
+from app.functions import can_user_mention_role, get_room_mention_index, get_role_member_ids
 from datetime import datetime, timedelta
 import json
 import os
 import re
 import sys
 from urllib.parse import urlparse
-from app.functions import get_user_role_ids, user_has_room_permission
+from app.functions import get_user_role_ids, user_has_room_permission, member_left, tail_message_added, blob_path_for_url, sign_media_url
 from sqlalchemy import func
-from sqlalchemy.orm import joinedload, subqueryload
 from app.utils.paths import safe_resolve_under
+from app.sockets.fanout import notify_room_message, room_socket_name
+from app.sockets.message_writer import write_message
+from app.sockets.presence import presence
+from app.sockets.member_list import (
+    parse_ranges, range_rows, subscribe_member_list, unsubscribe_member_list
+)
+from app.functions import with_member_list
 
 
 DEBUG_SOCKETS = str(os.environ.get('BOXCHAT_DEBUG_SOCKETS', '') or '').strip().lower() in {'1', 'true', 'yes', 'on'}
@@ -43,20 +50,9 @@ def _parse_mentions(content, room_id):
             'denied_role_tags': [],
         }
 
-    members = (
-        Member.query.filter_by(room_id=room_id)
-        .options(joinedload(Member.user))
-        .all()
-    )
-    username_to_user = {}
-    id_to_username = {}
-    for m in members:
-        if m.user and m.user.username:
-            username_to_user[m.user.username.lower()] = m.user
-            id_to_username[m.user.id] = m.user.username
-
-    room_roles = Role.query.filter_by(room_id=room_id).all()
-    role_tag_to_role = {r.mention_tag.lower(): r for r in room_roles}
+    # Resolve against the in-memory room index: O(tokens), no member load.
+    index = get_room_mention_index(room_id)
+    role_tag_to_role = index.role_by_tag
 
     username_tokens = set()
     role_tokens = set()
@@ -67,16 +63,18 @@ def _parse_mentions(content, room_id):
         else:
             username_tokens.add(low)
 
-    mentioned_users = []
+    mentioned_user_ids = set()
     for uname in sorted(username_tokens):
-        user = username_to_user.get(uname)
-        if user:
-            mentioned_users.append(user)
+        uid = index.user_by_name.get(uname)
+        if uid is not None:
+            mentioned_user_ids.add(uid)
 
     allowed_roles = []
     denied_role_tags = []
     for tag in sorted(role_tokens):
-        role = role_tag_to_role[tag]
+        role = role_tag_to_role.get(tag)
+        if role is None:
+            continue
         if can_user_mention_role(current_user.id, room_id, role):
             allowed_roles.append(role)
         else:
@@ -84,16 +82,10 @@ def _parse_mentions(content, room_id):
 
     role_user_ids = set()
     if allowed_roles:
-        allowed_role_ids = [int(r.id) for r in allowed_roles]
-        links = MemberRole.query.filter(
-            MemberRole.room_id == int(room_id),
-            MemberRole.role_id.in_(allowed_role_ids),
-        ).all()
-        for link in links:
-            role_user_ids.add(int(link.user_id))
-
-    all_mentioned_user_ids = set([u.id for u in mentioned_users]) | role_user_ids
-    all_mentioned_usernames = [id_to_username.get(uid) for uid in sorted(all_mentioned_user_ids)]
+        role_user_ids = get_role_member_ids(index, [r.id for r in allowed_roles])
+
+    all_mentioned_user_ids = mentioned_user_ids | role_user_ids
+    all_mentioned_usernames = [index.name_by_user.get(uid) for uid in sorted(all_mentioned_user_ids)]
     all_mentioned_usernames = [u for u in all_mentioned_usernames if u]
 
     mention_everyone = any(r.mention_tag.lower() == 'everyone' for r in allowed_roles)
@@ -107,6 +99,15 @@ def _parse_mentions(content, room_id):
     }
 
 
+def _local_upload_path(file_url):
+    # File on disk behind an /uploads URL; content-addressed URLs map to their blob
+    upload_folder = current_app.config.get('UPLOAD_FOLDER') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'uploads'
+    )
+    rel = blob_path_for_url(file_url) or file_url[len('/uploads/'):]
+    return safe_resolve_under(upload_folder, rel)
+
+
 def _is_allowed_external_media_url(url):
     try:
         parsed = urlparse(str(url or '').strip())
@@ -197,34 +198,25 @@ def on_connect():
                 _debug(f"[SOCKET CONNECT] ✗ Failed to join notification room: {e}")
                 raise
             
-            # Respect user's hide_status preference
-            if getattr(current_user, 'hide_status', False):
-                current_user.presence_status = 'hidden'
-            else:
-                current_user.presence_status = 'online'
-            current_user.last_seen = None
-            db.session.commit()
-            _debug(f"[SOCKET CONNECT] ✓ User {user_id} status set to online")
+            # Count the socket; only the user's first socket changes presence.
+            # The DB columns are written behind by the presence registry.
+            hidden = bool(getattr(current_user, 'hide_status', False))
+            became_online = presence.connect(user_id, request.sid, hidden=hidden)
+            _debug(f"[SOCKET CONNECT] ✓ User {user_id} has {presence.connection_count(user_id)} live socket(s)")
             
-            # Notify members in all channels of the rooms user is member of
-            memberships = (
-                Member.query.filter_by(user_id=user_id)
-                .options(joinedload(Member.room).subqueryload(Room.channels))
-                .all()
-            )
-            _debug(f"[SOCKET CONNECT] User {user_id} has {len(memberships)} memberships")
+            room_ids = [int(rid) for (rid,) in db.session.query(Member.room_id).filter(Member.user_id == user_id).all()]
+            _debug(f"[SOCKET CONNECT] User {user_id} has {len(room_ids)} memberships")
             
-            for m in memberships:
-                # For each channel in the room, emit presence update so clients viewing channel update status
-                for ch in m.room.channels:
-                    try:
-                        socketio.emit('presence_updated', {
-                            'user_id': current_user.id,
-                            'username': current_user.username,
-                            'status': current_user.presence_status
-                        }, room=str(ch.id), skip_sid=None)  # Include sender in emission
-                    except Exception as e:
-                        _debug(f"[SOCKET CONNECT] Error emitting presence for channel {ch.id}: {e}")
+            for rid in room_ids:
+                # Room-level socket room receives shared message notifications and presence batches
+                try:
+                    join_room(room_socket_name(rid))
+                except Exception as e:
+                    _debug(f"[SOCKET CONNECT] Error joining room {rid} notifications: {e}")
+            
+            if became_online:
+                # Debounced: one presence_batch per room for everything in the window
+                presence.announce(user_id, current_user.username, 'hidden' if hidden else 'online')
             
             _debug(f"[SOCKET CONNECT] ✓ User {user_id} fully connected")
         else:
@@ -239,33 +231,21 @@ def on_connect():
 
 @socketio.on('disconnect')
 def on_disconnect():
-    # Mark user offline and notify rooms
+    # Mark user offline (when the last socket closes) and notify rooms
     user_id = None
+    unsubscribe_member_list(request.sid)
     try:
         if hasattr(current_user, 'is_authenticated') and current_user.is_authenticated:
             user_id = current_user.id
             _debug(f"[SOCKET DISCONNECT] User {user_id} disconnecting...")
             # Respect hide_status: if hidden, keep hidden; otherwise set offline
-            if getattr(current_user, 'hide_status', False):
-                current_user.presence_status = 'hidden'
-            else:
-                current_user.presence_status = 'offline'
-            current_user.last_seen = datetime.utcnow()
-            db.session.commit()
-            _debug(f"[SOCKET DISCONNECT] User {user_id} status set to offline, notifying rooms...")
-            memberships = (
-                Member.query.filter_by(user_id=user_id)
-                .options(joinedload(Member.room).subqueryload(Room.channels))
-                .all()
-            )
-            for m in memberships:
-                for ch in m.room.channels:
-                    socketio.emit('presence_updated', {
-                        'user_id': current_user.id,
-                        'username': current_user.username,
-                        'status': current_user.presence_status,
-                        'last_seen_iso': current_user.last_seen.strftime('%Y-%m-%dT%H:%M:%SZ') if current_user.last_seen else None
-                    }, room=str(ch.id), skip_sid=None)  # Include sender in emission
+            hidden = bool(getattr(current_user, 'hide_status', False))
+            if not presence.disconnect(user_id, request.sid, hidden=hidden):
+                _debug(f"[SOCKET DISCONNECT] User {user_id} still has {presence.connection_count(user_id)} live socket(s)")
+                return
+            status, last_seen = presence.status_of(current_user)
+            _debug(f"[SOCKET DISCONNECT] User {user_id} status set to {status}, notifying rooms...")
+            presence.announce(user_id, current_user.username, status, last_seen)
             _debug(f"[SOCKET DISCONNECT] User {user_id} disconnect complete")
     except Exception as e:
         _debug(f"[SOCKET DISCONNECT ERROR] {e}")
@@ -275,6 +255,44 @@ def on_disconnect():
         pass
 
 
+@socketio.on('member_list_subscribe')
+def on_member_list_subscribe(data):
+    # Watch ranges of a room's member list: {room_id, ranges: [[start, end], ...]}
+    if not (hasattr(current_user, 'is_authenticated') and current_user.is_authenticated):
+        return
+    data = data or {}
+    try:
+        room_id = int(data.get('room_id'))
+    except Exception:
+        return
+    ranges = parse_ranges(data.get('ranges'))
+    if ranges is None:
+        emit('member_list_error', {'room_id': room_id, 'error': 'invalid ranges'})
+        return
+    if not Member.query.filter_by(user_id=current_user.id, room_id=room_id).first():
+        emit('member_list_error', {'room_id': room_id, 'error': 'access denied'})
+        return
+    sid = request.sid
+    user_id = current_user.id
+
+    def _subscribe(member_list):
+        # Under the list lock: no op can slip between the snapshot and the subscription.
+        subscribe_member_list(sid, user_id, room_id, ranges)
+        emit('member_list_sync', {
+            'room_id': room_id,
+            'groups': member_list.group_counts(),
+            'total': len(member_list),
+            'ranges': range_rows(member_list, ranges),
+        })
+
+    with_member_list(room_id, _subscribe)
+
+
+@socketio.on('member_list_unsubscribe')
+def on_member_list_unsubscribe(data=None):
+    unsubscribe_member_list(request.sid)
+
+
 @socketio.on('send_message')
 def handle_send_message(data):
     # Handle incoming message
@@ -435,6 +453,7 @@ def handle_send_message(data):
                 for t in targets:
                     db.session.delete(t)
                 db.session.commit()
+                member_left(target.user_id, room_id)
                 socketio.emit('member_removed', {'user_id': target.user_id, 'room_id': room_id}, room=str(room_id))
                 socketio.emit('force_redirect', {'location': '/', 'reason': 'You were kicked from this room.'}, room=f"user_{target.user_id}")
                 _emit_command_result(True, f'{target.user.username} kicked.')
@@ -480,6 +499,7 @@ def handle_send_message(data):
                 for t in targets:
                     db.session.delete(t)
                 db.session.commit()
+                member_left(target.user_id, room_id)
                 socketio.emit('member_removed', {'user_id': target.user_id, 'room_id': room_id}, room=str(room_id))
                 socketio.emit('force_redirect', {'location': '/', 'reason': f'You were banned. Reason: {reason}'}, room=f"user_{target.user_id}")
                 if banned_until is not None:
@@ -518,8 +538,7 @@ def handle_send_message(data):
     if file_url:
         try:
             if file_url.startswith('/uploads/'):
-                base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-                abs_path = safe_resolve_under(base_dir, file_url.lstrip('/'))
+                abs_path = _local_upload_path(file_url)
                 if not abs_path or not abs_path.is_file():
                     file_url = None
             elif not _is_allowed_external_media_url(file_url):
@@ -534,8 +553,7 @@ def handle_send_message(data):
         except Exception:
             pass
         try:
-            base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            abs_path = safe_resolve_under(base_dir, file_url.lstrip('/'))
+            abs_path = _local_upload_path(file_url)
             try:
                 if abs_path and abs_path.is_file():
                     file_size = abs_path.stat().st_size
@@ -544,28 +562,29 @@ def handle_send_message(data):
         except Exception:
             pass
 
-    # Create and save message
-    msg = Message(
-        content=content,
-        user_id=current_user.id,
-        channel_id=channel_id,
-        message_type=message_type,
-        file_url=file_url,
-        file_name=file_name,
-        file_size=file_size,
-        reply_to_id=(reply_to.get('id') if isinstance(reply_to, dict) and reply_to.get('id') else None)
-    )
-    db.session.add(msg)
-    db.session.commit()
+    # Create and save message (per-message commit or group commit, see message_writer)
+    try:
+        msg, change_seq = write_message(
+            current_app._get_current_object(),
+            content=content,
+            user_id=current_user.id,
+            channel_id=channel_id,
+            message_type=message_type,
+            file_url=file_url,
+            file_name=file_name,
+            file_size=file_size,
+            reply_to_id=(reply_to.get('id') if isinstance(reply_to, dict) and reply_to.get('id') else None)
+        )
+    except Exception:
+        db.session.rollback()
+        emit('error', {'message': 'Не удалось отправить сообщение'})
+        return
+    tail_message_added(msg, author=current_user)
 
     mention_data = _parse_mentions(content, room_id)
     
-    # Load reactions for the message
+    # A message that was just written has no reactions yet
     reactions_data = {}
-    for reaction in msg.reactions:
-        if reaction.emoji not in reactions_data:
-            reactions_data[reaction.emoji] = []
-        reactions_data[reaction.emoji].append(reaction.user.username)
     
     # Build reply metadata from saved message reference if available
     reply_payload = None
@@ -593,11 +612,13 @@ def handle_send_message(data):
         'timestamp_iso': msg.timestamp.strftime('%Y-%m-%dT%H:%M:%SZ'),
         'message_type': message_type,
         'file_url': file_url,
+        'signed_file_url': sign_media_url(file_url),
         'file_name': file_name,
         'file_size': file_size,
         'edited_at_iso': msg.edited_at.strftime('%Y-%m-%dT%H:%M:%SZ') if msg.edited_at else None,
         'reactions': reactions_data,
         'reply_to': reply_payload,
+        'change_seq': change_seq,
         'mentions': {
             'everyone': mention_data['mention_everyone'],
             'user_ids': mention_data['mentioned_user_ids'],
@@ -608,51 +629,10 @@ def handle_send_message(data):
         }
     }, room=str(channel_id))
 
-    # Send per-user notifications and unread counts to members' personal rooms
+    # One shared notification per room; only direct mentions and DMs are emitted per user
     try:
-        members = Member.query.filter_by(room_id=room_id).all()
-        _debug(f"[handle_send_message] Sending notifications to {len(members)} members")
-        for m in members:
-            uid = m.user_id
-            # skip sender
-            if uid == current_user.id:
-                continue
-
-            # NOTE: Server-side per-user unread counts are expensive (N users => N queries).
-            # Frontend tracks unread counts independently; keep field for compatibility.
-            unread_count = None
-
-            # Build small snippet for notification
-            snippet = (content or '')
-            if snippet:
-                snippet = snippet.strip().split('\n')[0][:140]
-
-            payload = {
-                'room_id': room_id,
-                'channel_id': channel_id,
-                'message_id': msg.id,
-                'from_user': current_user.username,
-                'from_user_id': current_user.id,
-                'snippet': snippet,
-                'unread_count': unread_count,
-                'mention': (
-                    mention_data['mention_everyone']
-                    or uid in set(mention_data['mentioned_user_ids'])
-                ),
-                'mention_everyone': mention_data['mention_everyone'],
-                'mention_roles': mention_data['mentioned_role_tags'],
-            }
-
-            # Emit a generic notification event to the user's personal room
-            _debug(f"[handle_send_message] Sending notification to user {uid}")
-            socketio.emit('message_notification', payload, room=f"user_{uid}")
-
-            # For DM rooms, keep the legacy dashboard handler name
-            try:
-                if room.type == 'dm':
-                    socketio.emit('new_dm_message', {'room_id': room.id}, room=f"user_{uid}")
-            except Exception:
-                pass
+        emits = notify_room_message(room, channel_id, msg.id, current_user, content, mention_data)
+        _debug(f"[handle_send_message] Sent {emits} notification emits for room {room_id}")
     except Exception:
         db.session.rollback()
         pass
@@ -0,0 +1,142 @@
+# Room-level notification fan-out
+#
+# Every authenticated socket joins `room_<id>` for each room the user belongs to.
+# A new message produces ONE shared `message_notification` emitted to that socket
+# room; clients derive their own mention flag from `mentioned_user_ids`.
+# Personal emits (`user_<id>`) only remain for directly mentioned users and DMs.
+#
+# Unread counters are kept server-side (app/functions/unread.py). The shared
+# payload cannot carry a per-recipient count, so it says `unread_delta: 1` (every
+# recipient's counter for the channel went up by one, apply it to the count from
+# /api/v1/rooms); personal emits carry the exact `unread_count`.
+
+import os
+from app.extensions import db, socketio
+from app.models import Member
+from app.functions.unread import get_channel_unread_counts
+
+
+SOCKET_NAMESPACE = '/'
+
+
+def _direct_mention_limit() -> int:
+    # Above this many mentioned users (large role mentions) rely on the shared payload only.
+    try:
+        return max(0, int(os.environ.get('BOXCHAT_FANOUT_DIRECT_MENTION_LIMIT') or 50))
+    except Exception:
+        return 50
+
+
+def room_socket_name(room_id) -> str:
+    return f"room_{int(room_id)}"
+
+
+def user_socket_name(user_id) -> str:
+    return f"user_{int(user_id)}"
+
+
+def get_user_sids(user_id):
+    # Live socket ids of a user (every authenticated socket sits in `user_<id>`).
+    try:
+        participants = socketio.server.manager.get_participants(SOCKET_NAMESPACE, user_socket_name(user_id))
+        return [sid for sid, _eio_sid in participants]
+    except Exception:
+        return []
+
+
+def subscribe_user_to_room(user_id, room_id):
+    # Attach all live sockets of the user to the room-level socket room.
+    name = room_socket_name(room_id)
+    for sid in get_user_sids(user_id):
+        try:
+            socketio.server.enter_room(sid, name, namespace=SOCKET_NAMESPACE)
+        except Exception:
+            pass
+
+
+def unsubscribe_user_from_room(user_id, room_id):
+    name = room_socket_name(room_id)
+    for sid in get_user_sids(user_id):
+        try:
+            socketio.server.leave_room(sid, name, namespace=SOCKET_NAMESPACE)
+        except Exception:
+            pass
+
+
+def close_room_subscriptions(room_id):
+    try:
+        socketio.close_room(room_socket_name(room_id), namespace=SOCKET_NAMESPACE)
+    except Exception:
+        pass
+
+
+def build_message_notification(room_id, channel_id, message_id, sender, content, mention_data):
+    # Build small snippet for notification
+    snippet = (content or '')
+    if snippet:
+        snippet = snippet.strip().split('\n')[0][:140]
+
+    mention_everyone = bool(mention_data.get('mention_everyone'))
+    return {
+        'room_id': room_id,
+        'channel_id': channel_id,
+        'message_id': message_id,
+        'from_user': sender.username,
+        'from_user_id': sender.id,
+        'snippet': snippet,
+        # Exact per-recipient count only in personal emits; shared emits carry the delta.
+        'unread_count': None,
+        'unread_delta': 1,
+        'mention': mention_everyone,
+        'mention_everyone': mention_everyone,
+        'mentioned_user_ids': [] if mention_everyone else list(mention_data.get('mentioned_user_ids') or []),
+        'mention_roles': list(mention_data.get('mentioned_role_tags') or []),
+    }
+
+
+def notify_room_message(room, channel_id, message_id, sender, content, mention_data):
+    # Fan out a new-message notification. Returns the number of emits issued.
+    payload = build_message_notification(room.id, channel_id, message_id, sender, content, mention_data)
+    sender_id = int(sender.id)
+    emits = 0
+
+    if room.type == 'dm':
+        # DMs have two participants: keep personal emits and the legacy dashboard event.
+        member_ids = [
+            int(uid) for (uid,) in
+            db.session.query(Member.user_id).filter(Member.room_id == room.id).all()
+        ]
+        unread = get_channel_unread_counts(channel_id, [uid for uid in member_ids if uid != sender_id])
+        for uid in member_ids:
+            if uid == sender_id:
+                continue
+            personal = dict(payload)
+            personal['mention'] = bool(payload['mention_everyone'] or uid in payload['mentioned_user_ids'])
+            personal['unread_count'] = unread.get(uid, 0)
+            socketio.emit('message_notification', personal, room=user_socket_name(uid))
+            socketio.emit('new_dm_message', {'room_id': room.id}, room=user_socket_name(uid))
+            emits += 2
+        return emits
+
+    direct_ids = []
+    if not payload['mention_everyone']:
+        direct_ids = [uid for uid in payload['mentioned_user_ids'] if int(uid) != sender_id]
+        if len(direct_ids) > _direct_mention_limit():
+            direct_ids = []
+
+    # Sender's own tabs and directly mentioned users are served separately.
+    skip_sids = get_user_sids(sender_id)
+    for uid in direct_ids:
+        skip_sids.extend(get_user_sids(uid))
+
+    socketio.emit('message_notification', payload, room=room_socket_name(room.id), skip_sid=skip_sids or None)
+    emits += 1
+
+    unread = get_channel_unread_counts(channel_id, direct_ids) if direct_ids else {}
+    for uid in direct_ids:
+        personal = dict(payload)
+        personal['mention'] = True
+        personal['unread_count'] = unread.get(int(uid), 0)
+        socketio.emit('message_notification', personal, room=user_socket_name(uid))
+        emits += 1
+    return emits
@@ -0,0 +1,134 @@
+# Member list range subscriptions
+#
+# A socket subscribes to up to MAX_RANGES windows of one room's member list
+# (`member_list_subscribe`), gets the current rows back (`member_list_sync`)
+# and then `member_list_update` with the ops of every change that can affect
+# its windows:
+#   - INSERT / UPDATE / DELETE ops whose index falls inside a window,
+#   - a trailing SYNC op (the window's rows after the change) when the change
+#     shifted the window: a DELETE at or before its end, or an INSERT before
+#     its start. Apply the ops in order, trim each window, then apply SYNCs.
+# Every insert/delete is sent (possibly with no ops) so group counts stay fresh.
+# Lists with subscribers are never LRU-evicted; when lists are dropped anyway
+# (clear_member_lists) their subscribers get `member_list_error` with
+# error 'reset' and must subscribe again.
+# Ops are computed by app/functions/member_list.py.
+
+import threading
+from app.extensions import socketio
+
+MAX_RANGES = 3
+MAX_RANGE_SPAN = 200
+
+_SUBS = {}  # sid -> (room_id, user_id, [(start, end)])
+_ROOM_SIDS = {}  # room_id -> set(sid)
+_SUB_LOCK = threading.Lock()
+
+
+def parse_ranges(raw):
+    # [[start, end], ...] (inclusive) -> sorted list of tuples, or None when invalid.
+    if not isinstance(raw, (list, tuple)) or not raw or len(raw) > MAX_RANGES:
+        return None
+    ranges = []
+    for item in raw:
+        try:
+            start, end = int(item[0]), int(item[1])
+        except Exception:
+            return None
+        if start < 0 or end < start or end - start + 1 > MAX_RANGE_SPAN:
+            return None
+        ranges.append((start, end))
+    return sorted(ranges)
+
+
+def range_rows(member_list, ranges):
+    return [
+        {
+            'range': [start, end],
+            'members': [
+                dict(entry.to_dict(), index=pos, group=entry.group)
+                for pos, entry in member_list.range(start, end - start + 1)
+            ],
+        }
+        for start, end in ranges
+    ]
+
+
+def subscribe_member_list(sid, user_id, room_id, ranges):
+    # One subscription per socket: a new one replaces the previous room/ranges.
+    room_id = int(room_id)
+    with _SUB_LOCK:
+        _unsubscribe_locked(sid)
+        _SUBS[sid] = (room_id, int(user_id), list(ranges))
+        _ROOM_SIDS.setdefault(room_id, set()).add(sid)
+
+
+def _unsubscribe_locked(sid):
+    previous = _SUBS.pop(sid, None)
+    if previous is None:
+        return
+    sids = _ROOM_SIDS.get(previous[0])
+    if sids is not None:
+        sids.discard(sid)
+        if not sids:
+            _ROOM_SIDS.pop(previous[0], None)
+
+
+def unsubscribe_member_list(sid):
+    with _SUB_LOCK:
+        _unsubscribe_locked(sid)
+
+
+def drop_member_list_subscriptions(room_id, user_id=None):
+    # The room is gone, or one user left it: their windows stop updating.
+    room_id = int(room_id)
+    with _SUB_LOCK:
+        for sid in list(_ROOM_SIDS.get(room_id, ())):
+            if user_id is None or _SUBS[sid][1] == int(user_id):
+                _unsubscribe_locked(sid)
+
+
+def member_list_subscribed_rooms():
+    with _SUB_LOCK:
+        return set(_ROOM_SIDS)
+
+
+def reset_member_list_subscriptions(room_ids=None):
+    # The server dropped these lists: tell the windows to subscribe again.
+    with _SUB_LOCK:
+        rooms = list(_ROOM_SIDS) if room_ids is None else [int(r) for r in room_ids]
+        reset = [(sid, room_id) for room_id in rooms for sid in list(_ROOM_SIDS.get(room_id, ()))]
+        for sid, _room_id in reset:
+            _unsubscribe_locked(sid)
+    for sid, room_id in reset:
+        socketio.emit('member_list_error', {'room_id': room_id, 'error': 'reset'}, to=sid)
+
+
+def publish_member_list_ops(member_list, ops):
+    with _SUB_LOCK:
+        subscribers = [(sid, _SUBS[sid][2]) for sid in _ROOM_SIDS.get(member_list.room_id, ())]
+    if not subscribers:
+        return
+    groups = member_list.group_counts()
+    total = len(member_list)
+    # Inserts/deletes change the group counts every subscriber shows.
+    resized = any(op['op'] != 'UPDATE' for op in ops)
+    for sid, ranges in subscribers:
+        visible = [op for op in ops if any(start <= op['index'] <= end for start, end in ranges)]
+        shifted = [
+            (start, end) for start, end in ranges
+            if any(
+                (op['op'] == 'DELETE' and op['index'] <= end) or (op['op'] == 'INSERT' and op['index'] < start)
+                for op in ops
+            )
+        ]
+        if not visible and not shifted and not resized:
+            continue
+        for row in range_rows(member_list, shifted):
+            visible.append({'op': 'SYNC', 'range': row['range'], 'members': row['members']})
+        socketio.emit('member_list_update', {
+            'room_id': member_list.room_id,
+            'groups': groups,
+            'total': total,
+            'ops': visible,
+        }, to=sid)
@@ -0,0 +1,221 @@
+# Group-commit write path for chat messages
+#
+# Optional (BOXCHAT_GROUP_COMMIT=1). Instead of one INSERT + COMMIT (and one
+# SQLite fsync) per `send_message`, handlers hand their row to a single writer
+# task. The writer drains whatever arrives within a short window (or up to a
+# batch limit), inserts the batch in one transaction and wakes each handler
+# with its assigned id. The queue is FIFO and there is only one writer, so ids
+# follow submission order and per-channel ordering is preserved. A handler
+# whose wait times out only gives up while its row is still queued; a row the
+# writer already took is waited for, so a send never fails and commits anyway.
+#
+# Queue/event/task primitives come from the Socket.IO server so the writer is
+# a greenlet under eventlet and a thread under the threading async mode.
+# With BOXCHAT_WRITE_QUEUE=1 both paths hand their transaction to the
+# single SQLite writer (app/utils/write_queue.py).
+
+import os
+import threading
+import time
+from datetime import datetime
+from app.extensions import db, socketio
+from app.models import Message
+from app.functions.changes import record_channel_changes
+from app.functions.unread import bump_unread_counters, bump_unread_counters_batch
+from app.functions.attachments import add_message_attachments
+from app.utils.write_queue import get_write_queue, run_write
+
+
+def _env_flag(name: str) -> bool:
+    return str(os.environ.get(name, '') or '').strip().lower() in {'1', 'true', 'yes', 'on'}
+
+
+def group_commit_enabled() -> bool:
+    return _env_flag('BOXCHAT_GROUP_COMMIT')
+
+
+def _window_seconds() -> float:
+    try:
+        return max(0.0, float(os.environ.get('BOXCHAT_GROUP_COMMIT_WINDOW_MS') or 5)) / 1000.0
+    except Exception:
+        return 0.005
+
+
+def _max_batch() -> int:
+    try:
+        return max(1, int(os.environ.get('BOXCHAT_GROUP_COMMIT_MAX_BATCH') or 64))
+    except Exception:
+        return 64
+
+
+def _wait_timeout() -> float:
+    try:
+        return max(0.1, float(os.environ.get('BOXCHAT_GROUP_COMMIT_TIMEOUT') or 10))
+    except Exception:
+        return 10.0
+
+
+class PendingMessage:
+    __slots__ = ('fields', 'message_id', 'change_seq', 'error', 'state', '_done', '_state_lock')
+
+    def __init__(self, fields, done_event):
+        self.fields = fields
+        self.message_id = None
+        self.change_seq = None
+        self.error = None
+        self.state = 'queued'  # -> 'taken' by the writer or 'cancelled' by a timed out sender
+        self._done = done_event
+        self._state_lock = threading.Lock()
+
+    def claim(self) -> bool:
+        with self._state_lock:
+            if self.state == 'cancelled':
+                return False
+            self.state = 'taken'
+            return True
+
+    def cancel(self) -> bool:
+        with self._state_lock:
+            if self.state != 'queued':
+                return False
+            self.state = 'cancelled'
+            return True
+
+    def resolve(self, message_id, change_seq=None):
+        self.message_id = int(message_id)
+        self.change_seq = change_seq
+        self._done.set()
+
+    def fail(self, error):
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout):
+        if not self._done.wait(timeout):
+            if self.cancel():
+                raise TimeoutError('group commit timed out')
+            # In the writer's batch: wait for the commit instead of failing a
+            # message that will be stored.
+            while not self._done.wait(timeout):
+                pass
+        if self.error is not None:
+            raise self.error
+        return self.message_id, self.change_seq
+
+
+class MessageWriter:
+    def __init__(self, app, window=None, max_batch=None):
+        self.app = app
+        self.window = _window_seconds() if window is None else float(window)
+        self.max_batch = _max_batch() if max_batch is None else max(1, int(max_batch))
+        self._queue = socketio.server.eio.create_queue()
+        self._empty = socketio.server.eio.get_queue_empty_exception()
+        # Counters for diagnostics / benchmarks
+        self.batches = 0
+        self.messages = 0
+
+    def start(self):
+        socketio.start_background_task(self._run)
+        return self
+
+    def submit(self, fields) -> PendingMessage:
+        pending = PendingMessage(fields, socketio.server.eio.create_event())
+        self._queue.put(pending)
+        return pending
+
+    def _collect(self):
+        batch = []
+        while not batch:
+            pending = self._queue.get()
+            if pending.claim():
+                batch.append(pending)
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Window closed: still take what is already queued.
+                    pending = self._queue.get_nowait()
+                else:
+                    pending = self._queue.get(timeout=remaining)
+            except self._empty:
+                break
+            # Senders that timed out before the writer got to them are skipped.
+            if pending.claim():
+                batch.append(pending)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._flush(batch)
+            except Exception as exc:
+                for pending in batch:
+                    if pending.message_id is None and pending.error is None:
+                        pending.fail(exc)
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            try:
+                ids, seqs = run_write(_insert_messages, [pending.fields for pending in batch])
+            finally:
+                db.session.remove()
+        self.batches += 1
+        self.messages += len(batch)
+        # Wake senders in insertion order so their emits follow id order.
+        for pending, message_id, change_seq in zip(batch, ids, seqs):
+            pending.resolve(message_id, change_seq)
+
+
+def _insert_messages(fields_list):
+    # One transaction for a batch of messages (run_write commits); returns (ids, change seqs).
+    rows = [Message(**fields) for fields in fields_list]
+    db.session.add_all(rows)
+    db.session.flush()
+    ids = [row.id for row in rows]
+    seqs = record_channel_changes(
+        {'channel_id': row.channel_id, 'kind': 'new', 'message_id': row.id} for row in rows
+    )
+    bump_unread_counters_batch((row.channel_id, row.user_id) for row in rows)
+    add_message_attachments((row.file_url, row.channel_id) for row in rows)
+    return ids, seqs
+
+
+_WRITER = None
+_WRITER_LOCK = threading.Lock()
+
+
+def get_message_writer(app):
+    global _WRITER
+    with _WRITER_LOCK:
+        if _WRITER is None:
+            _WRITER = MessageWriter(app).start()
+        return _WRITER
+
+
+def write_message(app, **fields):
+    # Insert a chat message (with its change-log entry and unread bumps) through the configured
+    # write path; returns (message, change_seq). Group commit and the write queue
+    # return a detached Message carrying the id assigned by the writer.
+    fields.setdefault('timestamp', datetime.utcnow())
+    if not group_commit_enabled():
+        if get_write_queue() is not None:
+            ids, seqs = run_write(_insert_messages, [dict(fields)])
+            msg = Message(**fields)
+            msg.id = ids[0]
+            return msg, seqs[0]
+        msg = Message(**fields)
+        db.session.add(msg)
+        db.session.flush()
+        change_seq = record_channel_changes([{'channel_id': msg.channel_id, 'kind': 'new', 'message_id': msg.id}])[0]
+        bump_unread_counters(msg.channel_id, msg.user_id)
+        add_message_attachments([(msg.file_url, msg.channel_id)])
+        db.session.commit()
+        return msg, change_seq
+
+    pending = get_message_writer(app).submit(dict(fields))
+    message_id, change_seq = pending.wait(_wait_timeout())
+    msg = Message(**fields)
+    msg.id = message_id
+    return msg, change_seq
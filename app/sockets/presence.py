@@ -0,0 +1,269 @@
+# In-memory presence registry
+#
+# Counts live socket ids per user, so a user with several tabs/devices stays
+# online until the LAST socket disconnects; connect/disconnect only report a
+# change on the 0 <-> 1 transitions. The registry is the source of truth for
+# live presence in this process (member lists, profiles). The `user` table
+# columns (`presence_status`, `last_seen`) are written behind: transitions are
+# queued and flushed in one transaction every BOXCHAT_PRESENCE_FLUSH_SECONDS
+# instead of one commit per socket event, and once more at interpreter exit.
+# A last_seen that reached the database is dropped from memory (the `user`
+# row has it), as is the broadcast state of users announced offline, so the
+# registry only grows with the users currently connected.
+#
+# Broadcasts are debounced too: `announce` only records the latest status per
+# user, and every BOXCHAT_PRESENCE_DEBOUNCE_MS the pending changes are grouped
+# by room and sent as ONE `presence_batch` per room-level socket room. A user
+# whose status is back to what was last broadcast (disconnect + reconnect
+# within the window) is dropped from the batch. The same window also moves
+# users between the online/offline groups of the lazy member lists.
+
+import atexit
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import bindparam
+from app.extensions import db, socketio
+from app.models import User, Member
+from app.functions.member_list import member_list_presence_changed
+from app.sockets.fanout import room_socket_name
+from app.utils.write_queue import run_write
+
+
+def _execute_statements(statements):
+    for stmt, rows in statements:
+        db.session.execute(stmt, rows)
+
+
+# set_hidden for an offline user whose last_seen is only in the database
+_KEEP_LAST_SEEN = object()
+
+
+def _flush_interval() -> float:
+    try:
+        return max(0.1, float(os.environ.get('BOXCHAT_PRESENCE_FLUSH_SECONDS') or 5))
+    except Exception:
+        return 5.0
+
+
+def _debounce_seconds() -> float:
+    try:
+        return max(0.05, float(os.environ.get('BOXCHAT_PRESENCE_DEBOUNCE_MS') or 1500) / 1000.0)
+    except Exception:
+        return 1.5
+
+
+class PresenceRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sids = {}  # user_id -> set of live sids
+        self._last_seen = {}  # user_id -> datetime of the last 1 -> 0 transition
+        self._pending = {}  # user_id -> (presence_status, last_seen) not yet in the DB
+        self._announce = {}  # user_id -> update not yet broadcast
+        self._announced = {}  # user_id -> status of the last broadcast
+        self._app = None
+        self._started = False
+        # Counters for diagnostics
+        self.batches = 0
+        self.suppressed = 0
+
+    def connect(self, user_id, sid, hidden=False) -> bool:
+        # Returns True when this is the user's first live socket.
+        user_id = int(user_id)
+        with self._lock:
+            sids = self._sids.setdefault(user_id, set())
+            first = not sids
+            sids.add(sid)
+            if first:
+                self._last_seen.pop(user_id, None)
+                self._pending[user_id] = ('hidden' if hidden else 'online', None)
+        return first
+
+    def disconnect(self, user_id, sid, hidden=False) -> bool:
+        # Returns True when the user's last live socket went away.
+        user_id = int(user_id)
+        with self._lock:
+            sids = self._sids.get(user_id)
+            if not sids or sid not in sids:
+                return False
+            sids.discard(sid)
+            if sids:
+                return False
+            del self._sids[user_id]
+            now = datetime.utcnow()
+            self._last_seen[user_id] = now
+            self._pending[user_id] = ('hidden' if hidden else 'offline', now)
+        return True
+
+    def set_hidden(self, user_id, hidden):
+        # hide_status toggled: persist the status shown to others.
+        user_id = int(user_id)
+        with self._lock:
+            online = bool(self._sids.get(user_id))
+            last_seen = self._last_seen.get(user_id, _KEEP_LAST_SEEN)
+            if hidden:
+                status = 'hidden'
+            else:
+                status = 'online' if online else 'offline'
+            self._pending[user_id] = (status, None if online else last_seen)
+
+    def is_online(self, user_id) -> bool:
+        with self._lock:
+            return bool(self._sids.get(int(user_id)))
+
+    def connection_count(self, user_id) -> int:
+        with self._lock:
+            return len(self._sids.get(int(user_id)) or ())
+
+    def online_user_ids(self, user_ids=None):
+        with self._lock:
+            if user_ids is None:
+                return set(self._sids)
+            return {int(uid) for uid in user_ids if self._sids.get(int(uid))}
+
+    def status_of(self, user):
+        # (presence_status, last_seen) as other users should see it.
+        user_id = int(user.id)
+        with self._lock:
+            online = bool(self._sids.get(user_id))
+            last_seen = self._last_seen.get(user_id)
+        if getattr(user, 'hide_status', False):
+            return 'hidden', None
+        if online:
+            return 'online', None
+        return 'offline', last_seen or getattr(user, 'last_seen', None)
+
+    def flush(self):
+        # Write queued status/last_seen changes in one transaction; returns rows written.
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        table = User.__table__
+        rows = [
+            {'uid': user_id, 'status': status, 'seen': last_seen}
+            for user_id, (status, last_seen) in pending.items()
+            if last_seen is not _KEEP_LAST_SEEN
+        ]
+        status_rows = [
+            {'uid': user_id, 'status': status}
+            for user_id, (status, last_seen) in pending.items()
+            if last_seen is _KEEP_LAST_SEEN
+        ]
+        statements = []
+        if rows:
+            statements.append((
+                table.update().where(table.c.id == bindparam('uid'))
+                .values(presence_status=bindparam('status'), last_seen=bindparam('seen')),
+                rows,
+            ))
+        if status_rows:
+            statements.append((
+                table.update().where(table.c.id == bindparam('uid')).values(presence_status=bindparam('status')),
+                status_rows,
+            ))
+        try:
+            run_write(_execute_statements, statements)
+        except Exception:
+            db.session.rollback()
+            with self._lock:
+                # Keep newer transitions that arrived meanwhile.
+                for user_id, value in pending.items():
+                    self._pending.setdefault(user_id, value)
+            raise
+        with self._lock:
+            # Persisted and no newer transition: the `user` row has last_seen now.
+            for user_id, (_status, last_seen) in pending.items():
+                if (last_seen is not None and user_id not in self._pending
+                        and self._last_seen.get(user_id) is last_seen):
+                    del self._last_seen[user_id]
+        return len(pending)
+
+    def announce(self, user_id, username, status, last_seen=None):
+        # Queue a presence broadcast; the latest status within the window wins.
+        from flask import current_app
+
+        with self._lock:
+            self._announce[int(user_id)] = {
+                'user_id': int(user_id),
+                'username': username,
+                'status': status,
+                'last_seen_iso': last_seen.strftime('%Y-%m-%dT%H:%M:%SZ') if last_seen else None,
+            }
+        self.start(current_app._get_current_object())
+
+    def broadcast(self):
+        # Emit one `presence_batch` per room for the queued changes; returns emits issued.
+        with self._lock:
+            queued, self._announce = self._announce, {}
+            updates = {}
+            for user_id, update in queued.items():
+                if self._announced.get(user_id) == update['status']:
+                    self.suppressed += 1
+                    continue
+                if update['status'] == 'offline':
+                    # Offline is what a user with no entry is assumed to be.
+                    self._announced.pop(user_id, None)
+                else:
+                    self._announced[user_id] = update['status']
+                updates[user_id] = update
+        # Member lists take every queued status (idempotent), suppressed flaps included.
+        member_list_presence_changed(queued.values())
+        if not updates:
+            return 0
+        by_room = {}
+        for user_id, room_id in (
+            db.session.query(Member.user_id, Member.room_id)
+            .filter(Member.user_id.in_(sorted(updates)))
+            .all()
+        ):
+            by_room.setdefault(int(room_id), []).append(updates[int(user_id)])
+        for room_id, room_updates in by_room.items():
+            socketio.emit('presence_batch', {
+                'room_id': room_id,
+                'updates': room_updates,
+            }, room=room_socket_name(room_id))
+        self.batches += 1
+        return len(by_room)
+
+    def start(self, app):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._app = app
+        socketio.start_background_task(self._run)
+        atexit.register(self._flush_on_exit)
+
+    def _flush_on_exit(self):
+        # Transitions since the last periodic flush would be lost otherwise.
+        try:
+            with self._app.app_context():
+                try:
+                    written = self.flush()
+                finally:
+                    db.session.remove()
+            if written:
+                print(f"[PRESENCE] flushed {written} pending update(s) on shutdown")
+        except Exception as e:
+            print(f"[PRESENCE] flush on shutdown failed: {e}")
+
+    def _run(self):
+        next_flush = time.monotonic() + _flush_interval()
+        while True:
+            socketio.sleep(_debounce_seconds())
+            try:
+                with self._app.app_context():
+                    try:
+                        self.broadcast()
+                        if time.monotonic() >= next_flush:
+                            next_flush = time.monotonic() + _flush_interval()
+                            self.flush()
+                    finally:
+                        db.session.remove()
+            except Exception as e:
+                print(f"[PRESENCE] background update failed: {e}")
+
+
+presence = PresenceRegistry()
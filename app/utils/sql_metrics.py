@@ -0,0 +1,211 @@
+# Per-request SQL instrumentation (opt-in: BOXCHAT_SQL_METRICS=1)
+#
+# Engine cursor events count the statements and DB time of every unit of work
+# that runs in an app context: a Flask request, a Socket.IO event (each event
+# gets its own context) or a background loop iteration. Statements are reduced
+# to a "shape" (whitespace collapsed, numbers and IN/VALUES lists folded), and
+# a shape repeated BOXCHAT_SQL_REPEAT_THRESHOLD times in one unit is reported
+# as a likely N+1. HTTP responses get a `Server-Timing: db;dur=..` header.
+# Units over BOXCHAT_SQL_BUDGET_QUERIES / BOXCHAT_SQL_BUDGET_MS (or with an
+# N+1) are logged and kept in a short list for GET /admin/metrics.
+#
+# count_queries() / assert_max_queries() work without the env switch and are
+# meant for benchmarks and checks:
+#     with app.app_context(), assert_max_queries(8):
+#         client.get('/api/v1/rooms')
+
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from flask import g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from app.extensions import db
+
+_SPACE_RE = re.compile(r'\s+')
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_LIST_RE = re.compile(r'\?(?:\s*,\s*\?)+')
+_VALUES_LIST_RE = re.compile(r'\(\?(?:, \?)*\)(?:\s*,\s*\(\?(?:, \?)*\))+')
+
+_RECENT = deque(maxlen=50)
+_STATS = {'units': 0, 'over_budget': 0, 'repeated': 0}
+_STATS_LOCK = threading.Lock()
+
+
+def sql_metrics_enabled() -> bool:
+    return str(os.environ.get('BOXCHAT_SQL_METRICS', '') or '').strip().lower() in {'1', 'true', 'yes', 'on'}
+
+
+def sql_budget_queries() -> int:
+    try:
+        return max(1, int(os.environ.get('BOXCHAT_SQL_BUDGET_QUERIES') or 30))
+    except Exception:
+        return 30
+
+
+def sql_budget_ms() -> float:
+    try:
+        return max(1.0, float(os.environ.get('BOXCHAT_SQL_BUDGET_MS') or 200))
+    except Exception:
+        return 200.0
+
+
+def sql_repeat_threshold() -> int:
+    try:
+        return max(2, int(os.environ.get('BOXCHAT_SQL_REPEAT_THRESHOLD') or 5))
+    except Exception:
+        return 5
+
+
+def statement_shape(statement) -> str:
+    shape = _SPACE_RE.sub(' ', str(statement or '')).strip()
+    shape = _NUMBER_RE.sub('?', shape)
+    shape = _PARAM_LIST_RE.sub('?, ...', shape)
+    return _VALUES_LIST_RE.sub('(?), ...', shape)
+
+
+class SqlStats:
+    __slots__ = ('label', 'count', 'seconds', 'shapes')
+
+    def __init__(self, label):
+        self.label = label
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def add(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+def _unit_label() -> str:
+    if has_request_context():
+        socket_event = getattr(request, 'event', None)
+        if isinstance(socket_event, dict):
+            return f"socket {socket_event.get('message')}"
+        return f'{request.method} {request.path}'
+    return 'background'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_sql_metrics_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('_sql_metrics_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    if not has_app_context():
+        return
+    stats = g.get('_sql_stats')
+    if stats is None:
+        stats = g._sql_stats = SqlStats(_unit_label())
+    stats.add(statement, elapsed)
+
+
+def _add_server_timing(response):
+    stats = g.get('_sql_stats')
+    if stats is not None:
+        entry = f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"'
+        existing = response.headers.get('Server-Timing')
+        response.headers['Server-Timing'] = f'{existing}, {entry}' if existing else entry
+    return response
+
+
+def _report_unit(_exc=None):
+    stats = g.pop('_sql_stats', None)
+    if stats is None:
+        return
+    elapsed_ms = stats.seconds * 1000
+    repeated = stats.repeated(sql_repeat_threshold())
+    over_budget = stats.count > sql_budget_queries() or elapsed_ms > sql_budget_ms()
+    with _STATS_LOCK:
+        _STATS['units'] += 1
+        if over_budget:
+            _STATS['over_budget'] += 1
+        if repeated:
+            _STATS['repeated'] += 1
+        if over_budget or repeated:
+            _RECENT.append({
+                'unit': stats.label,
+                'queries': stats.count,
+                'db_ms': round(elapsed_ms, 1),
+                'repeated': [{'count': n, 'shape': shape[:300]} for shape, n in repeated[:5]],
+            })
+    if not (over_budget or repeated):
+        return
+    print(f"[SQL] {stats.label}: {stats.count} queries, {elapsed_ms:.1f} ms"
+          + (' (over budget)' if over_budget else ''))
+    for shape, n in repeated[:3]:
+        print(f"[SQL]   possible N+1: {n}x {shape[:200]}")
+
+
+def install_sql_metrics(flask_app):
+    # No-op unless BOXCHAT_SQL_METRICS is set.
+    if not sql_metrics_enabled():
+        return False
+    with flask_app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    flask_app.after_request(_add_server_timing)
+    flask_app.teardown_appcontext(_report_unit)
+    return True
+
+
+def get_sql_metrics_stats():
+    with _STATS_LOCK:
+        return {
+            'enabled': sql_metrics_enabled(),
+            'budget_queries': sql_budget_queries(),
+            'budget_ms': sql_budget_ms(),
+            'repeat_threshold': sql_repeat_threshold(),
+            **_STATS,
+            'recent': list(_RECENT),
+        }
+
+
+class QueryLog:
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, threshold=2):
+        shapes = Counter(statement_shape(s) for s in self.statements)
+        return [(shape, n) for shape, n in shapes.most_common() if n >= threshold]
+
+
+@contextmanager
+def count_queries(engine=None):
+    # Collect every statement executed on the engine inside the block.
+    engine = engine if engine is not None else db.engine
+    log = QueryLog()
+
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        log.statements.append(statement)
+
+    event.listen(engine, 'before_cursor_execute', _record)
+    try:
+        yield log
+    finally:
+        event.remove(engine, 'before_cursor_execute', _record)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    # AssertionError (with the statement shapes) when the block runs more than `limit` queries.
+    with count_queries(engine) as log:
+        yield log
+    if log.count > limit:
+        shapes = '\n'.join(f'  {n}x {shape[:200]}' for shape, n in log.repeated(threshold=1))
+        raise AssertionError(f'{log.count} queries, expected at most {limit}:\n{shapes}')
@@ -0,0 +1,337 @@
+# Single-writer queue for SQLite (opt-in: BOXCHAT_WRITE_QUEUE=1)
+#
+# Socket.IO handlers and Flask routes (greenlets on the eventlet hub) and
+# background loops all write to the same SQLite file. With several writers SQLite serializes them through its
+# file lock, so they either sit in busy waits or fail with "database is
+# locked" (a deferred transaction that read first cannot upgrade its lock).
+#
+# With the queue enabled, write units of work go through run_write(fn, ...):
+# they are put on a bounded FIFO queue and executed in order by a single
+# writer OS thread. The writer takes every unit already queued (up to
+# BOXCHAT_WRITE_QUEUE_MAX_BATCH) and runs them in one transaction, so a burst
+# costs one commit. If any of them raises, the transaction is rolled back and
+# the units are re-run one transaction each, so only the failing unit gets
+# the error. The caller blocks until its unit is done and gets fn's return
+# value back or the exception re-raised; greenlet callers wait through
+# eventlet's thread pool so the hub keeps running. A caller that times out
+# only gets TimeoutError while its unit is still queued (it is then dropped);
+# once the writer took the unit the caller waits for its real outcome, so a
+# unit is never committed behind the back of a caller that saw an error.
+# Connections are switched to WAL (synchronous=NORMAL), so reads stay
+# concurrent with the writer.
+#
+# A unit must be self-contained: take plain values (ids, dicts), read and
+# write with db.session without committing, return plain values (the
+# writer's session is closed afterwards) and have no side effects outside
+# the session, since it may be re-run. Without the env switch run_write just
+# calls fn in the caller's session and commits.
+
+import os
+import queue
+import threading
+import time
+from collections import deque
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from app.extensions import db, socketio
+
+_EXTENSION_KEY = 'boxchat_write_queue'
+
+
+def write_queue_enabled() -> bool:
+    return str(os.environ.get('BOXCHAT_WRITE_QUEUE', '') or '').strip().lower() in {'1', 'true', 'yes', 'on'}
+
+
+def write_queue_size() -> int:
+    try:
+        return max(1, int(os.environ.get('BOXCHAT_WRITE_QUEUE_SIZE') or 1000))
+    except Exception:
+        return 1000
+
+
+def write_queue_max_batch() -> int:
+    try:
+        return max(1, int(os.environ.get('BOXCHAT_WRITE_QUEUE_MAX_BATCH') or 64))
+    except Exception:
+        return 64
+
+
+def write_queue_timeout() -> float:
+    try:
+        return max(0.1, float(os.environ.get('BOXCHAT_WRITE_QUEUE_TIMEOUT') or 10))
+    except Exception:
+        return 10.0
+
+
+def sqlite_busy_timeout_ms() -> int:
+    try:
+        return max(0, int(os.environ.get('BOXCHAT_SQLITE_BUSY_TIMEOUT_MS') or 5000))
+    except Exception:
+        return 5000
+
+
+class WriteQueueFull(RuntimeError):
+    pass
+
+
+def _is_lock_error(exc) -> bool:
+    return 'database is locked' in str(exc).lower()
+
+
+def in_eventlet_hub() -> bool:
+    # Greenlets (Socket.IO events, Flask requests) all run on the main thread;
+    # the image pool, FastAPI's to_thread workers and the writer are real threads.
+    return socketio.async_mode == 'eventlet' and threading.current_thread() is threading.main_thread()
+
+
+class WriteUnit:
+    __slots__ = ('fn', 'args', 'kwargs', 'result', 'error', 'enqueued_at', 'state', '_done', '_state_lock')
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+        self.enqueued_at = time.perf_counter()
+        self.state = 'queued'  # -> 'taken' by the writer or 'cancelled' by a timed out caller
+        self._done = threading.Event()
+        self._state_lock = threading.Lock()
+
+    def claim(self) -> bool:
+        # Writer side: False when the caller already gave up on the unit
+        with self._state_lock:
+            if self.state == 'cancelled':
+                return False
+            self.state = 'taken'
+            return True
+
+    def cancel(self) -> bool:
+        # Caller side: False when the writer already took the unit
+        with self._state_lock:
+            if self.state != 'queued':
+                return False
+            self.state = 'cancelled'
+            return True
+
+    def _wait_done(self, timeout):
+        if in_eventlet_hub():
+            from eventlet import tpool
+            try:
+                return tpool.execute(self._done.wait, timeout)
+            except RuntimeError:
+                # atexit (the presence flush): no new threads, and no hub to keep running
+                pass
+        return self._done.wait(timeout)
+
+    def wait(self, timeout):
+        if not self._wait_done(timeout):
+            if self.cancel():
+                raise TimeoutError('write queue timed out')
+            # Already running: its commit (or error) is the caller's outcome.
+            while not self._wait_done(timeout):
+                pass
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class WriteQueue:
+    def __init__(self, app, maxsize=None, max_batch=None):
+        self.app = app
+        self.maxsize = write_queue_size() if maxsize is None else max(1, int(maxsize))
+        self.max_batch = write_queue_max_batch() if max_batch is None else max(1, int(max_batch))
+        self._queue = queue.Queue(self.maxsize)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self._stats = {
+            'submitted': 0,
+            'batches': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'cancelled': 0,
+            'lock_errors': 0,
+            'max_depth': 0,
+            'wait_ms_max': 0.0,
+            'run_ms_total': 0.0,
+            'run_ms_max': 0.0,
+        }
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='boxchat-db-writer', daemon=True)
+                self._thread.start()
+        return self
+
+    def is_writer_thread(self) -> bool:
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, fn, *args, **kwargs) -> WriteUnit:
+        self.start()
+        unit = WriteUnit(fn, args, kwargs)
+        deadline = time.monotonic() + write_queue_timeout()
+        while True:
+            try:
+                if in_eventlet_hub():
+                    # Never block the hub on a full queue; retry cooperatively.
+                    self._queue.put_nowait(unit)
+                else:
+                    self._queue.put(unit, timeout=max(0.0, deadline - time.monotonic()))
+                break
+            except queue.Full:
+                if time.monotonic() >= deadline or not in_eventlet_hub():
+                    with self._stats_lock:
+                        self._stats['rejected'] += 1
+                    raise WriteQueueFull(f'write queue full ({self.maxsize} units)')
+                socketio.sleep(0.005)
+        with self._stats_lock:
+            self._stats['submitted'] += 1
+            self._stats['max_depth'] = max(self._stats['max_depth'], self._queue.qsize())
+        return unit
+
+    def _run(self):
+        while True:
+            taken = [self._queue.get()]
+            # Take whatever else is already queued (no waiting) into the same commit.
+            while len(taken) < self.max_batch:
+                try:
+                    taken.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            batch = [unit for unit in taken if unit.claim()]
+            if len(batch) != len(taken):
+                with self._stats_lock:
+                    self._stats['cancelled'] += len(taken) - len(batch)
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                self._execute(batch)
+            except Exception as exc:
+                for unit in batch:
+                    if unit.error is None:
+                        unit.error = exc
+            self._record(batch, started, time.perf_counter())
+            for unit in batch:
+                unit._done.set()
+
+    def _execute(self, batch):
+        with self.app.app_context():
+            try:
+                if len(batch) > 1 and self._execute_units(batch):
+                    return
+                # A single unit, or a batch where some unit failed: one
+                # transaction per unit so only the failing one is rejected.
+                for unit in batch:
+                    unit.result = unit.error = None
+                    self._execute_units([unit])
+            finally:
+                db.session.remove()
+
+    def _execute_units(self, units) -> bool:
+        try:
+            for unit in units:
+                unit.result = unit.fn(*unit.args, **unit.kwargs)
+            db.session.commit()
+            return True
+        except Exception as exc:
+            db.session.rollback()
+            if len(units) == 1:
+                units[0].error = exc
+            return False
+
+    def _record(self, batch, started, finished):
+        with self._stats_lock:
+            stats = self._stats
+            stats['batches'] += 1
+            for unit in batch:
+                wait_ms = (started - unit.enqueued_at) * 1000
+                if unit.error is None:
+                    stats['completed'] += 1
+                else:
+                    stats['failed'] += 1
+                    if _is_lock_error(unit.error):
+                        stats['lock_errors'] += 1
+                self._waits.append(wait_ms)
+                stats['wait_ms_max'] = max(stats['wait_ms_max'], wait_ms)
+            run_ms = (finished - started) * 1000
+            stats['run_ms_total'] += run_ms
+            stats['run_ms_max'] = max(stats['run_ms_max'], run_ms)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+            waits = sorted(self._waits)
+        done = stats['completed'] + stats['failed']
+        batches = stats['batches']
+        run_total = stats.pop('run_ms_total')
+        stats.update({
+            'depth': self._queue.qsize(),
+            'maxsize': self.maxsize,
+            'wait_ms_p50': round(waits[len(waits) // 2], 2) if waits else 0.0,
+            'wait_ms_p95': round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 2) if waits else 0.0,
+            'wait_ms_max': round(stats['wait_ms_max'], 2),
+            'batch_avg': round(done / batches, 2) if batches else 0.0,
+            'run_ms_avg': round(run_total / batches, 2) if batches else 0.0,
+            'run_ms_max': round(stats['run_ms_max'], 2),
+        })
+        return stats
+
+
+def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={sqlite_busy_timeout_ms()}')
+    finally:
+        cursor.close()
+
+
+def install_write_queue(flask_app):
+    # No-op unless BOXCHAT_WRITE_QUEUE is set and the database is SQLite.
+    if not write_queue_enabled():
+        return None
+    with flask_app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return None
+    event.listen(engine, 'connect', _set_sqlite_pragmas)
+    # Reopen pooled connections so every connection gets the pragmas.
+    engine.dispose()
+    write_queue = WriteQueue(flask_app)
+    flask_app.extensions[_EXTENSION_KEY] = write_queue
+    return write_queue
+
+
+def get_write_queue(flask_app=None):
+    if flask_app is None:
+        if not has_app_context():
+            return None
+        flask_app = current_app
+    return flask_app.extensions.get(_EXTENSION_KEY)
+
+
+def run_write(fn, *args, **kwargs):
+    # Run a write unit of work and commit it; returns fn's result.
+    write_queue = get_write_queue()
+    if write_queue is None or write_queue.is_writer_thread():
+        try:
+            result = fn(*args, **kwargs)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return result
+    return write_queue.submit(fn, *args, **kwargs).wait(write_queue_timeout())
+
+
+def get_write_queue_stats():
+    write_queue = get_write_queue()
+    if write_queue is None:
+        return {'enabled': False}
+    return dict(write_queue.stats(), enabled=True)
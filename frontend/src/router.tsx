@@ -1,4 +1,4 @@
-import { createBrowserRouter, redirect } from 'react-router-dom'
+import { createBrowserRouter, redirect, type ShouldRevalidateFunctionArgs } from 'react-router-dom'
 import AppLayout from './ui/AppLayout'
 import DashboardPage from './views/DashboardPage'
 import ExplorePage from './views/ExplorePage'
@@ -25,14 +25,44 @@ async function getSession() {
   return response.json()
 }
 
-async function requireAuthLoader() {
-  const session = await getSession()
+// One round-trip for the app shell: user, rooms, unread counts and, when the URL
+// names a channel, its first message page (RoomPage uses it instead of fetching).
+// The server answers a repeat with 304 through the browser cache (weak ETag).
+async function getBootstrap(url: URL) {
+  const roomMatch = url.pathname.match(/^\/room\/(\d+)/)
+  const channelId = roomMatch ? Number(url.searchParams.get('channel_id') || 0) : 0
+  const response = await fetch(`/api/v1/bootstrap?channel_id=${channelId > 0 ? channelId : 0}`, {
+    method: 'GET',
+    credentials: 'include',
+    headers: {
+      Accept: 'application/json',
+      'X-Requested-With': 'XMLHttpRequest',
+    },
+  }).catch(() => null)
+
+  if (!response?.ok) {
+    return null
+  }
+
+  const payload = await response.json().catch(() => null)
+  return payload ? { authenticated: true, ...payload } : null
+}
+
+async function requireAuthLoader({ request }: { request: Request }) {
+  const session = await getBootstrap(new URL(request.url))
   if (!session?.authenticated) {
     throw redirect('/login')
   }
   return session
 }
 
+function shouldRevalidateRoot({ currentUrl, nextUrl, defaultShouldRevalidate }: ShouldRevalidateFunctionArgs) {
+  // A new page refreshes the shell; switching channels (?channel_id) does not.
+  if (currentUrl.pathname !== nextUrl.pathname) return true
+  if (currentUrl.search !== nextUrl.search) return false
+  return defaultShouldRevalidate
+}
+
 async function guestOnlyLoader() {
   const session = await getSession()
   if (session?.authenticated) {
@@ -47,6 +77,7 @@ export const router = createBrowserRouter([
     path: '/',
     element: <AppLayout />,
     loader: requireAuthLoader,
+    shouldRevalidate: shouldRevalidateRoot,
     children: [
       { index: true, element: <DashboardPage /> },
       { path: 'explore', element: <ExplorePage /> },
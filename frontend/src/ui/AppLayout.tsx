@@ -59,6 +59,7 @@ type SessionPayload = {
     avatar_url?: string
     banner_url?: string
   }
+  rooms?: Room[]
 }
 
 type Channel = { id: number; name: string }
@@ -118,8 +119,9 @@ export default function AppLayout() {
   const location = useLocation()
   const navigate = useNavigate()
   const session = useRouteLoaderData('root') as SessionPayload | undefined
+  const myUserId = Number(session?.user?.id || 0)
   const { mode, toggleMode } = useContext(ThemeModeContext)
-  const [rooms, setRooms] = useState<Room[]>([])
+  const [rooms, setRooms] = useState<Room[]>(() => session?.rooms ?? [])
   const [isCreateOpen, setCreateOpen] = useState(false)
   const [roomName, setRoomName] = useState('')
   const [roomType, setRoomType] = useState<'server' | 'broadcast'>('server')
@@ -199,6 +201,8 @@ export default function AppLayout() {
       showBrowserNotification('Friend request update', `${byUser} ${action} your request`, href)
     })
     s.on('message_notification', (data: any) => {
+      // Room-level notifications are shared by every member, including the sender's other tabs.
+      if (myUserId > 0 && Number(data?.from_user_id || 0) === myUserId) return
       const roomId = Number(data?.room_id || 0)
       const channelId = Number(data?.channel_id || 0)
       const messageId = Number(data?.message_id || 0)
@@ -235,7 +239,7 @@ export default function AppLayout() {
     return () => {
       s.disconnect()
     }
-  }, [loadRooms])
+  }, [loadRooms, myUserId])
 
   useEffect(() => {
     let cancelled = false
@@ -270,8 +274,13 @@ export default function AppLayout() {
   }, [])
 
   useEffect(() => {
-    void loadRooms()
-  }, [location.pathname, loadRooms])
+    // The root loader (/api/v1/bootstrap) runs again on every page change.
+    if (session?.rooms) {
+      setRooms(session.rooms)
+    } else {
+      void loadRooms()
+    }
+  }, [session, loadRooms])
 
   const dms = useMemo(() => rooms.filter((room) => room.type === 'dm'), [rooms])
   const servers = useMemo(() => rooms.filter((room) => room.type !== 'dm'), [rooms])
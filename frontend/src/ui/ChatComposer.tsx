@@ -20,6 +20,7 @@ export default function ChatComposer({
   onSendFile,
   mentionUsers,
   mentionRoles,
+  roomId,
   currentUserId,
   replyTo,
   onClearReply,
@@ -34,6 +35,7 @@ export default function ChatComposer({
   onSendFile: (file: File, caption: string) => Promise<boolean>
   mentionUsers: MentionUser[]
   mentionRoles: MentionRole[]
+  roomId?: string | number | null
   currentUserId?: number | null
   replyTo: ReplyTo | null
   onClearReply: () => void
@@ -50,6 +52,7 @@ export default function ChatComposer({
   const [pendingFile, setPendingFile] = useState<File | null>(null)
   const [pendingPreviewUrl, setPendingPreviewUrl] = useState<string | null>(null)
   const [previewOpen, setPreviewOpen] = useState(false)
+  const [remoteMentionUsers, setRemoteMentionUsers] = useState<MentionUser[] | null>(null)
 
   function clearPendingFile() {
     setPendingFile(null)
@@ -90,6 +93,32 @@ export default function ChatComposer({
     }
   }, [pendingPreviewUrl])
 
+  // Large rooms: ask the server for members by prefix instead of filtering a full member list.
+  useEffect(() => {
+    if (mentionStart == null || !roomId) {
+      setRemoteMentionUsers(null)
+      return
+    }
+    let cancelled = false
+    const timer = window.setTimeout(async () => {
+      const res = await fetch(
+        `/api/v1/room/${roomId}/members/search?prefix=${encodeURIComponent(mentionQuery)}&limit=10`,
+        { credentials: 'include', headers: { Accept: 'application/json', 'X-Requested-With': 'XMLHttpRequest' } },
+      ).catch(() => null)
+      if (cancelled || !res?.ok) return
+      const payload = await res.json().catch(() => null)
+      if (cancelled) return
+      const users: MentionUser[] = Array.isArray(payload?.members)
+        ? payload.members.map((m: any) => ({ id: Number(m?.id || 0), username: String(m?.username || '') }))
+        : []
+      setRemoteMentionUsers(users)
+    }, 150)
+    return () => {
+      cancelled = true
+      window.clearTimeout(timer)
+    }
+  }, [mentionStart, mentionQuery, roomId])
+
   const mentionCandidates = useMemo<MentionCandidate[]>(() => {
     if (mentionStart == null) return []
     const q = mentionQuery.toLowerCase()
@@ -97,13 +126,13 @@ export default function ChatComposer({
       .filter((r) => !q || String(r.mention_tag || '').toLowerCase().startsWith(q))
       .map((r) => ({ type: 'role' as const, value: String(r.mention_tag || '') }))
       .filter((x) => x.value)
-    const userItems = (mentionUsers || [])
+    const userItems = (remoteMentionUsers ?? mentionUsers ?? [])
       .filter((m) => Number(m.id) !== Number(currentUserId || 0))
       .filter((m) => !q || String(m.username || '').toLowerCase().startsWith(q))
       .map((m) => ({ type: 'user' as const, value: String(m.username || '') }))
       .filter((x) => x.value)
     return [...roleItems, ...userItems].slice(0, 10)
-  }, [mentionStart, mentionQuery, mentionRoles, mentionUsers, currentUserId])
+  }, [mentionStart, mentionQuery, mentionRoles, mentionUsers, remoteMentionUsers, currentUserId])
 
   function trackMention(value: string, caret: number) {
     const left = value.slice(0, caret)
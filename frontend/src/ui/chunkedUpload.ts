@@ -0,0 +1,93 @@
+export type UploadResult = {
+  url: string
+  type: string
+  filename: string
+}
+
+type UploadProgress = {
+  upload_id: string
+  chunk_size: number
+  chunk_count: number
+  received: number
+  next_chunk: number
+  complete: boolean
+  error?: string
+}
+
+// Files above this size go through the resumable upload API instead of one /upload_file request.
+export const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024
+
+const MAX_RETRIES = 5
+const HEADERS = { Accept: 'application/json', 'X-Requested-With': 'XMLHttpRequest' }
+// Statuses that retrying the same chunk cannot fix.
+const FATAL_STATUSES = new Set([401, 403, 404, 413, 415, 416])
+
+function sleep(ms: number): Promise<void> {
+  return new Promise((resolve) => window.setTimeout(resolve, ms))
+}
+
+async function requestJson(url: string, init: RequestInit): Promise<{ status: number; body: any } | null> {
+  try {
+    const res = await fetch(url, { credentials: 'include', ...init })
+    const body = await res.json().catch(() => null)
+    return { status: res.status, body }
+  } catch {
+    // Network error: the caller retries.
+    return null
+  }
+}
+
+function errorOf(res: { status: number; body: any } | null, fallback: string): Error {
+  const msg = String(res?.body?.error || '') || (res ? `${fallback} (HTTP ${res.status})` : fallback)
+  return new Error(msg)
+}
+
+export async function uploadFileChunked(
+  file: File,
+  onProgress?: (received: number, total: number) => void,
+): Promise<UploadResult> {
+  const created = await requestJson('/api/v1/uploads', {
+    method: 'POST',
+    headers: { ...HEADERS, 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: file.name, size: file.size }),
+  })
+  const info = created?.body as UploadProgress | null
+  if (!created || created.status !== 201 || !info?.upload_id) throw errorOf(created, 'upload failed')
+
+  const base = `/api/v1/uploads/${encodeURIComponent(info.upload_id)}`
+  const chunkSize = info.chunk_size
+  let received = info.received
+  let failures = 0
+
+  while (received < file.size) {
+    const index = Math.floor(received / chunkSize)
+    const offset = index * chunkSize
+    const res = await requestJson(`${base}/chunks/${index}`, {
+      method: 'PUT',
+      headers: { ...HEADERS, 'Content-Type': 'application/octet-stream', 'Upload-Offset': String(offset) },
+      body: file.slice(offset, offset + chunkSize),
+    })
+    if (res && res.status === 200 && typeof res.body?.received === 'number') {
+      received = res.body.received
+      failures = 0
+      onProgress?.(received, file.size)
+      continue
+    }
+    if (res && FATAL_STATUSES.has(res.status)) throw errorOf(res, 'upload failed')
+
+    failures += 1
+    if (failures > MAX_RETRIES) throw errorOf(res, 'upload failed')
+    await sleep(Math.min(1000 * 2 ** (failures - 1), 15000))
+    // Resume from what the server actually stored.
+    const progress = await requestJson(base, { method: 'GET', headers: HEADERS })
+    if (progress && progress.status === 200 && typeof progress.body?.received === 'number') {
+      received = progress.body.received
+    } else if (progress && FATAL_STATUSES.has(progress.status)) {
+      throw errorOf(progress, 'upload failed')
+    }
+  }
+
+  const done = await requestJson(`${base}/complete`, { method: 'POST', headers: HEADERS })
+  if (!done || done.status !== 200 || !done.body?.url) throw errorOf(done, 'upload failed')
+  return done.body as UploadResult
+}
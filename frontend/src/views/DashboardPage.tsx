@@ -1,4 +1,5 @@
 import { useEffect, useMemo, useState } from 'react'
+import { useRouteLoaderData } from 'react-router-dom'
 import {
   Alert,
   Avatar,
@@ -20,30 +21,12 @@ type Room = {
 }
 
 export default function DashboardPage() {
-  const [rooms, setRooms] = useState<Room[]>([])
-  const [error, setError] = useState<string | null>(null)
+  // Rooms come with the root loader's /api/v1/bootstrap response.
+  const session = useRouteLoaderData('root') as { rooms?: Room[] } | undefined
+  const rooms = session?.rooms ?? []
+  const error = session?.rooms ? null : 'Could not load rooms'
   const [incomingRequests, setIncomingRequests] = useState<Array<{ id: number; user?: { id?: number; username?: string } }>>([])
 
-  useEffect(() => {
-    let active = true
-    async function loadData() {
-      const response = await fetch('/api/v1/rooms', {
-        credentials: 'include',
-        headers: { Accept: 'application/json', 'X-Requested-With': 'XMLHttpRequest' },
-      }).catch(() => null)
-      if (!response?.ok || !active) {
-        if (active) setError('Could not load rooms')
-        return
-      }
-      const payload = await response.json().catch(() => null)
-      if (active) setRooms(payload?.rooms ?? [])
-    }
-    void loadData()
-    return () => {
-      active = false
-    }
-  }, [])
-
   useEffect(() => {
     let active = true
     async function loadRequests() {
@@ -30,8 +30,24 @@ import MessageContextMenu from '../ui/MessageContextMenu'
 import ServerSettingsDialog from '../ui/ServerSettingsDialog'
 import ImagePreviewDialog from '../ui/ImagePreviewDialog'
 import { addNotification, clearNotificationsByHref, playNotificationSound, showBrowserNotification } from '../ui/notificationsStore'
+import { CHUNKED_UPLOAD_THRESHOLD, uploadFileChunked } from '../ui/chunkedUpload'
 
-type SessionPayload = { user?: { id: number; username: string } }
+// Longest edge (px) of the image variant requested for the message list.
+const CHAT_IMAGE_SIZE = 640
+
+// Signed URL (served without a database check) when the server sent one.
+function mediaUrl(m: { file_url?: string | null; signed_file_url?: string | null }, size?: number): string {
+  const url = m.signed_file_url || m.file_url || ''
+  if (!url || !size) return url
+  return `${url}${url.includes('?') ? '&' : '?'}size=${size}`
+}
+
+type SessionPayload = {
+  user?: { id: number; username: string }
+  // From /api/v1/bootstrap (root loader)
+  rooms?: Room[]
+  channel?: { channel_id: number } & Record<string, any> | null
+}
 type Channel = { id: number; name: string; description?: string; writer_role_ids?: number[] }
 type Room = {
   id: number
@@ -50,12 +66,19 @@ type MessageItem = {
   timestamp: string
   message_type?: string
   file_url?: string | null
-  reactions?: Record<string, string[]>
+  signed_file_url?: string | null
+  reactions?: Record<string, ReactionSummary>
   reply_to_id?: number | null
   reply_to?: { id: number; username: string; snippet: string } | null
   mention_me?: boolean
 }
 
+type ReactionSummary = {
+  count: number
+  me: boolean
+  users: string[]
+}
+
 type RenderRow =
   | { type: 'date'; key: string; dateLabel: string }
   | { type: 'message'; key: string; m: MessageItem; showHeader: boolean }
@@ -84,6 +107,24 @@ function parseServerDateMs(value?: string | null): number | null {
   return Number.isFinite(t) ? t : null
 }
 
+function toMessageItem(m: any): MessageItem {
+  return {
+    id: m.id,
+    user_id: m.user_id,
+    username: m.username,
+    avatar_url: m.avatar_url ?? null,
+    content: m.content,
+    timestamp: m.timestamp,
+    message_type: m.message_type,
+    file_url: m.file_url,
+    signed_file_url: m.signed_file_url ?? null,
+    reactions: m.reactions ?? {},
+    reply_to_id: m.reply_to_id ?? null,
+    reply_to: null,
+    mention_me: false,
+  }
+}
+
 function normalizeMembersPayload(input: RoomMember[]): RoomMember[] {
   const map = new Map<number, RoomMember>()
   for (const m of input || []) {
@@ -120,7 +161,7 @@ export default function RoomPage() {
   const [messages, setMessages] = useState<MessageItem[]>([])
   const [loadingOlder, setLoadingOlder] = useState(false)
   const [hasMore, setHasMore] = useState(true)
-  const [offset, setOffset] = useState(0)
+  const [beforeCursor, setBeforeCursor] = useState<number | null>(null)
   const [members, setMembers] = useState<RoomMember[]>([])
   const [roles, setRoles] = useState<RoomRole[]>([])
   const [socket, setSocket] = useState<Socket | null>(null)
@@ -138,6 +179,9 @@ export default function RoomPage() {
 
   const fileInputRef = useRef<HTMLInputElement | null>(null)
   const scrollRef = useRef<HTMLDivElement | null>(null)
+  // Bootstrap rooms / first page already used, so a later load fetches fresh data
+  const usedBootstrapRoomsRef = useRef<SessionPayload | null>(null)
+  const usedBootstrapPageRef = useRef<object | null>(null)
   const lastChannelIdRef = useRef<number | null>(null)
   const [jumpToPresent, setJumpToPresent] = useState(false)
   const [highlightMsgId, setHighlightMsgId] = useState<number | null>(null)
@@ -147,6 +191,9 @@ export default function RoomPage() {
   const scrollActionTokenRef = useRef(0)
   const pendingScrollRef = useRef<{ type: 'bottom'; token: number } | { type: 'message'; messageId: number; token: number } | null>(null)
   const lastReadMessageIdRef = useRef<number | null>(null)
+  // Last channel change-log sequence applied; used to resync after reconnects.
+  const changeSeqRef = useRef(0)
+  const syncingChangesRef = useRef(false)
   const prefetchingRef = useRef(false)
   const pendingPrependRef = useRef<{ prevHeight: number; prevTop: number } | null>(null)
 
@@ -303,14 +350,27 @@ export default function RoomPage() {
     setScrollActionNonce((n) => n + 1)
   }
 
-  async function loadRoomData(options?: { preserveSelection?: boolean }) {
+  async function fetchRooms(): Promise<Room[] | null> {
     const roomRes = await fetch('/api/v1/rooms', {
       credentials: 'include',
       headers: { Accept: 'application/json', 'X-Requested-With': 'XMLHttpRequest' },
     }).catch(() => null)
-    if (!roomRes?.ok) return
+    if (!roomRes?.ok) return null
     const roomPayload = await roomRes.json().catch(() => null)
-    const foundRoom = (roomPayload?.rooms ?? []).find((r: Room) => String(r.id) === String(roomId))
+    return roomPayload?.rooms ?? []
+  }
+
+  async function loadRoomData(options?: { preserveSelection?: boolean }) {
+    let rooms: Room[] | null
+    if (!options?.preserveSelection && session?.rooms && usedBootstrapRoomsRef.current !== session) {
+      // First load after the root loader ran: the bootstrap response has the rooms.
+      usedBootstrapRoomsRef.current = session
+      rooms = session.rooms
+    } else {
+      rooms = await fetchRooms()
+    }
+    if (!rooms) return
+    const foundRoom = rooms.find((r: Room) => String(r.id) === String(roomId))
     if (!foundRoom) return
 
     setRoom(foundRoom)
@@ -396,16 +456,15 @@ export default function RoomPage() {
 
   function renderReactions(m: MessageItem) {
     const reactions = m.reactions ?? {}
-    const me = session?.user?.username
     const items = Object.entries(reactions)
-      .map(([emoji, users]) => ({ emoji, users: Array.isArray(users) ? users : [], count: Array.isArray(users) ? users.length : 0 }))
+      .map(([emoji, r]) => ({ emoji, users: Array.isArray(r?.users) ? r.users : [], count: Number(r?.count || 0), me: Boolean(r?.me) }))
       .filter((x) => x.count > 0)
     if (!items.length) return null
     return (
       <Stack direction="row" spacing={0.8} sx={{ mt: 0.7, px: 0.2, flexWrap: 'wrap' }}>
         {items.map((r) => (
           (() => {
-            const mine = Boolean(me && r.users.includes(me))
+            const mine = r.me
             return (
           <Button
             key={r.emoji}
@@ -442,42 +501,42 @@ export default function RoomPage() {
     setMessages((prev) => prev.filter((m) => Number(m.id) !== Number(messageId)))
   }
 
-  async function loadMessagesPage(nextOffset: number, reset: boolean, preserveScrollOnPrepend = true) {
-    if (!channelId) return { page: [] as MessageItem[], hasMore: false, lastReadMessageId: null as number | null }
+  async function loadMessagesPage(beforeId: number | null, reset: boolean, preserveScrollOnPrepend = true) {
+    const empty = { page: [] as MessageItem[], hasMore: false, prevCursor: null as number | null, lastReadMessageId: null as number | null }
+    if (!channelId) return empty
     const requestChannelId = Number(channelId || 0)
-    if (!requestChannelId) return { page: [] as MessageItem[], hasMore: false, lastReadMessageId: null as number | null }
+    if (!requestChannelId) return empty
     if (!reset && preserveScrollOnPrepend && scrollRef.current) {
       const el = scrollRef.current
       pendingPrependRef.current = { prevHeight: el.scrollHeight, prevTop: el.scrollTop }
     }
     const limit = 50
-    const res = await fetch(`/api/v1/channel/${requestChannelId}/messages?limit=${limit}&offset=${nextOffset}`, {
-      credentials: 'include',
-      headers: { Accept: 'application/json', 'X-Requested-With': 'XMLHttpRequest' },
-    }).catch(() => null)
-    if (!res?.ok) return { page: [] as MessageItem[], hasMore: false, lastReadMessageId: null as number | null }
-    const payload = await res.json().catch(() => null)
+    let payload: any
+    const bootstrapPage = session?.channel
+    if (
+      reset && !beforeId && bootstrapPage && usedBootstrapPageRef.current !== bootstrapPage
+      && Number(bootstrapPage.channel_id) === requestChannelId
+    ) {
+      // Same first page as below, already sent by /api/v1/bootstrap.
+      usedBootstrapPageRef.current = bootstrapPage
+      payload = bootstrapPage
+    } else {
+      const res = await fetch(`/api/v1/channel/${requestChannelId}/messages?limit=${limit}${beforeId ? `&before_id=${beforeId}` : ''}`, {
+        credentials: 'include',
+        headers: { Accept: 'application/json', 'X-Requested-With': 'XMLHttpRequest' },
+      }).catch(() => null)
+      if (!res?.ok) return empty
+      payload = await res.json().catch(() => null)
+    }
     if (Number(lastChannelIdRef.current || 0) !== requestChannelId) {
-      return { page: [] as MessageItem[], hasMore: false, lastReadMessageId: null as number | null }
+      return empty
     }
-    const base: MessageItem[] = (payload?.messages ?? []).map((m: any) => ({
-      id: m.id,
-      user_id: m.user_id,
-      username: m.username,
-      avatar_url: m.avatar_url ?? null,
-      content: m.content,
-      timestamp: m.timestamp,
-      message_type: m.message_type,
-      file_url: m.file_url,
-      reactions: m.reactions ?? {},
-      reply_to_id: m.reply_to_id ?? null,
-      reply_to: null,
-      mention_me: false,
-    }))
+    const base: MessageItem[] = (payload?.messages ?? []).map(toMessageItem)
     const rawLastRead = Number(payload?.last_read_message_id || 0)
     const lastReadMessageId = rawLastRead > 0 ? rawLastRead : null
     if (reset) {
       lastReadMessageIdRef.current = lastReadMessageId
+      changeSeqRef.current = Number(payload?.change_seq || 0)
     }
 
     const byId = new Map<number, MessageItem>()
@@ -491,16 +550,18 @@ export default function RoomPage() {
       m.reply_to = { id: orig.id, username: orig.username, snippet }
     }
 
-    const nextHasMore = base.length === limit
+    const nextHasMore = Boolean(payload?.has_more_before)
+    const rawPrevCursor = Number(payload?.prev_cursor || 0)
+    const prevCursor = rawPrevCursor > 0 ? rawPrevCursor : null
     setHasMore(nextHasMore)
-    setOffset(nextOffset)
+    setBeforeCursor(prevCursor)
     setMessages((prev) => {
       if (reset) return base
       const existing = new Set(prev.map((m) => Number(m.id)))
       const merged = [...base.filter((m) => !existing.has(Number(m.id))), ...prev]
       return merged
     })
-    return { page: base, hasMore: nextHasMore, lastReadMessageId }
+    return { page: base, hasMore: nextHasMore, prevCursor, lastReadMessageId }
   }
 
   useEffect(() => {
@@ -542,7 +603,7 @@ export default function RoomPage() {
   useEffect(() => {
     if (!channelId) return
     setHasMore(true)
-    setOffset(0)
+    setBeforeCursor(null)
     setUnreadBelowCount(0)
     setLoadingOlder(false)
     lastChannelIdRef.current = channelId
@@ -551,7 +612,7 @@ export default function RoomPage() {
 
     let cancelled = false
     async function loadAndScrollToLastRead() {
-      const first = await loadMessagesPage(0, true, false)
+      const first = await loadMessagesPage(null, true, false)
       if (cancelled) return
       const lastRead = first.lastReadMessageId
       lastReadMessageIdRef.current = lastRead
@@ -559,18 +620,17 @@ export default function RoomPage() {
         queueScrollToBottom()
         return
       }
-      const limit = 50
       const MAX_PAGES = 80
       let found = first.page.some((m) => Number(m.id) === lastRead)
       let more = first.hasMore
-      let nextOffset = 0
+      let cursor = first.prevCursor
       let pages = 0
-      while (!found && more && pages < MAX_PAGES) {
-        nextOffset += limit
-        const page = await loadMessagesPage(nextOffset, false, false)
+      while (!found && more && cursor && pages < MAX_PAGES) {
+        const page = await loadMessagesPage(cursor, false, false)
         if (cancelled) return
         found = page.page.some((m) => Number(m.id) === lastRead)
         more = page.hasMore
+        cursor = page.prevCursor
         pages += 1
       }
       if (found) queueScrollToMessage(lastRead)
@@ -634,11 +694,87 @@ export default function RoomPage() {
     })
   }, [messages.length])
 
+  async function syncChannelChanges(requestChannelId: number) {
+    // Fetch only what changed since the last applied change_seq (after a reconnect or a gap).
+    if (syncingChangesRef.current) return
+    syncingChangesRef.current = true
+    try {
+      const myId = Number(session?.user?.id || 0)
+      for (let page = 0; page < 20; page += 1) {
+        const since = changeSeqRef.current
+        const res = await fetch(`/api/v1/channel/${requestChannelId}/changes?since=${since}`, {
+          credentials: 'include',
+          headers: { Accept: 'application/json', 'X-Requested-With': 'XMLHttpRequest' },
+        }).catch(() => null)
+        if (!res?.ok) return
+        const payload = await res.json().catch(() => null)
+        if (!payload || Number(lastChannelIdRef.current || 0) !== requestChannelId) return
+        const added: MessageItem[] = (payload.new ?? []).map(toMessageItem)
+        const edited = new Map<number, any>((payload.edited ?? []).map((e: any) => [Number(e.id), e] as [number, any]))
+        const deleted = new Set<number>((payload.deleted ?? []).map((id: any) => Number(id)))
+        const counts = new Map<string, number>(
+          (payload.reaction_counts ?? []).map((r: any) => [`${r.message_id}:${r.emoji}`, Number(r.count || 0)] as [string, number]),
+        )
+        const mine = new Map<string, boolean>()
+        for (const r of payload.reactions ?? []) {
+          if (Number(r.user_id || 0) === myId) mine.set(`${r.message_id}:${r.emoji}`, Number(r.delta) > 0)
+        }
+        setMessages((prev) => {
+          const existing = new Set(prev.map((m) => Number(m.id)))
+          const next = prev
+            .filter((m) => !deleted.has(Number(m.id)))
+            .map((m) => {
+              const id = Number(m.id)
+              let item = m
+              const e = edited.get(id)
+              if (e) item = { ...item, content: e.content ?? item.content }
+              const touched = Array.from(counts.keys()).filter((key) => key.startsWith(`${id}:`))
+              if (touched.length) {
+                const reactions = { ...(item.reactions ?? {}) }
+                for (const key of touched) {
+                  const emoji = key.slice(String(id).length + 1)
+                  const count = counts.get(key) || 0
+                  const current = reactions[emoji] ?? { count: 0, me: false, users: [] }
+                  if (count <= 0) delete reactions[emoji]
+                  else reactions[emoji] = { ...current, count, me: mine.has(key) ? Boolean(mine.get(key)) : current.me }
+                }
+                item = { ...item, reactions }
+              }
+              return item
+            })
+          const fresh = added.filter((m) => !existing.has(Number(m.id)) && !deleted.has(Number(m.id)))
+          if (!fresh.length) return next
+          return [...next, ...fresh].sort((a, b) => Number(a.id) - Number(b.id))
+        })
+        changeSeqRef.current = Math.max(changeSeqRef.current, Number(payload.change_seq || 0))
+        if (!payload.has_more) return
+      }
+    } finally {
+      syncingChangesRef.current = false
+    }
+  }
+
+  function trackChangeSeq(data: any, requestChannelId: number) {
+    // Socket events carry the change_seq they produced; a jump means events were missed.
+    const seq = Number(data?.change_seq || 0)
+    if (!seq) return
+    if (seq === changeSeqRef.current + 1) {
+      changeSeqRef.current = seq
+    } else if (seq > changeSeqRef.current + 1) {
+      void syncChannelChanges(requestChannelId)
+    }
+  }
+
   useEffect(() => {
     if (!channelId) return
     const s = io({ withCredentials: true })
     setSocket(s)
-    s.on('connect', () => s.emit('join', { channel_id: channelId }))
+    let connectedOnce = false
+    s.on('connect', () => {
+      s.emit('join', { channel_id: channelId })
+      if (connectedOnce) void syncChannelChanges(Number(channelId))
+      connectedOnce = true
+    })
     s.on('receive_message', (data: any) => {
       if (Number(data.channel_id ?? channelId) !== Number(channelId)) return
       const el = scrollRef.current
@@ -647,7 +783,8 @@ export default function RoomPage() {
       const isFromSelf = Number(data?.user_id || 0) === myId
 
       const isFocused = typeof document !== 'undefined' ? document.hasFocus() : true
-      setMessages((prev) => [
+      trackChangeSeq(data, Number(channelId))
+      setMessages((prev) => prev.some((m) => Number(m.id) === Number(data.id)) ? prev : [
         ...prev,
         {
           id: data.id,
@@ -658,6 +795,7 @@ export default function RoomPage() {
           timestamp: data.timestamp_iso ?? new Date().toISOString(),
           message_type: data.message_type,
           file_url: data.file_url,
+          signed_file_url: data.signed_file_url ?? null,
           reactions: data.reactions ?? {},
           reply_to_id: data?.reply_to?.id ?? null,
           reply_to: data?.reply_to ?? null,
@@ -695,14 +833,41 @@ export default function RoomPage() {
     s.on('reactions_updated', (data: any) => {
       const messageId = Number(data?.message_id ?? 0)
       if (!messageId) return
+      const emoji = String(data?.emoji || '')
+      if (!emoji) return
+      trackChangeSeq(data, Number(channelId))
+      const count = Math.max(0, Number(data?.count ?? 0))
+      const delta = Number(data?.delta ?? 0)
+      const fromMe = Number(data?.user_id || 0) === Number(session?.user?.id || 0)
+      const username = String(data?.user || '')
       setMessages((prev) =>
-        prev.map((m) => (Number(m.id) === messageId ? { ...m, reactions: data?.reactions ?? {} } : m)),
+        prev.map((m) => {
+          if (Number(m.id) !== messageId) return m
+          const reactions = { ...(m.reactions ?? {}) }
+          const current = reactions[emoji] ?? { count: 0, me: false, users: [] }
+          let users = current.users.filter((u) => u !== username)
+          if (delta > 0 && username && users.length < 3) users = [...users, username]
+          if (count <= 0) {
+            delete reactions[emoji]
+          } else {
+            reactions[emoji] = { count, me: fromMe ? delta > 0 : current.me, users }
+          }
+          return { ...m, reactions }
+        }),
       )
     })
+    s.on('message_edited', (data: any) => {
+      if (Number(data?.channel_id ?? 0) !== Number(channelId)) return
+      const messageId = Number(data?.message_id ?? 0)
+      if (!messageId) return
+      trackChangeSeq(data, Number(channelId))
+      setMessages((prev) => prev.map((m) => (Number(m.id) === messageId ? { ...m, content: String(data?.content ?? m.content) } : m)))
+    })
     s.on('message_deleted', (data: any) => {
       if (Number(data?.channel_id ?? 0) !== Number(channelId)) return
       const messageId = Number(data?.message_id ?? 0)
       if (!messageId) return
+      trackChangeSeq(data, Number(channelId))
       setMessages((prev) => prev.filter((m) => Number(m.id) !== messageId))
     })
     s.on('command_result', (data: any) => {
@@ -727,6 +892,18 @@ export default function RoomPage() {
       }
       void loadRoomData({ preserveSelection: true })
     })
+    s.on('presence_batch', (data: any) => {
+      if (Number(data?.room_id || 0) !== Number(roomId || 0)) return
+      const updates = new Map<number, string>(
+        (Array.isArray(data?.updates) ? data.updates : []).map(
+          (u: any) => [Number(u?.user_id || 0), String(u?.status || 'offline')] as [number, string],
+        ),
+      )
+      if (!updates.size) return
+      setMembers((prev) =>
+        prev.map((m) => (updates.has(Number(m.id)) ? { ...m, presence_status: updates.get(Number(m.id)) } : m)),
+      )
+    })
     s.on('room_state_refresh', (data: any) => {
       if (Number(data?.room_id || 0) !== Number(roomId || 0)) return
       void loadRoomData({ preserveSelection: true })
@@ -816,21 +993,28 @@ export default function RoomPage() {
     setSendingFile(true)
     setError(null)
     try {
-      const form = new FormData()
-      form.append('file', file)
-      const uploadRes = await fetch('/upload_file', {
-        method: 'POST',
-        credentials: 'include',
-        headers: { Accept: 'application/json', 'X-Requested-With': 'XMLHttpRequest' },
-        body: form,
-      })
-      const payload = await uploadRes.json().catch(() => null)
-      if (!uploadRes.ok || !payload?.url) {
-        const msg =
-          String(payload?.error || '') ||
-          (uploadRes.status === 413 ? 'File too large' : '') ||
-          `upload failed (HTTP ${uploadRes.status})`
-        throw new Error(msg)
+      let payload: { url: string; type?: string }
+      if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+        // Large files: resumable chunks, retried after dropped connections
+        payload = await uploadFileChunked(file)
+      } else {
+        const form = new FormData()
+        form.append('file', file)
+        const uploadRes = await fetch('/upload_file', {
+          method: 'POST',
+          credentials: 'include',
+          headers: { Accept: 'application/json', 'X-Requested-With': 'XMLHttpRequest' },
+          body: form,
+        })
+        const body = await uploadRes.json().catch(() => null)
+        if (!uploadRes.ok || !body?.url) {
+          const msg =
+            String(body?.error || '') ||
+            (uploadRes.status === 413 ? 'File too large' : '') ||
+            `upload failed (HTTP ${uploadRes.status})`
+          throw new Error(msg)
+        }
+        payload = body
       }
 
       socket.emit('send_message', {
@@ -951,26 +1135,27 @@ export default function RoomPage() {
       }
     }
     if ((type === 'image' || type === 'sticker') && m.file_url) {
+      // Scrollback loads a WebP variant (longest edge 640px); the preview opens the original.
       return (
         <Box
           component="img"
-          src={m.file_url}
+          src={mediaUrl(m, CHAT_IMAGE_SIZE)}
           alt="attachment"
           loading="lazy"
           draggable={false}
-          onClick={() => setImagePreview({ src: m.file_url || '', title: (m.file_url || '').split('/').pop() || 'Image' })}
+          onClick={() => setImagePreview({ src: mediaUrl(m), title: (m.file_url || '').split('/').pop() || 'Image' })}
           sx={{ ...imageSx, cursor: 'pointer' }}
         />
       )
     }
     if (type === 'video' && m.file_url) {
       return (
-        <CustomVideoPlayer src={m.file_url} />
+        <CustomVideoPlayer src={mediaUrl(m)} />
       )
     }
     if (type === 'music' && m.file_url) {
       return (
-        <CustomAudioPlayer src={m.file_url} title={m.file_url.split('/').pop()} />
+        <CustomAudioPlayer src={mediaUrl(m)} title={m.file_url.split('/').pop()} />
       )
     }
     if (type === 'file' && m.file_url) {
@@ -978,7 +1163,7 @@ export default function RoomPage() {
         <Stack direction="row" spacing={1} alignItems="center" sx={{ p: 0.8, borderRadius: 1, border: '1px solid', borderColor: 'divider' }}>
           <FileText size={15} />
           <Typography sx={{ maxWidth: 180 }} noWrap>{m.file_url.split('/').pop()}</Typography>
-          <Button size="small" href={m.file_url} target="_blank" startIcon={<Download size={14} />}>Open</Button>
+          <Button size="small" href={mediaUrl(m)} target="_blank" startIcon={<Download size={14} />}>Open</Button>
         </Stack>
       )
     }
@@ -1205,11 +1390,11 @@ export default function RoomPage() {
                 }
 
                 if (prefetchingRef.current) return
-                if (!hasMore || loadingOlder) return
+                if (!hasMore || !beforeCursor || loadingOlder) return
                 if (el.scrollTop > 140) return
                 prefetchingRef.current = true
                 setLoadingOlder(true)
-                void loadMessagesPage(offset + 50, false).finally(() => {
+                void loadMessagesPage(beforeCursor, false).finally(() => {
                   prefetchingRef.current = false
                   setLoadingOlder(false)
                 })
@@ -1422,6 +1607,7 @@ export default function RoomPage() {
             onSendFile={uploadAndSendFile}
             mentionUsers={members}
             mentionRoles={roles}
+            roomId={roomId}
             currentUserId={session?.user?.id}
             replyTo={replyTo}
             onClearReply={() => setReplyTo(null)}
@@ -0,0 +1,151 @@
+"""Benchmark the SPA cold start: legacy call sequence vs GET /api/v1/bootstrap.
+
+The legacy sequence is what the SPA issued on load: /api/v1/auth/session,
+/api/v1/user/me, /api/v1/rooms, /api/v1/room/<id>/members for every room and
+/api/v1/channel/<id>/messages for every channel. The bootstrap run issues one
+request for the same data (plus the first page of the last opened channel)
+and then a revalidation with If-None-Match.
+
+Requests go through the Flask test client (no network); SQL statements are
+counted with an engine `before_cursor_execute` listener.
+
+Usage:
+  python tools/benchmark/bootstrap_benchmark.py
+  python tools/benchmark/bootstrap_benchmark.py --rooms 10 50 --members 200 --repeat 20
+"""
+
+import argparse
+import time
+
+from common import create_bench_app, seed_users, print_table
+
+
+def _seed(db, models, user_id, other_ids, rooms, channels, messages):
+    from app.functions import ensure_default_roles, ensure_user_default_roles
+
+    Room, Channel, Member, Message, ReadMessage = models
+    channel_ids = []
+    room_ids = []
+    for idx in range(rooms):
+        room = Room(name=f'bench-bootstrap-{idx}', type='server', is_public=True, owner_id=user_id)
+        db.session.add(room)
+        db.session.flush()
+        room_ids.append(room.id)
+        for c in range(channels):
+            channel = Channel(name=f'channel-{c}', room_id=room.id)
+            db.session.add(channel)
+            db.session.flush()
+            channel_ids.append(channel.id)
+        db.session.execute(Member.__table__.insert(), [
+            {'user_id': uid, 'room_id': room.id, 'role': 'owner' if uid == user_id else 'member'}
+            for uid in [user_id] + other_ids
+        ])
+    db.session.commit()
+    for room_id in room_ids:
+        ensure_default_roles(room_id)
+        ensure_user_default_roles(user_id, room_id)
+    db.session.commit()
+
+    rows = [
+        {
+            'content': f'message {n}',
+            'user_id': other_ids[n % len(other_ids)],
+            'channel_id': channel_id,
+            'message_type': 'text',
+        }
+        for channel_id in channel_ids for n in range(messages)
+    ]
+    db.session.execute(Message.__table__.insert(), rows)
+    db.session.add(ReadMessage(user_id=user_id, channel_id=channel_ids[-1]))
+    db.session.commit()
+    return room_ids, channel_ids
+
+
+def _client_for(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+    return client
+
+
+def _legacy(client):
+    requests_made = 0
+    for url in ('/api/v1/auth/session', '/api/v1/user/me'):
+        client.get(url)
+        requests_made += 1
+    rooms = client.get('/api/v1/rooms').get_json()['rooms']
+    requests_made += 1
+    for room in rooms:
+        client.get(f"/api/v1/room/{room['id']}/members")
+        requests_made += 1
+        for channel in room['channels']:
+            client.get(f"/api/v1/channel/{channel['id']}/messages?limit=50")
+            requests_made += 1
+    return requests_made
+
+
+def _measure(fn, counter, repeat):
+    samples = []
+    statements = 0
+    result = None
+    for _ in range(repeat):
+        counter[0] = 0
+        started = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - started) * 1000)
+        statements = counter[0]
+    return result, sum(samples) / len(samples), statements
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the SPA cold start requests.')
+    parser.add_argument('--rooms', type=int, nargs='+', default=[5, 20, 50])
+    parser.add_argument('--channels', type=int, default=3, help='channels per room')
+    parser.add_argument('--members', type=int, default=50, help='members per room')
+    parser.add_argument('--messages', type=int, default=60, help='messages per channel')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    app, db_path = create_bench_app()
+    from sqlalchemy import event
+    from app.extensions import db
+    from app.models import Room, Channel, Member, Message, ReadMessage
+
+    counter = [0]
+
+    def _count(*_args):
+        counter[0] += 1
+
+    rows = []
+    for rooms in args.rooms:
+        with app.app_context():
+            user_ids = seed_users(args.members, prefix=f'bootstrap{rooms}')
+            _seed(
+                db, (Room, Channel, Member, Message, ReadMessage),
+                user_ids[0], user_ids[1:], rooms, args.channels, args.messages,
+            )
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', _count)
+        client = _client_for(app, user_ids[0])
+
+        calls, legacy_ms, legacy_sql = _measure(lambda: _legacy(client), counter, args.repeat)
+        rows.append((rooms, 'legacy sequence', calls, legacy_sql, f'{legacy_ms:.1f}'))
+
+        response, boot_ms, boot_sql = _measure(lambda: client.get('/api/v1/bootstrap'), counter, args.repeat)
+        rows.append((rooms, 'bootstrap', 1, boot_sql, f'{boot_ms:.1f}'))
+
+        etag = response.headers.get('ETag')
+        revalidated, reval_ms, reval_sql = _measure(
+            lambda: client.get('/api/v1/bootstrap', headers={'If-None-Match': etag}), counter, args.repeat,
+        )
+        rows.append((rooms, f'bootstrap {revalidated.status_code}', 1, reval_sql, f'{reval_ms:.1f}'))
+        event.remove(engine, 'before_cursor_execute', _count)
+
+    print(f'[BENCH] database: {db_path}')
+    print(f'[BENCH] {args.channels} channels/room, {args.members} members/room, {args.messages} messages/channel')
+    print_table(['rooms', 'mode', 'requests', 'SQL statements', 'mean ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
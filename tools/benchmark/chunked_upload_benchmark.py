@@ -0,0 +1,118 @@
+"""Check that chunked uploads keep memory flat as files grow.
+
+Uploads files of increasing size through the resumable upload API
+(POST /api/v1/uploads, PUT .../chunks/<i>, POST .../complete) with the Flask
+test client. Chunk bodies are generated lazily, so the traced Python memory
+(tracemalloc) is what the server side needs per upload. Reports peak memory,
+throughput and requests per file, and exits with status 1 when the peak of
+the largest file exceeds --max-peak-mb.
+
+Usage:
+  python tools/benchmark/chunked_upload_benchmark.py
+  python tools/benchmark/chunked_upload_benchmark.py --sizes-mb 64 1024 4096 --chunk-mb 8
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from common import create_bench_app, seed_users, print_table
+
+
+class _ZeroStream:
+    # Seekable request body of `size` zero bytes that never holds more than one read.
+    def __init__(self, size):
+        self.size = size
+        self.pos = 0
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=0):
+        self.pos = {0: offset, 1: self.pos + offset, 2: self.size + offset}[whence]
+        return self.pos
+
+    def read(self, n=-1):
+        remaining = self.size - self.pos
+        if remaining <= 0:
+            return b''
+        n = remaining if n is None or n < 0 else min(n, remaining)
+        self.pos += n
+        return bytes(n)
+
+
+def _upload(client, size):
+    created = client.post('/api/v1/uploads', json={'filename': 'bench.mp4', 'size': size})
+    info = created.get_json()
+    if created.status_code != 201:
+        raise RuntimeError(f'create failed: {info}')
+    requests = 1
+    for index in range(info['chunk_count']):
+        length = min(info['chunk_size'], size - index * info['chunk_size'])
+        resp = client.put(
+            f"/api/v1/uploads/{info['upload_id']}/chunks/{index}",
+            input_stream=_ZeroStream(length),
+            content_type='application/octet-stream',
+        )
+        requests += 1
+        if resp.status_code != 200:
+            raise RuntimeError(f'chunk {index} failed: {resp.get_json()}')
+    done = client.post(f"/api/v1/uploads/{info['upload_id']}/complete").get_json()
+    return done['url'], requests + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chunked upload memory check.')
+    parser.add_argument('--sizes-mb', type=int, nargs='+', default=[16, 128, 512])
+    parser.add_argument('--chunk-mb', type=int, default=8)
+    parser.add_argument('--max-peak-mb', type=float, default=4.0)
+    args = parser.parse_args()
+
+    os.environ['BOXCHAT_UPLOAD_CHUNK_SIZE'] = str(args.chunk_mb * 1024 * 1024)
+    upload_dir = tempfile.mkdtemp(prefix='boxchat-bench-uploads-')
+    app, db_path = create_bench_app(extra={'UPLOAD_FOLDER': upload_dir})
+
+    from app.functions import blob_path_for_url
+
+    with app.app_context():
+        user_id = seed_users(1, prefix='chunked')[0]
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+
+    rows = []
+    peak_mb = 0.0
+    try:
+        for size_mb in args.sizes_mb:
+            size = size_mb * 1024 * 1024
+            tracemalloc.start()
+            started = time.perf_counter()
+            url, requests = _upload(client, size)
+            elapsed = time.perf_counter() - started
+            peak_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+            stored_path = os.path.join(upload_dir, blob_path_for_url(url))
+            stored = os.path.getsize(stored_path)
+            if stored != size:
+                raise RuntimeError(f'stored {stored} bytes, expected {size}')
+            os.remove(stored_path)
+            rows.append((size_mb, requests, f'{peak_mb:.2f}', f'{size_mb / elapsed:.0f}'))
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    print(f'[BENCH] database: {db_path}')
+    print(f'[BENCH] chunk size {args.chunk_mb} MiB')
+    print_table(['file MiB', 'requests', 'peak MB', 'MiB/s'], rows)
+    if peak_mb > args.max_peak_mb:
+        print(f'[BENCH] FAIL: peak {peak_mb:.2f} MB > {args.max_peak_mb} MB')
+        sys.exit(1)
+    print('[BENCH] OK: memory per upload does not grow with file size')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Shared helpers for the benchmark scripts in tools/benchmark.
+
+Benchmarks run against a throwaway SQLite database so they never touch a real
+instance database.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import config as app_config
+
+
+def _sqlite_uri_from_path(db_path: str) -> str:
+    abs_db = os.path.abspath(db_path).replace('\\', '/')
+    if len(abs_db) > 2 and abs_db[1] == ':':
+        return f"sqlite:///{abs_db}"
+    return f"sqlite:////{abs_db.lstrip('/')}"
+
+
+def create_bench_app(db_path: str | None = None, extra: dict | None = None):
+    """Create a Flask app bound to a temporary (or given) SQLite file."""
+    from app import create_app
+
+    if not db_path:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='boxchat-bench-'), 'bench.db')
+    values = {k: getattr(app_config, k) for k in dir(app_config) if k.isupper()}
+    values['SQLALCHEMY_DATABASE_URI'] = _sqlite_uri_from_path(db_path)
+    values['SECRET_KEY'] = 'benchmark-secret-key-benchmark-secret-key'
+    values.update(extra or {})
+    os.environ.setdefault('BOXCHAT_ADMIN_PASSWORD', 'benchmark-admin-password')
+    return create_app(config=SimpleNamespace(**values), init_db=True), db_path
+
+
+def seed_users(count: int, prefix: str = 'bench'):
+    """Insert `count` users and return their ids (fast core insert)."""
+    from app.extensions import db
+    from app.models import User
+
+    start = db.session.query(db.func.coalesce(db.func.max(User.id), 0)).scalar() or 0
+    rows = [
+        {'username': f'{prefix}_{start + i}', 'password': 'x', 'presence_status': 'offline'}
+        for i in range(1, count + 1)
+    ]
+    if rows:
+        db.session.execute(User.__table__.insert(), rows)
+        db.session.commit()
+    return [
+        int(uid) for (uid,) in
+        db.session.query(User.id).filter(User.id > start).order_by(User.id.asc()).all()
+    ]
+
+
+def timed(fn, repeat: int = 1):
+    """Run fn `repeat` times; return (last_result, mean_seconds)."""
+    result = None
+    started = time.perf_counter()
+    for _ in range(max(1, repeat)):
+        result = fn()
+    return result, (time.perf_counter() - started) / max(1, repeat)
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) if rows else len(str(h)) for i, h in enumerate(headers)]
+    line = '  '.join(str(h).ljust(w) for h, w in zip(headers, widths))
+    print(line)
+    print('-' * len(line))
+    for r in rows:
+        print('  '.join(str(c).ljust(w) for c, w in zip(r, widths)))
@@ -0,0 +1,124 @@
+"""Benchmark message notification fan-out as room size grows.
+
+Compares the legacy per-member loop (one `message_notification` emit per
+member) with the room-level fan-out in app/sockets/fanout.py. Every member
+gets one fake connected socket so the numbers include packet delivery.
+
+Usage:
+  python tools/benchmark/fanout_benchmark.py
+  python tools/benchmark/fanout_benchmark.py --sizes 10 100 1000 5000 --messages 20
+"""
+
+import argparse
+
+from common import create_bench_app, seed_users, timed, print_table
+
+
+def _legacy_notify(socketio, Member, room, channel_id, message_id, sender, content, mention_data):
+    # Reproduction of the pre-fan-out loop in handle_send_message.
+    emits = 0
+    members = Member.query.filter_by(room_id=room.id).all()
+    for m in members:
+        uid = m.user_id
+        if uid == sender.id:
+            continue
+        snippet = (content or '').strip().split('\n')[0][:140]
+        payload = {
+            'room_id': room.id,
+            'channel_id': channel_id,
+            'message_id': message_id,
+            'from_user': sender.username,
+            'from_user_id': sender.id,
+            'snippet': snippet,
+            'unread_count': None,
+            'mention': mention_data['mention_everyone'] or uid in set(mention_data['mentioned_user_ids']),
+            'mention_everyone': mention_data['mention_everyone'],
+            'mention_roles': mention_data['mentioned_role_tags'],
+        }
+        socketio.emit('message_notification', payload, room=f"user_{uid}")
+        emits += 1
+    return emits
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark room notification fan-out.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--messages', type=int, default=20, help='messages per room size and mode')
+    args = parser.parse_args()
+
+    app, db_path = create_bench_app()
+    from app.extensions import db, socketio
+    from app.models import Room, Channel, Member, User
+    from app.sockets.fanout import notify_room_message, room_socket_name, user_socket_name
+
+    manager = socketio.server.manager
+    delivered = {'packets': 0}
+
+    def _count_packet(_eio_sid, _pkt):
+        delivered['packets'] += 1
+
+    socketio.server._send_eio_packet = _count_packet
+
+    emit_calls = {'n': 0}
+    real_emit = socketio.emit
+
+    def _counting_emit(*a, **kw):
+        emit_calls['n'] += 1
+        return real_emit(*a, **kw)
+
+    socketio.emit = _counting_emit
+
+    rows = []
+    mention_data = {
+        'mention_everyone': False,
+        'mentioned_user_ids': [],
+        'mentioned_usernames': [],
+        'mentioned_role_ids': [],
+        'mentioned_role_tags': [],
+        'denied_role_tags': [],
+    }
+    with app.app_context():
+        for size in args.sizes:
+            user_ids = seed_users(size, prefix=f'fanout{size}')
+            room = Room(name=f'bench-{size}', type='server', is_public=True, owner_id=user_ids[0])
+            db.session.add(room)
+            db.session.flush()
+            channel = Channel(name='general', room_id=room.id)
+            db.session.add(channel)
+            db.session.execute(Member.__table__.insert(), [
+                {'user_id': uid, 'room_id': room.id, 'role': 'owner' if i == 0 else 'member'}
+                for i, uid in enumerate(user_ids)
+            ])
+            db.session.commit()
+
+            # One fake connected socket per member, joined like on_connect does.
+            for uid in user_ids:
+                sid = manager.connect(f'eio-{room.id}-{uid}', '/')
+                manager.enter_room(sid, '/', user_socket_name(uid))
+                manager.enter_room(sid, '/', room_socket_name(room.id))
+
+            sender = db.session.get(User, user_ids[0])
+            for mode in ('legacy', 'fanout'):
+                emit_calls['n'] = 0
+                delivered['packets'] = 0
+
+                def _send_one():
+                    if mode == 'legacy':
+                        return _legacy_notify(socketio, Member, room, channel.id, 1, sender, 'hello world', mention_data)
+                    return notify_room_message(room, channel.id, 1, sender, 'hello world', mention_data)
+
+                _, seconds = timed(_send_one, repeat=args.messages)
+                rows.append((
+                    size,
+                    mode,
+                    emit_calls['n'] // args.messages,
+                    delivered['packets'] // args.messages,
+                    f'{seconds * 1000:.2f}',
+                ))
+
+    print(f'[BENCH] database: {db_path}')
+    print_table(['members', 'mode', 'emits/msg', 'packets/msg', 'ms/msg'], rows)
+
+
+if __name__ == '__main__':
+    main()
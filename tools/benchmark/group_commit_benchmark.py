@@ -0,0 +1,110 @@
+"""Benchmark message insert throughput: per-message commit vs group commit.
+
+Spawns concurrent senders (green threads under eventlet, threads otherwise)
+that each insert messages through app/sockets/message_writer.write_message,
+first with one commit per message and then with BOXCHAT_GROUP_COMMIT=1.
+Afterwards it checks that every sender's messages got increasing ids, i.e.
+per-sender (and therefore per-channel) ordering survived batching.
+
+Usage:
+  python tools/benchmark/group_commit_benchmark.py
+  python tools/benchmark/group_commit_benchmark.py --senders 1 16 64 --messages 2000 --window-ms 5
+"""
+
+import argparse
+import os
+import time
+
+from common import create_bench_app, seed_users, print_table
+
+
+def _run_mode(app, socketio, write_message, user_ids, channel_id, senders, total):
+    per_sender = max(1, total // senders)
+    done = [socketio.server.eio.create_event() for _ in range(senders)]
+    assigned = [[] for _ in range(senders)]
+    errors = []
+
+    def _sender(idx):
+        try:
+            with app.app_context():
+                for n in range(per_sender):
+                    msg, _seq = write_message(
+                        app,
+                        content=f'sender {idx} message {n}',
+                        user_id=user_ids[idx % len(user_ids)],
+                        channel_id=channel_id,
+                        message_type='text',
+                    )
+                    assigned[idx].append(int(msg.id))
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            done[idx].set()
+
+    started = time.perf_counter()
+    for idx in range(senders):
+        socketio.start_background_task(_sender, idx)
+    for event in done:
+        event.wait()
+    elapsed = time.perf_counter() - started
+
+    ordered = all(ids == sorted(ids) for ids in assigned)
+    return per_sender * senders, elapsed, ordered, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark group commit for chat messages.')
+    parser.add_argument('--senders', type=int, nargs='+', default=[1, 8, 32, 128])
+    parser.add_argument('--messages', type=int, default=1000, help='messages per run')
+    parser.add_argument('--window-ms', type=float, default=5.0)
+    parser.add_argument('--max-batch', type=int, default=64)
+    args = parser.parse_args()
+
+    os.environ['BOXCHAT_GROUP_COMMIT_WINDOW_MS'] = str(args.window_ms)
+    os.environ['BOXCHAT_GROUP_COMMIT_MAX_BATCH'] = str(args.max_batch)
+
+    app, db_path = create_bench_app()
+    from app.extensions import db, socketio
+    from app.models import Room, Channel
+    from app.sockets import message_writer
+    from app.sockets.message_writer import write_message
+
+    with app.app_context():
+        user_ids = seed_users(max(args.senders), prefix='groupcommit')
+        room = Room(name='bench-group-commit', type='server', is_public=True, owner_id=user_ids[0])
+        db.session.add(room)
+        db.session.flush()
+        channel = Channel(name='general', room_id=room.id)
+        db.session.add(channel)
+        db.session.commit()
+        channel_id = channel.id
+
+    rows = []
+    for senders in args.senders:
+        for mode in ('per-message', 'group'):
+            if mode == 'group':
+                os.environ['BOXCHAT_GROUP_COMMIT'] = '1'
+            else:
+                os.environ.pop('BOXCHAT_GROUP_COMMIT', None)
+            writer = message_writer.get_message_writer(app) if mode == 'group' else None
+            batches_before = writer.batches if writer else 0
+            count, elapsed, ordered, errors = _run_mode(
+                app, socketio, write_message, user_ids, channel_id, senders, args.messages,
+            )
+            batches = (writer.batches - batches_before) if writer else count
+            rows.append((
+                senders,
+                mode,
+                count,
+                batches,
+                f'{count / elapsed:.0f}' if elapsed else '-',
+                'yes' if ordered else 'NO',
+                len(errors),
+            ))
+
+    print(f'[BENCH] database: {db_path}')
+    print_table(['senders', 'mode', 'messages', 'commits', 'msg/s', 'ordered', 'errors'], rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Bytes served for chat scrollback: original images vs ?size= WebP variants.
+
+Uploads --images synthetic camera-sized photos through /upload_file, waits
+for the image pool (app/functions/image_variants.py) to write their variants,
+then fetches every image the way the message list does (?size=640 with a
+WebP Accept header) and as the original. Reports bytes per image, the
+reduction factor and variant generation time, and exits with status 1 when
+the reduction is below --min-ratio.
+
+Usage:
+  python tools/benchmark/image_variant_benchmark.py
+  python tools/benchmark/image_variant_benchmark.py --images 20 --width 4032 --height 3024 --size 320
+"""
+
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from common import create_bench_app, seed_users, print_table
+
+
+def _photo(width, height, seed):
+    # Shapes, blotchy colour and fine sensor-like noise: compresses roughly like a phone photo.
+    from PIL import Image, ImageChops
+
+    base = Image.effect_mandelbrot(
+        (width // 4, height // 4), (-2.0 + seed * 0.01, -1.2, 1.0, 1.2), 64
+    ).convert('RGB').resize((width, height), Image.Resampling.BICUBIC)
+    coarse = Image.merge('RGB', [
+        Image.effect_noise((width // 24, height // 24), 70).resize((width, height), Image.Resampling.BICUBIC)
+        for _ in range(3)
+    ])
+    fine = Image.effect_noise((width, height), 10).convert('RGB')
+    img = ImageChops.add(ImageChops.add(base, coarse, scale=2.0), fine, offset=-40)
+    buf = io.BytesIO()
+    img.save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Image variant bandwidth check.')
+    parser.add_argument('--images', type=int, default=8)
+    parser.add_argument('--width', type=int, default=4032)
+    parser.add_argument('--height', type=int, default=3024)
+    parser.add_argument('--size', type=int, default=640, help='?size= requested by the message list')
+    parser.add_argument('--min-ratio', type=float, default=10.0)
+    args = parser.parse_args()
+
+    upload_dir = tempfile.mkdtemp(prefix='boxchat-bench-uploads-')
+    app, db_path = create_bench_app(extra={'UPLOAD_FOLDER': upload_dir})
+    from app.extensions import db
+    from app.models import Room, Channel, Member, Message, UploadBlob
+
+    with app.app_context():
+        user_id = seed_users(1, prefix='variants')[0]
+        room = Room(name='bench-variants', type='server', is_public=True, owner_id=user_id)
+        db.session.add(room)
+        db.session.flush()
+        channel = Channel(name='general', room_id=room.id)
+        db.session.add(channel)
+        db.session.add(Member(user_id=user_id, room_id=room.id, role='owner'))
+        db.session.commit()
+        channel_id = channel.id
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+
+    try:
+        photos = [_photo(args.width, args.height, idx) for idx in range(args.images)]
+        urls = []
+        started = time.perf_counter()
+        for idx, data in enumerate(photos):
+            resp = client.post('/upload_file', data={'file': (io.BytesIO(data), f'photo-{idx}.jpg')},
+                               content_type='multipart/form-data')
+            urls.append(resp.get_json()['url'])
+        upload_s = time.perf_counter() - started
+        with app.app_context():
+            for url in urls:
+                db.session.add(Message(content='photo', user_id=user_id, channel_id=channel_id,
+                                       message_type='image', file_url=url))
+            db.session.commit()
+            # Wait for the pool to record every image's variants.
+            deadline = time.monotonic() + 120
+            while time.monotonic() < deadline:
+                pending = UploadBlob.query.filter(UploadBlob.variants.is_(None)).count()
+                db.session.rollback()
+                if not pending:
+                    break
+                time.sleep(0.1)
+        variants_s = time.perf_counter() - started
+
+        original_bytes = 0
+        variant_bytes = 0
+        for url in urls:
+            resp = client.get(url)
+            original_bytes += len(resp.data)
+            resp.close()
+            resp = client.get(f'{url}?size={args.size}', headers={'Accept': 'image/webp,*/*'})
+            if resp.headers.get('Content-Type') != 'image/webp':
+                raise RuntimeError(f'no variant served for {url}')
+            variant_bytes += len(resp.data)
+            resp.close()
+    finally:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    ratio = original_bytes / variant_bytes if variant_bytes else 0.0
+    print(f'[BENCH] database: {db_path}')
+    print(f'[BENCH] {args.images} images {args.width}x{args.height}, uploads {upload_s:.1f} s, '
+          f'variants ready after {variants_s:.1f} s ({os.environ.get("BOXCHAT_IMAGE_WORKERS") or 2} workers)')
+    print_table(
+        ['served', 'KiB / image', 'total MiB'],
+        [
+            ('original', f'{original_bytes / len(urls) / 1024:.0f}', f'{original_bytes / (1024 * 1024):.1f}'),
+            (f'?size={args.size} (WebP)', f'{variant_bytes / len(urls) / 1024:.0f}', f'{variant_bytes / (1024 * 1024):.2f}'),
+        ],
+    )
+    if ratio < args.min_ratio:
+        print(f'[BENCH] FAIL: {ratio:.1f}x less than {args.min_ratio}x')
+        sys.exit(1)
+    print(f'[BENCH] OK: scrollback images are {ratio:.1f}x smaller')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Worker time per media range request: native streaming vs proxy offload.
+
+Uploads one --mb video, posts it in a room and scrubs through it the way a
+video player does: --requests GETs with a random `Range: bytes=<start>-`
+window of --range-kb. Every mode runs the full GET /uploads request in
+process (access check included) and, for native delivery, reads the body the
+worker would stream. Reports p50/p95 per request for the session check and
+the signed URL (app/functions/media_urls.py) in BOXCHAT_MEDIA_DELIVERY=native,
+x-accel and x-sendfile, and exits with status 1 when the signed x-accel p50
+is above --max-ms.
+
+Usage:
+  python tools/benchmark/media_delivery_benchmark.py
+  python tools/benchmark/media_delivery_benchmark.py --mb 200 --requests 2000 --range-kb 2048
+"""
+
+import argparse
+import io
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from common import create_bench_app, seed_users, print_table
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _scrub(client, url, size, args, read_body):
+    rng = random.Random(7)
+    samples = []
+    for _ in range(args.requests):
+        start = rng.randrange(0, max(1, size - 1))
+        end = min(size - 1, start + args.range_kb * 1024 - 1)
+        began = time.perf_counter()
+        resp = client.get(url, headers={'Range': f'bytes={start}-{end}'})
+        if read_body:
+            resp.get_data()
+        resp.close()
+        samples.append((time.perf_counter() - began) * 1000)
+        if resp.status_code not in (200, 206):
+            raise RuntimeError(f'{url}: HTTP {resp.status_code}')
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Media delivery worker time check.')
+    parser.add_argument('--mb', type=int, default=64, help='video size in MiB')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--range-kb', type=int, default=1024)
+    parser.add_argument('--max-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    upload_dir = tempfile.mkdtemp(prefix='boxchat-bench-uploads-')
+    app, db_path = create_bench_app(extra={'UPLOAD_FOLDER': upload_dir})
+    from app.extensions import db
+    from app.models import Room, Channel, Member, Message
+    from app.functions import sign_media_url
+
+    with app.app_context():
+        user_id = seed_users(1, prefix='media')[0]
+        room = Room(name='bench-media', type='server', is_public=True, owner_id=user_id)
+        db.session.add(room)
+        db.session.flush()
+        channel = Channel(name='general', room_id=room.id)
+        db.session.add(channel)
+        db.session.add(Member(user_id=user_id, room_id=room.id, role='owner'))
+        db.session.commit()
+        channel_id = channel.id
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+
+    previous_mode = os.environ.get('BOXCHAT_MEDIA_DELIVERY')
+    rows = []
+    signed_accel_p50 = None
+    try:
+        size = args.mb * 1024 * 1024
+        resp = client.post('/upload_file', data={'file': (io.BytesIO(os.urandom(size)), 'clip.mp4')},
+                           content_type='multipart/form-data')
+        url = resp.get_json()['url']
+        with app.app_context():
+            from app.functions import add_message_attachments
+            db.session.add(Message(content='clip', user_id=user_id, channel_id=channel_id,
+                                   message_type='video', file_url=url))
+            add_message_attachments([(url, channel_id)])
+            db.session.commit()
+        with app.test_request_context():
+            signed = sign_media_url(url)
+        anonymous = app.test_client()
+
+        for mode in ('native', 'x-accel', 'x-sendfile'):
+            os.environ['BOXCHAT_MEDIA_DELIVERY'] = mode
+            for label, http, target in (('session', client, url), ('signed', anonymous, signed)):
+                samples = _scrub(http, target, size, args, read_body=(mode == 'native'))
+                p50 = statistics.median(samples)
+                if mode == 'x-accel' and label == 'signed':
+                    signed_accel_p50 = p50
+                rows.append((mode, label, f'{p50:.3f}', f'{_percentile(samples, 95):.3f}'))
+    finally:
+        if previous_mode is None:
+            os.environ.pop('BOXCHAT_MEDIA_DELIVERY', None)
+        else:
+            os.environ['BOXCHAT_MEDIA_DELIVERY'] = previous_mode
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+    print(f'[BENCH] database: {db_path}')
+    print(f'[BENCH] {args.mb} MiB video, {args.requests} range requests of {args.range_kb} KiB per row')
+    print_table(['delivery', 'auth', 'p50 ms', 'p95 ms'], rows)
+    if signed_accel_p50 is None or signed_accel_p50 > args.max_ms:
+        print(f'[BENCH] FAIL: signed x-accel p50 above {args.max_ms} ms')
+        sys.exit(1)
+    print(f'[BENCH] OK: signed x-accel p50 {signed_accel_p50:.3f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""Benchmark startup role seeding: per-member ORM loop vs set-based INSERT ... SELECT.
+
+Bulk-inserts rooms and memberships without any role data, then times
+app/functions/roles.seed_roles_for_existing_rooms (a few INSERT ... SELECT
+statements) against the previous implementation, which loaded every Member
+and ran ensure_default_roles / ensure_user_default_roles for each one. Both
+runs start from the same unseeded state and must produce the same number of
+roles and member-role links. A second set-based run shows the cost of the
+no-op case.
+
+At boot the seeding now only runs when migrate() changed the schema version
+(or with BOXCHAT_SEED_ROLES_ON_BOOT=1); the `[STARTUP]` line printed by
+create_app reports the time of each step.
+
+Usage:
+  python tools/benchmark/role_seed_benchmark.py
+  python tools/benchmark/role_seed_benchmark.py --memberships 2000000 --rooms 2000 --skip-legacy
+"""
+
+import argparse
+import time
+
+from common import create_bench_app, seed_users, print_table
+
+
+def _legacy_seed(Member):
+    from app.extensions import db
+    from app.functions import ensure_default_roles, ensure_user_default_roles
+
+    members = Member.query.all()
+    seen_room_ids = set()
+    for m in members:
+        if m.room_id not in seen_room_ids:
+            ensure_default_roles(m.room_id)
+            seen_room_ids.add(m.room_id)
+        ensure_user_default_roles(m.user_id, m.room_id)
+    db.session.commit()
+
+
+def _reset_roles(db):
+    from sqlalchemy import text
+
+    db.session.execute(text('DELETE FROM member_role'))
+    db.session.execute(text('DELETE FROM role'))
+    db.session.commit()
+    db.session.expunge_all()
+
+
+def _counts(db):
+    from sqlalchemy import text
+
+    roles = db.session.execute(text('SELECT COUNT(*) FROM role')).scalar()
+    links = db.session.execute(text('SELECT COUNT(*) FROM member_role')).scalar()
+    return int(roles or 0), int(links or 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark startup role seeding.')
+    parser.add_argument('--memberships', type=int, default=20000)
+    parser.add_argument('--rooms', type=int, default=100)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    app, db_path = create_bench_app()
+    from app.extensions import db
+    from app.models import Room, Member
+    from app.functions import seed_roles_for_existing_rooms
+
+    rows = []
+    with app.app_context():
+        _reset_roles(db)
+        user_ids = seed_users(args.users, prefix='roleseed')
+        room_ids = []
+        for idx in range(args.rooms):
+            room = Room(name=f'bench-roles-{idx}', type='server', is_public=True, owner_id=user_ids[0])
+            db.session.add(room)
+            db.session.flush()
+            room_ids.append(room.id)
+        db.session.commit()
+
+        per_room = max(1, args.memberships // args.rooms)
+        batch = []
+        for ridx, room_id in enumerate(room_ids):
+            for n in range(min(per_room, len(user_ids))):
+                uid = user_ids[(ridx * 7 + n) % len(user_ids)]
+                batch.append({'user_id': uid, 'room_id': room_id, 'role': 'owner' if n == 0 else 'member'})
+            if len(batch) >= 50000:
+                db.session.execute(Member.__table__.insert(), batch)
+                batch = []
+        if batch:
+            db.session.execute(Member.__table__.insert(), batch)
+        db.session.commit()
+        memberships = db.session.query(db.func.count(Member.id)).scalar()
+
+        if not args.skip_legacy:
+            started = time.perf_counter()
+            _legacy_seed(Member)
+            elapsed = time.perf_counter() - started
+            rows.append(('per-member (legacy)', *_counts(db), f'{elapsed:.2f}'))
+            _reset_roles(db)
+
+        started = time.perf_counter()
+        seed_roles_for_existing_rooms()
+        elapsed = time.perf_counter() - started
+        rows.append(('set-based', *_counts(db), f'{elapsed:.2f}'))
+
+        started = time.perf_counter()
+        seed_roles_for_existing_rooms()
+        elapsed = time.perf_counter() - started
+        rows.append(('set-based, already seeded', *_counts(db), f'{elapsed:.2f}'))
+
+    print(f'[BENCH] database: {db_path}')
+    print(f'[BENCH] {memberships} memberships in {args.rooms} rooms')
+    print_table(['seeding', 'roles', 'member-role links', 'seconds'], rows)
+
+
+if __name__ == '__main__':
+    main()
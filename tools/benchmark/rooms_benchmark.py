@@ -0,0 +1,140 @@
+"""Regression check for the room list (GET /api/v1/rooms, /api/v1/bootstrap).
+
+Seeds a user who is in a few large servers and some DMs, then measures
+app/functions/room_list.serialize_user_rooms: SQL statements
+(app/utils/sql_metrics.count_queries), peak Python memory (tracemalloc) and wall
+time. For comparison it also runs the old loading strategy, which pulled
+every member of every room with subqueryload(Room.members).
+
+The statement count must not depend on room sizes; the script exits with
+status 1 when the current implementation exceeds --max-statements or
+--max-peak-mb, or when GET /api/v1/rooms runs more than
+--max-endpoint-statements queries (assert_max_queries), so it can run in CI.
+
+Usage:
+  python tools/benchmark/rooms_benchmark.py
+  python tools/benchmark/rooms_benchmark.py --servers 3 --members 50000 --dms 50
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+
+from common import create_bench_app, seed_users, print_table
+
+
+def _seed(db, Room, Channel, Member, user_id, other_ids, servers, dms):
+    for idx in range(servers):
+        room = Room(name=f'bench-rooms-{idx}', type='server', is_public=True, owner_id=user_id)
+        db.session.add(room)
+        db.session.flush()
+        db.session.add(Channel(name='general', room_id=room.id))
+        db.session.execute(Member.__table__.insert(), [
+            {'user_id': uid, 'room_id': room.id, 'role': 'owner' if uid == user_id else 'member'}
+            for uid in [user_id] + other_ids
+        ])
+    for idx in range(dms):
+        room = Room(name=f'dm-{idx}', type='dm', is_public=False, owner_id=user_id)
+        db.session.add(room)
+        db.session.flush()
+        db.session.add(Channel(name='general', room_id=room.id))
+        db.session.execute(Member.__table__.insert(), [
+            {'user_id': user_id, 'room_id': room.id, 'role': 'member'},
+            {'user_id': other_ids[idx % len(other_ids)], 'room_id': room.id, 'role': 'member'},
+        ])
+    db.session.commit()
+
+
+def _legacy_load(Room, Member, user_id):
+    from sqlalchemy.orm import subqueryload
+
+    rooms = (
+        Room.query.join(Member)
+        .filter(Member.user_id == user_id)
+        .options(
+            subqueryload(Room.channels),
+            subqueryload(Room.members).joinedload(Member.user),
+        )
+        .all()
+    )
+    return [len(r.members or []) for r in rooms]
+
+
+def _measure(db, fn, repeat):
+    from app.utils.sql_metrics import count_queries
+
+    timings = []
+    peak = 0
+    statements = 0
+    for _ in range(repeat):
+        db.session.expunge_all()
+        with count_queries() as log:
+            tracemalloc.start()
+            started = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - started) * 1000)
+            peak = max(peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        statements = log.count
+    return statements, peak / (1024 * 1024), sum(timings) / len(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Room list query/memory regression check.')
+    parser.add_argument('--servers', type=int, default=3)
+    parser.add_argument('--members', type=int, default=20000, help='members per server')
+    parser.add_argument('--dms', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-statements', type=int, default=8)
+    parser.add_argument('--max-endpoint-statements', type=int, default=10, help='GET /api/v1/rooms incl. session user load')
+    parser.add_argument('--max-peak-mb', type=float, default=5.0)
+    parser.add_argument('--skip-legacy', action='store_true')
+    args = parser.parse_args()
+
+    app, db_path = create_bench_app()
+    from app.extensions import db
+    from app.models import Room, Channel, Member
+    from app.functions import serialize_user_rooms
+    from app.utils.sql_metrics import assert_max_queries
+
+    with app.app_context():
+        user_ids = seed_users(args.members, prefix='rooms')
+        _seed(db, Room, Channel, Member, user_ids[0], user_ids[1:], args.servers, args.dms)
+
+        rows = []
+        current = _measure(db, lambda: serialize_user_rooms(user_ids[0]), args.repeat)
+        rows.append(('serialize_user_rooms', current[0], f'{current[1]:.2f}', f'{current[2]:.1f}'))
+        if not args.skip_legacy:
+            legacy = _measure(db, lambda: _legacy_load(Room, Member, user_ids[0]), args.repeat)
+            rows.append(('legacy subqueryload(members)', legacy[0], f'{legacy[1]:.2f}', f'{legacy[2]:.1f}'))
+        engine = db.engine
+
+    failures = []
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_ids[0])
+        sess['_fresh'] = True
+    try:
+        with assert_max_queries(args.max_endpoint_statements, engine=engine) as log:
+            client.get('/api/v1/rooms')
+        rows.append(('GET /api/v1/rooms', log.count, '-', '-'))
+    except AssertionError as exc:
+        failures.append(f'GET /api/v1/rooms: {exc}')
+
+    print(f'[BENCH] database: {db_path}')
+    print(f'[BENCH] {args.servers} servers x {args.members} members, {args.dms} DMs')
+    print_table(['loader', 'SQL statements', 'peak MB', 'mean ms'], rows)
+
+    if current[0] > args.max_statements:
+        failures.append(f'{current[0]} statements > {args.max_statements}')
+    if current[1] > args.max_peak_mb:
+        failures.append(f'peak {current[1]:.2f} MB > {args.max_peak_mb} MB')
+    if failures:
+        print('[BENCH] FAIL: ' + '; '.join(failures))
+        sys.exit(1)
+    print('[BENCH] OK: within budget')
+
+
+if __name__ == '__main__':
+    main()
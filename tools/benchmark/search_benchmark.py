@@ -0,0 +1,131 @@
+"""Benchmark full-text message search (SQLite FTS5).
+
+Bulk-inserts messages built from a Zipf-like vocabulary into a few rooms, lets
+the FTS5 triggers index them, then times app/functions/search.search_messages
+for common, medium and rare terms, multi-word and prefix queries, in both
+`relevance` (BM25) and `recent` order, including the second (cursor) page.
+
+The target is p95 < 50 ms on 10M messages; the default size keeps the run
+short, pass --messages 10000000 for the full-scale run (needs a few GB of disk).
+
+Usage:
+  python tools/benchmark/search_benchmark.py
+  python tools/benchmark/search_benchmark.py --messages 1000000 --repeat 50
+"""
+
+import argparse
+import itertools
+import random
+import statistics
+import time
+
+from common import create_bench_app, seed_users, print_table
+
+
+def _vocabulary(size):
+    return [f'w{idx:05d}' for idx in range(size)]
+
+
+def _insert_messages(db, Message, channel_ids, user_ids, total, vocab, batch=20000):
+    rng = random.Random(42)
+    # Zipf-like weights: a few very common words, a long tail of rare ones.
+    cum_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(len(vocab))))
+    inserted = 0
+    while inserted < total:
+        count = min(batch, total - inserted)
+        rows = []
+        for _ in range(count):
+            words = rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(4, 14))
+            rows.append({
+                'content': ' '.join(words),
+                'user_id': rng.choice(user_ids),
+                'channel_id': rng.choice(channel_ids),
+                'message_type': 'text',
+            })
+        db.session.execute(Message.__table__.insert(), rows)
+        db.session.commit()
+        inserted += count
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[idx]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark FTS5 message search.')
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--vocab', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    app, db_path = create_bench_app()
+    from app.extensions import db
+    from app.models import Room, Channel, Member, Message
+    from app.functions.search import fts_available, parse_search_cursor, search_messages
+
+    vocab = _vocabulary(args.vocab)
+    with app.app_context():
+        if not fts_available():
+            print('[BENCH] SQLite was built without FTS5; nothing to measure.')
+            return
+        user_ids = seed_users(50, prefix='search')
+        channel_ids = []
+        for idx in range(args.rooms):
+            room = Room(name=f'bench-search-{idx}', type='server', is_public=True, owner_id=user_ids[0])
+            db.session.add(room)
+            db.session.flush()
+            channel = Channel(name='general', room_id=room.id)
+            db.session.add(channel)
+            db.session.flush()
+            channel_ids.append(channel.id)
+            # The searching user is in half of the rooms.
+            if idx % 2 == 0:
+                db.session.add(Member(user_id=user_ids[0], room_id=room.id, role='member'))
+        db.session.commit()
+
+        started = time.perf_counter()
+        _insert_messages(db, Message, channel_ids, user_ids, args.messages, vocab)
+        insert_seconds = time.perf_counter() - started
+
+        queries = [
+            ('common term', vocab[0]),
+            ('medium term', vocab[len(vocab) // 50]),
+            ('rare term', vocab[-1]),
+            ('two terms', f'{vocab[1]} {vocab[len(vocab) // 100]}'),
+            ('prefix', vocab[len(vocab) // 10][:5] + '*'),
+        ]
+        rows = []
+        for label, query in queries:
+            for sort in ('relevance', 'recent'):
+                first, second = [], []
+                for _ in range(args.repeat):
+                    t0 = time.perf_counter()
+                    items, cursor, used_sort = search_messages(user_ids[0], query, sort=sort, limit=args.limit)
+                    first.append((time.perf_counter() - t0) * 1000)
+                    if cursor:
+                        t0 = time.perf_counter()
+                        search_messages(
+                            user_ids[0], query, sort=sort, limit=args.limit,
+                            cursor=parse_search_cursor(cursor),
+                        )
+                        second.append((time.perf_counter() - t0) * 1000)
+                rows.append((
+                    label,
+                    sort if used_sort == sort else f'{sort} -> {used_sort}',
+                    len(items),
+                    f'{statistics.median(first):.1f}',
+                    f'{_percentile(first, 95):.1f}',
+                    f'{_percentile(second, 95):.1f}' if second else '-',
+                ))
+
+    print(f'[BENCH] database: {db_path}')
+    print(f'[BENCH] inserted {args.messages} messages (with FTS triggers) in {insert_seconds:.1f}s')
+    print_table(['query', 'sort', 'results', 'p50 ms', 'p95 ms', 'p95 page 2 ms'], rows)
+
+
+if __name__ == '__main__':
+    main()
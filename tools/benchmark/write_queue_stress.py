@@ -0,0 +1,168 @@
+"""Stress test for SQLite writes: direct sessions vs the single-writer queue.
+
+Runs the same mixed write load twice, each time against a fresh database:
+once with every caller writing through its own session (the default) and once
+with BOXCHAT_WRITE_QUEUE=1 (app/utils/write_queue.py: one writer thread, WAL).
+The load comes from both kinds of callers the server has:
+  - green threads on the main thread, like Socket.IO handlers / Flask routes,
+  - OS threads, like FastAPI's asyncio.to_thread workers.
+Each caller alternates between sending a message (message_writer.write_message)
+and marking the channel read (a read-then-write unit), paced so that all
+callers together aim at --rate writes per second.
+
+Reports achieved writes/s, caller latency, "database is locked" errors and the
+queue's depth / wait metrics. Exits with status 1 when the queued run has any
+lock error or misses --min-rate-ratio of the target rate.
+
+Usage:
+  python tools/benchmark/write_queue_stress.py
+  python tools/benchmark/write_queue_stress.py --rate 1000 --seconds 10 --greenlets 32 --threads 16
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+from common import create_bench_app, seed_users, print_table
+
+
+def _setup(app):
+    from app.extensions import db
+    from app.models import Room, Channel
+
+    with app.app_context():
+        user_ids = seed_users(64, prefix='writequeue')
+        room = Room(name='bench-write-queue', type='server', is_public=True, owner_id=user_ids[0])
+        db.session.add(room)
+        db.session.flush()
+        channel_ids = []
+        for idx in range(4):
+            channel = Channel(name=f'channel-{idx}', room_id=room.id)
+            db.session.add(channel)
+            db.session.flush()
+            channel_ids.append(channel.id)
+        db.session.commit()
+    return user_ids, channel_ids
+
+
+def _run_load(app, user_ids, channel_ids, greenlets, threads, rate, seconds):
+    from app.extensions import db, socketio
+    from app.routes.api import _mark_channel_read
+    from app.sockets.message_writer import write_message
+    from app.utils.write_queue import run_write
+
+    workers = greenlets + threads
+    interval = workers / float(rate)
+    deadline = time.monotonic() + seconds
+    latencies = []
+    counters = {'writes': 0, 'lock_errors': 0, 'other_errors': 0}
+    lock = threading.Lock()
+    finished = []
+
+    def _worker(idx, sleep):
+        user_id = user_ids[idx % len(user_ids)]
+        channel_id = channel_ids[idx % len(channel_ids)]
+        next_at = time.monotonic()
+        n = 0
+        with app.app_context():
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                try:
+                    if n % 2 == 0:
+                        write_message(app, content=f'stress {idx} {n}', user_id=user_id,
+                                      channel_id=channel_id, message_type='text')
+                    else:
+                        run_write(_mark_channel_read, user_id, channel_id)
+                    outcome = 'writes'
+                except Exception as exc:
+                    db.session.rollback()
+                    outcome = 'lock_errors' if 'database is locked' in str(exc).lower() else 'other_errors'
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                with lock:
+                    counters[outcome] += 1
+                    latencies.append(elapsed_ms)
+                n += 1
+                next_at += interval
+                sleep(max(0.0, next_at - time.monotonic()))
+            db.session.remove()
+        with lock:
+            finished.append(idx)
+
+    started = time.perf_counter()
+    for idx in range(threads):
+        threading.Thread(target=_worker, args=(idx, time.sleep), daemon=True).start()
+    for idx in range(threads, workers):
+        socketio.start_background_task(_worker, idx, socketio.sleep)
+    while len(finished) < workers:
+        socketio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def _pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+    return counters, elapsed, _pct(0.5), _pct(0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite write stress: direct sessions vs write queue.')
+    parser.add_argument('--rate', type=int, default=500, help='target writes per second (all callers)')
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--greenlets', type=int, default=16)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--min-rate-ratio', type=float, default=0.9)
+    parser.add_argument('--skip-direct', action='store_true')
+    args = parser.parse_args()
+
+    rows = []
+    queue_stats = None
+    failures = []
+    modes = (['direct'] if not args.skip_direct else []) + ['write queue']
+    for mode in modes:
+        if mode == 'write queue':
+            os.environ['BOXCHAT_WRITE_QUEUE'] = '1'
+        else:
+            os.environ.pop('BOXCHAT_WRITE_QUEUE', None)
+        app, db_path = create_bench_app()
+        user_ids, channel_ids = _setup(app)
+        counters, elapsed, p50, p99 = _run_load(
+            app, user_ids, channel_ids, args.greenlets, args.threads, args.rate, args.seconds,
+        )
+        achieved = counters['writes'] / elapsed if elapsed else 0.0
+        rows.append((
+            mode,
+            counters['writes'],
+            f'{achieved:.0f}',
+            f'{p50:.1f}',
+            f'{p99:.1f}',
+            counters['lock_errors'],
+            counters['other_errors'],
+        ))
+        if mode == 'write queue':
+            from app.utils.write_queue import get_write_queue
+            queue_stats = get_write_queue(app).stats()
+            if counters['lock_errors']:
+                failures.append(f"{counters['lock_errors']} lock errors with the write queue")
+            if achieved < args.rate * args.min_rate_ratio:
+                failures.append(f'{achieved:.0f} writes/s < {args.min_rate_ratio:.0%} of {args.rate}')
+        print(f'[BENCH] {mode}: database {db_path}')
+
+    print(f'[BENCH] target {args.rate} writes/s for {args.seconds:.0f} s, '
+          f'{args.greenlets} green threads + {args.threads} OS threads')
+    print_table(['mode', 'writes', 'writes/s', 'p50 ms', 'p99 ms', 'lock errors', 'other errors'], rows)
+    if queue_stats:
+        print('[BENCH] queue: ' + ', '.join(
+            f'{key}={queue_stats[key]}' for key in
+            ('submitted', 'completed', 'failed', 'batches', 'batch_avg', 'max_depth', 'wait_ms_p50', 'wait_ms_p95', 'wait_ms_max', 'run_ms_avg')
+        ))
+    if failures:
+        print('[BENCH] FAIL: ' + '; '.join(failures))
+        sys.exit(1)
+    print('[BENCH] OK: no lock errors through the write queue')
+
+
+if __name__ == '__main__':
+    main()
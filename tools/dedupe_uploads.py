@@ -0,0 +1,225 @@
+"""Move an existing uploads/ tree into the content-addressed store.
+
+Files saved before content-addressed storage (<subdir>/<uuid>_<name>) are
+hashed (SHA-256, read in blocks) and stored once per identical content as
+<subdir>/<sha[:2]>/<sha256><ext> (see app/functions/blobs.py). Every URL column
+that pointed at an old file (messages, music, avatars, room banners, channel
+icons, stickers) is rewritten to /uploads/<subdir>/<sha256>/<name> and the
+attachment access index is rebuilt, then the old files are removed. Afterwards the reference count of every blob is
+recounted from those columns; with --sweep blobs nothing points at any more
+(older than --min-age-hours, so uploads not yet sent are kept) are deleted
+together with their image variants. Variants of converted images are made
+on first request by the server.
+
+Run it while the server is stopped and keep a backup of the database and the
+upload folder. Safe to run again: already converted files are skipped.
+
+Usage:
+  python tools/dedupe_uploads.py --dry-run
+  python tools/dedupe_uploads.py --db ./instance/thecomboxmsgr.db --uploads ./uploads --sweep
+"""
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import config as app_config
+from app import create_app
+
+LEGACY_NAME_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_(?P<name>.+)$')
+# <sha256><ext>; image variants (<sha256>.w320.webp, see app/functions/image_variants.py) are not blobs
+BLOB_NAME_RE = re.compile(r'^(?P<sha>[0-9a-f]{64})(?P<ext>\.[^./]+)?$')
+
+
+def _sqlite_uri_from_path(db_path: str) -> str:
+    abs_db = os.path.abspath(db_path).replace('\\', '/')
+    if len(abs_db) > 2 and abs_db[1] == ':':
+        return f"sqlite:///{abs_db}"
+    return f"sqlite:////{abs_db.lstrip('/')}"
+
+
+def _build_app(db_path, upload_folder):
+    values = {k: getattr(app_config, k) for k in dir(app_config) if k.isupper()}
+    if db_path:
+        values['SQLALCHEMY_DATABASE_URI'] = _sqlite_uri_from_path(db_path)
+    if upload_folder:
+        values['UPLOAD_FOLDER'] = os.path.abspath(upload_folder)
+    return create_app(config=SimpleNamespace(**values), init_db=True)
+
+
+def _legacy_files(upload_folder, subdirs):
+    # (subdir, file name) of every file stored directly under a subdir
+    for subdir in sorted(subdirs):
+        base = os.path.join(upload_folder, subdir)
+        if not os.path.isdir(base):
+            continue
+        for entry in sorted(os.scandir(base), key=lambda e: e.name):
+            if entry.is_file():
+                yield subdir, entry.name
+
+
+def _place_blob(src, target):
+    # Make the blob exist without touching the source yet (hard link, copy as fallback)
+    if os.path.exists(target):
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp = target + '.tmp'
+    try:
+        os.link(src, tmp)
+    except OSError:
+        shutil.copyfile(src, tmp)
+    os.replace(tmp, target)
+    return True
+
+
+def dedupe(upload_folder, subdirs, dry_run=False):
+    from app.extensions import db
+    from app.functions.attachments import rebuild_attachment_index
+    from app.functions.blobs import REFERENCE_COLUMNS, blob_path, blob_url, hash_file
+
+    stats = {'files': 0, 'duplicates': 0, 'bytes_before': 0, 'bytes_after': 0, 'rows_rewritten': 0}
+    seen = set()
+    moves = []
+    for subdir, name in _legacy_files(upload_folder, subdirs):
+        src = os.path.join(upload_folder, subdir, name)
+        sha, size = hash_file(src)
+        match = LEGACY_NAME_RE.match(name)
+        display_name = match.group('name') if match else name
+        path = blob_path(subdir, sha, display_name)
+        stats['files'] += 1
+        stats['bytes_before'] += size
+        target = os.path.join(upload_folder, path)
+        if path in seen or os.path.exists(target):
+            stats['duplicates'] += 1
+        else:
+            stats['bytes_after'] += size
+        seen.add(path)
+        moves.append((src, target, f"/uploads/{subdir}/{name}", blob_url(subdir, sha, display_name)))
+
+    if dry_run:
+        for _src, _target, old_url, _new_url in moves:
+            for column in REFERENCE_COLUMNS:
+                stats['rows_rewritten'] += db.session.query(column.class_).filter(column == old_url).count()
+        return stats
+
+    for src, target, _old_url, _new_url in moves:
+        _place_blob(src, target)
+    for _src, _target, old_url, new_url in moves:
+        for column in REFERENCE_COLUMNS:
+            stats['rows_rewritten'] += db.session.query(column.class_).filter(column == old_url).update(
+                {column: new_url}, synchronize_session=False
+            )
+    if moves:
+        # The access index is keyed by URL: rebuild it from the rewritten columns.
+        rebuild_attachment_index()
+    db.session.commit()
+    for src, _target, _old_url, _new_url in moves:
+        os.remove(src)
+    return stats
+
+
+def recount(upload_folder, subdirs, sweep=False, min_age_hours=24.0, dry_run=False):
+    # Rebuild upload_blob from the blob files on disk and the URL columns
+    from app.extensions import db
+    from app.models import UploadBlob
+    from app.functions.blobs import blob_url, count_url_references, hash_file
+    from app.functions.image_variants import remove_image_variants
+
+    stats = {'blobs': 0, 'referenced': 0, 'unreferenced': 0, 'swept': 0, 'bytes_swept': 0}
+    rows = {blob.path: blob for blob in UploadBlob.query.all()}
+    cutoff = time.time() - min_age_hours * 3600
+    on_disk = set()
+    for subdir in sorted(subdirs):
+        base = os.path.join(upload_folder, subdir)
+        if not os.path.isdir(base):
+            continue
+        for prefix in sorted(os.listdir(base)):
+            prefix_dir = os.path.join(base, prefix)
+            if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            for name in sorted(os.listdir(prefix_dir)):
+                match = BLOB_NAME_RE.match(name)
+                if not match:
+                    continue
+                full = os.path.join(prefix_dir, name)
+                path = f"{subdir}/{prefix}/{name}"
+                on_disk.add(path)
+                stats['blobs'] += 1
+                sha = match.group('sha')
+                refs = count_url_references(blob_url(subdir, sha, 'x' + (match.group('ext') or '')))
+                blob = rows.get(path)
+                if refs:
+                    stats['referenced'] += 1
+                else:
+                    stats['unreferenced'] += 1
+                    if sweep and os.path.getmtime(full) < cutoff:
+                        stats['swept'] += 1
+                        stats['bytes_swept'] += os.path.getsize(full)
+                        if not dry_run:
+                            os.remove(full)
+                            remove_image_variants(upload_folder, path)
+                            if blob is not None:
+                                db.session.delete(blob)
+                        continue
+                if dry_run:
+                    continue
+                if blob is None:
+                    _sha, size = hash_file(full)
+                    db.session.add(UploadBlob(
+                        path=path, sha256=sha, size=size, ref_count=refs,
+                        created_at=datetime.utcfromtimestamp(os.path.getmtime(full)),
+                    ))
+                else:
+                    blob.ref_count = refs
+    if not dry_run:
+        # Rows whose file is gone
+        for path, blob in rows.items():
+            if path not in on_disk:
+                db.session.delete(blob)
+        db.session.commit()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Deduplicate the uploads folder into content-addressed blobs.')
+    parser.add_argument('--db', help='Path to sqlite DB file (default: config.py)')
+    parser.add_argument('--uploads', help='Upload folder (default: UPLOAD_FOLDER from config.py)')
+    parser.add_argument('--dry-run', action='store_true', help='report what would change, change nothing')
+    parser.add_argument('--sweep', action='store_true', help='delete blobs nothing refers to')
+    parser.add_argument('--min-age-hours', type=float, default=24.0, help='only sweep blobs older than this')
+    args = parser.parse_args()
+
+    app = _build_app(args.db, args.uploads)
+    upload_folder = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    subdirs = set((getattr(app_config, 'UPLOAD_SUBDIRS', None) or {}).values()) or {
+        'avatars', 'room_avatars', 'channel_icons', 'files', 'music', 'videos'
+    }
+    print(f'[DEDUPE] upload folder: {upload_folder}' + (' (dry run)' if args.dry_run else ''))
+    with app.app_context():
+        started = time.perf_counter()
+        stats = dedupe(upload_folder, subdirs, dry_run=args.dry_run)
+        mib = 1024 * 1024
+        print(
+            f"[DEDUPE] {stats['files']} legacy files, {stats['duplicates']} duplicates, "
+            f"{stats['bytes_before'] / mib:.1f} MiB -> {stats['bytes_after'] / mib:.1f} MiB, "
+            f"{stats['rows_rewritten']} URL(s) rewritten"
+        )
+        counts = recount(upload_folder, subdirs, sweep=args.sweep, min_age_hours=args.min_age_hours, dry_run=args.dry_run)
+        print(
+            f"[DEDUPE] {counts['blobs']} blobs, {counts['referenced']} referenced, {counts['unreferenced']} unreferenced"
+            + (f", {counts['swept']} swept ({counts['bytes_swept'] / mib:.1f} MiB)" if args.sweep else '')
+        )
+        print(f'[DEDUPE] done in {time.perf_counter() - started:.1f} s')
+
+
+if __name__ == '__main__':
+    main()
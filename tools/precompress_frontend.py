@@ -0,0 +1,83 @@
+"""Write .gz (and .br) copies of the compressible files in frontend/dist.
+
+The server (app/routes/spa.py) sends <file>.br / <file>.gz to clients that
+accept them; without a .gz it compresses in memory at a lower level. Run this
+after `npm run build`. Brotli output needs the optional `brotli` package
+(pip install brotli); without it only gzip copies are written. Copies that
+are not smaller than the original are skipped.
+
+Usage:
+  python tools/precompress_frontend.py
+  python tools/precompress_frontend.py --dist ./frontend/dist --min-bytes 512
+"""
+
+import argparse
+import gzip
+import mimetypes
+import os
+import sys
+import time
+
+try:
+    import brotli
+except Exception:
+    brotli = None
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/wasm')
+
+
+def _write_if_smaller(target, data, original_size):
+    if len(data) >= original_size:
+        return 0
+    tmp = target + '.tmp'
+    with open(tmp, 'wb') as fh:
+        fh.write(data)
+    os.replace(tmp, target)
+    return len(data)
+
+
+def precompress(dist_dir, min_bytes=1024):
+    stats = {'files': 0, 'bytes': 0, 'gzip_bytes': 0, 'br_bytes': 0}
+    for base, _dirs, files in os.walk(dist_dir):
+        for name in sorted(files):
+            if name.endswith(('.gz', '.br', '.tmp')):
+                continue
+            mimetype = mimetypes.guess_type(name)[0] or ''
+            if not mimetype.startswith(COMPRESSIBLE_TYPES):
+                continue
+            path = os.path.join(base, name)
+            with open(path, 'rb') as fh:
+                body = fh.read()
+            if len(body) < min_bytes:
+                continue
+            stats['files'] += 1
+            stats['bytes'] += len(body)
+            stats['gzip_bytes'] += _write_if_smaller(path + '.gz', gzip.compress(body, compresslevel=9, mtime=0), len(body))
+            if brotli is not None:
+                stats['br_bytes'] += _write_if_smaller(path + '.br', brotli.compress(body, quality=11), len(body))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompress frontend/dist for the SPA asset server.')
+    parser.add_argument('--dist', default=os.path.join(ROOT_DIR, 'frontend', 'dist'))
+    parser.add_argument('--min-bytes', type=int, default=1024, help='skip smaller files')
+    args = parser.parse_args()
+
+    if not os.path.isfile(os.path.join(args.dist, 'index.html')):
+        print(f'[PRECOMPRESS] {args.dist} has no index.html; run npm run build first')
+        sys.exit(1)
+    started = time.perf_counter()
+    stats = precompress(args.dist, min_bytes=args.min_bytes)
+    kib = 1024
+    print(
+        f"[PRECOMPRESS] {stats['files']} files, {stats['bytes'] / kib:.1f} KiB -> "
+        f"gzip {stats['gzip_bytes'] / kib:.1f} KiB"
+        + (f", br {stats['br_bytes'] / kib:.1f} KiB" if brotli is not None else ' (brotli not installed)')
+        + f" in {time.perf_counter() - started:.1f} s"
+    )
+
+
+if __name__ == '__main__':
+    main()